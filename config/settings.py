@@ -44,6 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero: mide la latencia de toda la cadena (ver gestion_gmexpress/metricas.py)
+    'gestion_gmexpress.metricas.MetricasMiddleware',
+    # Deja la request a mano para atribuir consultas lentas (ver consultas_lentas.py)
+    'gestion_gmexpress.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -136,4 +140,101 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Caché
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con varios workers en producción conviene un backend compartido
+# (Redis / Memcached) para que las invalidaciones lleguen a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Segundos que se guardan los roles de un usuario entre requests (0 = solo por request)
+GMEXPRESS_ROLES_CACHE_TIMEOUT = 0
+
+# Segundos que se guardan los conteos de las pestañas del listado de pedidos
+GMEXPRESS_PESTANAS_CACHE_TIMEOUT = 300
+
+# Cada cuántos segundos un proceso revisa si cambiaron los catálogos de estados
+GMEXPRESS_CATALOGOS_VERIFICACION = 5
+
+# Optimizador de rutas: segundos máximos por viaje, (lat, lng) del centro
+# de distribución (None = la ruta parte en la parada que convenga) y
+# segundos que se guardan las matrices de distancias
+GMEXPRESS_RUTAS_TIEMPO_MAX = 0.5
+GMEXPRESS_RUTAS_DEPOSITO = None
+GMEXPRESS_RUTAS_CACHE_TIMEOUT = 86400
+
+# Despacho automático: estados de vehículo que pueden salir, hora de salida
+# y origen de los viajes que crea
+GMEXPRESS_DESPACHO_ESTADOS_VEHICULO = ['OPERATIVO', 'DISPONIBLE']
+GMEXPRESS_DESPACHO_HORA_SALIDA = '08:00'
+GMEXPRESS_DESPACHO_ORIGEN = 'Centro de distribución'
+
+# Hojas de ruta DOCX: carpeta de la caché en disco, procesos que las generan
+# y segundos que una request espera antes de responder 503 (se siguen armando)
+GMEXPRESS_HOJAS_RUTA_DIR = BASE_DIR / 'cache' / 'hojas_ruta'
+GMEXPRESS_HOJAS_RUTA_PROCESOS = 2
+GMEXPRESS_HOJAS_RUTA_ESPERA = 10
+
+# Importación masiva de pedidos: máximo de filas por archivo
+GMEXPRESS_IMPORTACION_MAX_FILAS = 20000
+
+# Sincronización en lote de entregas: máximo de actualizaciones por envío
+GMEXPRESS_SINCRONIZACION_MAX_ITEMS = 500
+
+# GET condicional de los listados: cambiarla invalida los ETag ya emitidos
+# (p. ej. al desplegar plantillas nuevas)
+GMEXPRESS_CONDICIONAL_SEMILLA = ''
+
+# Estados en vivo (SSE, requiere servidor ASGI): broker de eventos
+# (BrokerMemoria para un solo worker, BrokerBaseDatos para varios),
+# segundos entre lecturas del broker en base de datos, segundos que se guardan
+# los eventos (para Last-Event-ID), latido y duración máxima de cada conexión
+GMEXPRESS_EVENTOS_BROKER = 'gestion_gmexpress.eventos.BrokerMemoria'
+GMEXPRESS_EVENTOS_INTERVALO = 1
+GMEXPRESS_EVENTOS_RETENCION = 3600
+GMEXPRESS_EVENTOS_LATIDO = 20
+GMEXPRESS_EVENTOS_DURACION_MAX = 1800
+
+# Notificaciones al cliente (ver notificaciones.py): canales activos
+# (SISTEMA, EMAIL, SMS), backend de envío por canal, archivo del
+# BackendArchivo, intentos antes de darlas por fallidas y espera entre
+# reintentos (segundos, se duplica en cada intento hasta el máximo)
+GMEXPRESS_NOTIFICACIONES_CANALES = ['SISTEMA', 'EMAIL']
+GMEXPRESS_NOTIFICACIONES_BACKENDS = {
+    'EMAIL': 'gestion_gmexpress.notificaciones.BackendEmail',
+    'SMS': 'gestion_gmexpress.notificaciones.BackendConsola',
+}
+GMEXPRESS_NOTIFICACIONES_ARCHIVO = BASE_DIR / 'cache' / 'notificaciones.jsonl'
+GMEXPRESS_NOTIFICACIONES_REINTENTOS = 8
+GMEXPRESS_NOTIFICACIONES_ESPERA_BASE = 30
+GMEXPRESS_NOTIFICACIONES_ESPERA_MAX = 3600
+
+# Métricas por vista (ver metricas.py): fracción de requests medidas, fracción
+# de esas que además miden SQL, segundos entre volcados de cada worker,
+# carpeta compartida por los workers (por defecto /dev/shm/gmexpress-metricas).
+# /metricas/ sin sesión de staff: con "Authorization: Bearer <token>" o desde
+# las IPs de la lista. Ojo: detrás de nginx todas las requests llegan con
+# REMOTE_ADDR=127.0.0.1, así que agregar 127.0.0.1 las abre a todo internet;
+# usar IPs solo si el scraper llega directo al servidor de aplicación.
+GMEXPRESS_METRICAS_MUESTREO = 1.0
+GMEXPRESS_METRICAS_MUESTREO_SQL = 0.1
+GMEXPRESS_METRICAS_INTERVALO = 5
+GMEXPRESS_METRICAS_TOKEN = ''
+GMEXPRESS_METRICAS_IPS = []
+
+# Consultas lentas (ver consultas_lentas.py): umbral en ms (None desactiva),
+# registro rotado por tamaño, si se guardan los parámetros (False si no deben
+# quedar datos personales en disco) y cada cuántos segundos se repite el
+# EXPLAIN de una misma huella. Resumen: manage.py reporte_consultas_lentas
+GMEXPRESS_CONSULTAS_LENTAS_MS = 200
+GMEXPRESS_CONSULTAS_LENTAS_ARCHIVO = BASE_DIR / 'cache' / 'consultas_lentas.jsonl'
+GMEXPRESS_CONSULTAS_LENTAS_MAX_BYTES = 10_000_000
+GMEXPRESS_CONSULTAS_LENTAS_RESPALDOS = 5
+GMEXPRESS_CONSULTAS_LENTAS_PARAMETROS = True
+GMEXPRESS_CONSULTAS_LENTAS_EXPLAIN_CADA = 300
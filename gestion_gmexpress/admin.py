@@ -1,11 +1,13 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import (
     Rol, PerfilUsuario, UsuarioRol, AuditoriaRol,
     EstadoVehiculo, EstadoViaje, EstadoPedido, EstadoEntrega, TipoRuta, TipoServicio,
     Conductor, Vehiculo, Cliente,
-    Viaje, Pedido, HistorialEstadoPedido, Parada,
-    Notificacion, ReporteViaje,
+    Viaje, Pedido, HistorialEstadoPedido, Parada, SincronizacionEntrega,
+    Notificacion, EnvioNotificacion, ReporteViaje,
 )
+from .reportes import generar_reportes
 
 
 # ------------------------
@@ -23,6 +25,8 @@ class PerfilUsuarioAdmin(admin.ModelAdmin):
     list_display = ('user', 'activo', 'telefono')
     list_filter = ('activo', 'roles')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'telefono')
+    # Lo mantiene bandeja.py con deltas atómicos
+    readonly_fields = ('notificaciones_no_leidas',)
     inlines = [UsuarioRolInline]
 
 
@@ -137,6 +141,14 @@ class ParadaAdmin(admin.ModelAdmin):
     search_fields = ('viaje__nombre_ruta', 'pedido__numero_pedido')
 
 
+@admin.register(SincronizacionEntrega)
+class SincronizacionEntregaAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'conductor', 'parada', 'resultado', 'fecha_cliente', 'fecha_recepcion')
+    list_filter = ('resultado',)
+    search_fields = ('clave',)
+    raw_id_fields = ('parada',)
+
+
 # ------------------------
 # Notificaciones y reportes
 # ------------------------
@@ -148,7 +160,39 @@ class NotificacionAdmin(admin.ModelAdmin):
     search_fields = ('titulo', 'mensaje')
 
 
+@admin.register(EnvioNotificacion)
+class EnvioNotificacionAdmin(admin.ModelAdmin):
+    # Bandeja de salida que vacía enviar_notificaciones (ver notificaciones.py)
+    list_display = ('canal', 'destino', 'titulo', 'estado', 'intentos', 'proximo_intento', 'fecha_envio')
+    list_filter = ('estado', 'canal')
+    search_fields = ('destino', 'titulo')
+    raw_id_fields = ('usuario', 'pedido', 'viaje')
+    actions = ['reintentar']
+
+    @admin.action(description="Reintentar los envíos seleccionados")
+    def reintentar(self, request, queryset):
+        total = queryset.exclude(estado=EnvioNotificacion.Estado.ENVIADO).update(
+            estado=EnvioNotificacion.Estado.PENDIENTE,
+            intentos=0,
+            proximo_intento=timezone.now(),
+        )
+        self.message_user(request, f"{total} envíos vuelven a la bandeja de salida.")
+
+
 @admin.register(ReporteViaje)
 class ReporteViajeAdmin(admin.ModelAdmin):
-    list_display = ('fecha', 'total_viajes', 'viajes_completados', 'entregas_exitosas', 'entregas_fallidas')
-    list_filter = ('fecha',)
+    # Filas precalculadas por generar_reportes (ver reportes.py)
+    list_display = (
+        'fecha', 'total_viajes', 'viajes_completados', 'viajes_en_curso',
+        'total_entregas', 'entregas_exitosas', 'entregas_fallidas', 'fecha_generacion',
+    )
+    date_hierarchy = 'fecha'
+    ordering = ('-fecha',)
+    readonly_fields = ('fecha_generacion',)
+    actions = ['regenerar']
+
+    @admin.action(description="Regenerar los reportes seleccionados")
+    def regenerar(self, request, queryset):
+        fechas = sorted(queryset.values_list('fecha', flat=True))
+        dias = sum(generar_reportes(fecha) for fecha in fechas)
+        self.message_user(request, f"{dias} reportes regenerados.")
@@ -0,0 +1,155 @@
+# gestion_gmexpress/asignacion.py
+
+"""
+Asignación de pedidos a viajes.
+
+``asignar_pedidos`` asigna muchos pedidos a uno o varios viajes en una
+sola transacción y con un número fijo de consultas: secuencias
+contiguas por viaje, ``bulk_create`` de las paradas, ``bulk_update`` de
+los pedidos, historial en bulk y un único ajuste del total de cajas por
+viaje. Como las operaciones en bulk no disparan señales, aquí se aplican
+a mano los mismos efectos (contadores del dashboard, total de cajas,
+marcas de versión, eventos en vivo).
+"""
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import cajas, condicional, contadores, eventos
+from .catalogos import estados_pedido, estados_entrega
+from .models import Viaje, Pedido, Parada, HistorialEstadoPedido, EstadoPedido
+
+TAMANO_LOTE = 500
+
+
+def asignar_pedidos(asignaciones, perfil=None, comentario=None):
+    """
+    ``asignaciones``: lista de (viaje, [pedido_id, ...]). Los pedidos se
+    agregan al final de la ruta de cada viaje, en el orden indicado; los
+    que ya tienen parada en ese viaje se omiten.
+
+    Devuelve {viaje_id: [pedidos asignados]}.
+    """
+    por_viaje = {}
+    for viaje, pedido_ids in asignaciones:
+        ids = por_viaje.setdefault(viaje.pk, [])
+        ids.extend(int(pk) for pk in pedido_ids)
+    por_viaje = {
+        viaje_id: list(dict.fromkeys(ids))
+        for viaje_id, ids in por_viaje.items() if ids
+    }
+    if not por_viaje:
+        return {}
+
+    try:
+        estado_asignado = estados_pedido.por_nombre('ASIGNADO')
+    except EstadoPedido.DoesNotExist:
+        # Si aún no existe el estado ASIGNADO, dejamos el actual
+        estado_asignado = None
+    estado_entrega = estados_entrega.por_nombre('PENDIENTE')
+
+    todos_ids = [pk for ids in por_viaje.values() for pk in ids]
+
+    with transaction.atomic():
+        # Bloquear los viajes serializa las asignaciones concurrentes a la
+        # misma ruta, así las secuencias no chocan.
+        viajes = Viaje.objects.select_for_update().in_bulk(list(por_viaje))
+        pedidos_por_id = Pedido.objects.select_for_update().in_bulk(todos_ids)
+
+        existentes = set(
+            Parada.objects
+            .filter(viaje_id__in=viajes, pedido_id__in=todos_ids)
+            .values_list('viaje_id', 'pedido_id')
+        )
+        ultimas = dict(
+            Parada.objects
+            .filter(viaje_id__in=viajes)
+            .order_by()
+            .values_list('viaje_id')
+            .annotate(Max('secuencia'))
+        )
+
+        ahora = timezone.now()
+        resultado = {}
+        paradas = []
+        vistos = set()
+        for viaje_id, ids in por_viaje.items():
+            viaje = viajes.get(viaje_id)
+            if viaje is None:
+                continue
+            asignados = [
+                pedidos_por_id[pk] for pk in ids
+                if pk in pedidos_por_id
+                and pk not in vistos
+                and (viaje_id, pk) not in existentes
+            ]
+            if not asignados:
+                continue
+            vistos.update(p.pk for p in asignados)
+            ultima = ultimas.get(viaje_id) or 0
+            paradas += [
+                Parada(
+                    viaje=viaje,
+                    pedido=pedido,
+                    secuencia=ultima + i,
+                    estado_entrega=estado_entrega,
+                    atendido_por_id=viaje.conductor_id,
+                )
+                for i, pedido in enumerate(asignados, start=1)
+            ]
+            resultado[viaje_id] = asignados
+
+        if not paradas:
+            return {}
+
+        Parada.objects.bulk_create(paradas, batch_size=TAMANO_LOTE)
+
+        pedidos = [p for asignados in resultado.values() for p in asignados]
+        liberados = sum(1 for p in pedidos if p.viaje_id is None)
+        cambian_estado = [
+            p for p in pedidos
+            if estado_asignado is not None and p.estado_id != estado_asignado.pk
+        ]
+
+        for viaje_id, asignados in resultado.items():
+            for pedido in asignados:
+                pedido.viaje = viajes[viaje_id]
+                if estado_asignado is not None:
+                    pedido.estado = estado_asignado
+                pedido.fecha_actualizacion = ahora
+        Pedido.objects.bulk_update(
+            pedidos, ['viaje', 'estado', 'fecha_actualizacion'], batch_size=TAMANO_LOTE
+        )
+
+        HistorialEstadoPedido.objects.bulk_create([
+            HistorialEstadoPedido(
+                pedido=pedido,
+                estado=estado_asignado,
+                comentario=comentario or f"Asignado al viaje #{pedido.viaje_id}",
+                fecha_cambio=ahora,
+                cambiado_por=perfil,
+            )
+            for pedido in cambian_estado
+        ], batch_size=TAMANO_LOTE)
+
+        cajas.ajustar_cajas_viajes({
+            viaje_id: sum(p.cantidad_cajas for p in asignados)
+            for viaje_id, asignados in resultado.items()
+        })
+        contadores.incrementar(contadores.PEDIDOS_PENDIENTES, -liberados)
+        condicional.cambiar(Pedido, Parada)
+        eventos.publicar(*(eventos.evento_pedido(p) for p in cambian_estado))
+
+    return resultado
+
+
+def asignar_pedidos_a_viaje(viaje, pedido_ids, perfil=None, comentario=None):
+    """
+    Asigna los pedidos indicados (en ese orden) al final de la ruta del viaje.
+    Los pedidos que ya tienen parada en el viaje se omiten.
+
+    Devuelve la lista de pedidos asignados.
+    """
+    resultado = asignar_pedidos([(viaje, pedido_ids)], perfil=perfil, comentario=comentario)
+    return resultado.get(viaje.pk, [])
@@ -0,0 +1,91 @@
+# gestion_gmexpress/bandeja.py
+
+"""
+Bandeja de entrada de notificaciones del usuario.
+
+El ícono con las no leídas aparece en todas las páginas, así que no se
+cuenta con ``COUNT(*)``: ``PerfilUsuario.notificaciones_no_leidas`` se
+mantiene con deltas atómicos (``F() + n``) y base.html lo lee del perfil
+que la página ya cargó, sin consultas extra.
+
+- Las señales de Notificacion cubren los ``save()`` / ``delete()`` sueltos
+  (ver signals.py).
+- Los ``bulk_create`` de notificaciones.py llaman a ``sumar_creadas``.
+- Marcar como leídas es un solo UPDATE sobre el índice
+  (usuario, leida, fecha_envio); el contador baja en las filas que cambiaron
+  de verdad, así dos pestañas marcando a la vez no lo dejan negativo.
+
+Para reconstruir los contadores: ``python manage.py recalcular_contadores``.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Notificacion, PerfilUsuario
+
+
+def sumar_no_leidas(deltas):
+    """
+    Aplica {perfil_id: delta} al contador: un UPDATE por cada delta distinto.
+    """
+    por_delta = defaultdict(list)
+    for perfil_id, delta in deltas.items():
+        if delta:
+            por_delta[delta].append(perfil_id)
+    for delta, perfiles in por_delta.items():
+        PerfilUsuario.objects.filter(pk__in=perfiles).update(
+            notificaciones_no_leidas=Greatest(F('notificaciones_no_leidas') + delta, 0)
+        )
+
+
+def sumar_creadas(notificaciones):
+    """
+    Para las notificaciones creadas con ``bulk_create`` (sin señales).
+    """
+    sumar_no_leidas(Counter(n.usuario_id for n in notificaciones if not n.leida))
+
+
+def _marcar(perfil, queryset):
+    with transaction.atomic():
+        marcadas = queryset.filter(usuario=perfil, leida=False).update(leida=True)
+        sumar_no_leidas({perfil.pk: -marcadas})
+    # El perfil en memoria (el de request.user) queda al día para la respuesta
+    perfil.notificaciones_no_leidas = max(perfil.notificaciones_no_leidas - marcadas, 0)
+    return marcadas
+
+
+def marcar_leida(perfil, notificacion_id):
+    """
+    Marca una notificación de ``perfil``. Devuelve 1, o 0 si ya estaba
+    leída o no es suya.
+    """
+    return _marcar(perfil, Notificacion.objects.filter(pk=notificacion_id))
+
+
+def marcar_todas_leidas(perfil):
+    """
+    Marca todas las no leídas de ``perfil`` en un solo UPDATE. Devuelve
+    cuántas cambió.
+    """
+    return _marcar(perfil, Notificacion.objects.all())
+
+
+def recalcular_no_leidas():
+    """
+    Recalcula el contador de todos los perfiles en un solo UPDATE.
+    Devuelve la cantidad de perfiles.
+    """
+    no_leidas = (
+        Notificacion.objects
+        .filter(usuario=OuterRef('pk'), leida=False)
+        .order_by()
+        .values('usuario')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return PerfilUsuario.objects.update(
+        notificaciones_no_leidas=Coalesce(Subquery(no_leidas, output_field=IntegerField()), Value(0))
+    )
@@ -0,0 +1,111 @@
+# gestion_gmexpress/cajas.py
+
+"""
+Total de cajas por viaje (``Viaje.cantidad_cajas_total``).
+
+El total se mantiene con deltas atómicos ``F('cantidad_cajas_total') + n``
+cuando se agrega, quita o mueve una Parada o cambia la cantidad de un
+Pedido que ya está en ruta (ver signals.py). Así nunca hay que recorrer
+las paradas del viaje para recalcularlo.
+
+Para corregir diferencias acumuladas: ``python manage.py reparar_cajas_viajes``.
+"""
+
+from collections import defaultdict
+
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import condicional
+from .models import Viaje, Parada, Pedido
+
+
+def cajas_de_pedido(pedido_id):
+    return (
+        Pedido.objects
+        .filter(pk=pedido_id)
+        .values_list('cantidad_cajas', flat=True)
+        .first()
+    ) or 0
+
+
+def ajustar_cajas(viaje_id, delta):
+    if viaje_id is None or not delta:
+        return
+    Viaje.objects.filter(pk=viaje_id).update(
+        cantidad_cajas_total=F('cantidad_cajas_total') + delta
+    )
+    condicional.cambiar(Viaje)
+
+
+def ajustar_cajas_viajes(deltas):
+    """
+    Aplica {viaje_id: delta}; agrupa los viajes con el mismo delta en un
+    solo UPDATE.
+    """
+    por_delta = defaultdict(list)
+    for viaje_id, delta in deltas.items():
+        if viaje_id is not None and delta:
+            por_delta[delta].append(viaje_id)
+    for delta, viaje_ids in por_delta.items():
+        Viaje.objects.filter(pk__in=viaje_ids).update(
+            cantidad_cajas_total=F('cantidad_cajas_total') + delta
+        )
+    if por_delta:
+        condicional.cambiar(Viaje)
+
+
+def ajustar_cajas_por_pedido(pedido_id, delta):
+    """
+    El pedido cambió su cantidad: ajusta cada viaje en que tiene parada.
+    """
+    if not delta:
+        return
+    viaje_ids = list(
+        Parada.objects.filter(pedido_id=pedido_id).values_list('viaje_id', flat=True)
+    )
+    if viaje_ids:
+        Viaje.objects.filter(pk__in=viaje_ids).update(
+            cantidad_cajas_total=F('cantidad_cajas_total') + delta
+        )
+        condicional.cambiar(Viaje)
+
+
+def reparar_cajas(tamano_lote=1000):
+    """
+    Recorre los viajes por rangos de id y corrige los que no cuadran con la
+    suma real de sus paradas.
+
+    Cada lote es un solo UPDATE que calcula la suma en una subconsulta: leer
+    los totales y escribirlos después dejaría una ventana en la que un delta
+    concurrente (``ajustar_cajas``) se pisaría con un valor ya viejo.
+
+    Devuelve (lotes, reparados).
+    """
+    real = Coalesce(
+        Subquery(
+            Parada.objects
+            .filter(viaje=OuterRef('pk'))
+            .order_by()
+            .values('viaje')
+            .annotate(total=Sum('pedido__cantidad_cajas'))
+            .values('total')
+        ),
+        0,
+    )
+    max_id = Viaje.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+    lotes = reparados = 0
+
+    for desde in range(1, max_id + 1, tamano_lote):
+        lotes += 1
+        reparados += (
+            Viaje.objects
+            .filter(pk__gte=desde, pk__lt=desde + tamano_lote)
+            .exclude(cantidad_cajas_total=real)
+            .update(cantidad_cajas_total=real)
+        )
+
+    if reparados:
+        condicional.cambiar(Viaje)
+
+    return lotes, reparados
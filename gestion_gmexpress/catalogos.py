@@ -0,0 +1,113 @@
+# gestion_gmexpress/catalogos.py
+
+"""
+Catálogos de estados en memoria.
+
+EstadoPedido, EstadoEntrega, EstadoViaje, EstadoVehiculo y TipoServicio
+casi nunca cambian, así que cada proceso los carga una vez y responde
+``por_nombre`` / ``por_id`` sin ir a la base de datos.
+
+Para invalidar entre workers se usa la versión de la tabla en la base
+(VersionTabla, la misma del GET condicional, ver condicional.py): al
+guardar o borrar una fila (p. ej. desde el admin) la señal la sube, y
+cada proceso la revisa como máximo cada ``GMEXPRESS_CATALOGOS_VERIFICACION``
+segundos. Así un cambio llega a todos los workers en ese plazo, aunque la
+caché de Django sea local (LocMemCache).
+
+Las instancias devueltas son compartidas: sirven para asignar FKs y leer
+campos, no para modificarlas.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from .condicional import versiones
+from .models import EstadoPedido, EstadoEntrega, EstadoViaje, EstadoVehiculo, TipoServicio
+
+
+class Catalogo:
+    def __init__(self, modelo, orden=('nombre',)):
+        self.modelo = modelo
+        self.orden = orden
+        self._lock = threading.Lock()
+        # (version, lista ordenada, {id: obj}, {nombre: obj})
+        self._datos = None
+        self._verificado_en = 0.0
+
+    def _intervalo(self):
+        return getattr(settings, 'GMEXPRESS_CATALOGOS_VERIFICACION', 5)
+
+    def _version_actual(self):
+        return versiones(self.modelo)[self.modelo][0]
+
+    def _cargar(self, version):
+        objetos = list(self.modelo.objects.order_by(*self.orden))
+        self._datos = (
+            version,
+            objetos,
+            {o.pk: o for o in objetos},
+            {o.nombre: o for o in objetos},
+        )
+
+    def _vigentes(self):
+        ahora = time.monotonic()
+        if self._datos is not None and ahora - self._verificado_en < self._intervalo():
+            return self._datos
+
+        with self._lock:
+            version = self._version_actual()
+            if self._datos is None or self._datos[0] != version:
+                self._cargar(version)
+            self._verificado_en = ahora
+            return self._datos
+
+    # --- consultas ---
+
+    def todos(self):
+        return self._vigentes()[1]
+
+    def por_id(self, pk):
+        try:
+            return self._vigentes()[2][int(pk)]
+        except (KeyError, ValueError, TypeError):
+            raise self.modelo.DoesNotExist(
+                f"{self.modelo.__name__} con id={pk!r} no existe."
+            )
+
+    def por_nombre(self, nombre):
+        try:
+            return self._vigentes()[3][nombre]
+        except KeyError:
+            raise self.modelo.DoesNotExist(
+                f"{self.modelo.__name__} con nombre={nombre!r} no existe."
+            )
+
+    def id_de(self, nombre):
+        return self.por_nombre(nombre).pk
+
+    # --- invalidación ---
+
+    def invalidar(self):
+        """
+        Este proceso recarga en la próxima consulta. Los demás se enteran
+        por la versión de la tabla, que la señal sube al confirmar (ver
+        ``cambiar_version`` en signals.py).
+        """
+        self._datos = None
+
+
+estados_pedido = Catalogo(EstadoPedido, orden=('orden', 'nombre'))
+estados_entrega = Catalogo(EstadoEntrega)
+estados_viaje = Catalogo(EstadoViaje, orden=('orden', 'nombre'))
+estados_vehiculo = Catalogo(EstadoVehiculo)
+tipos_servicio = Catalogo(TipoServicio)
+
+CATALOGOS = {
+    EstadoPedido: estados_pedido,
+    EstadoEntrega: estados_entrega,
+    EstadoViaje: estados_viaje,
+    EstadoVehiculo: estados_vehiculo,
+    TipoServicio: tipos_servicio,
+}
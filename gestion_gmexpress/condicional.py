@@ -0,0 +1,127 @@
+# gestion_gmexpress/condicional.py
+
+"""
+GET condicional (``ETag`` / ``Last-Modified``) para los listados.
+
+Cada tabla tiene una versión compartida en la base (VersionTabla): un
+número que sube en cada cambio y la hora del último. Las señales la
+mueven al guardar o borrar (ver signals.py) y las operaciones en bulk,
+que no disparan señales, la mueven a mano con ``cambiar``. La versión se
+actualiza al confirmar la transacción, así nunca queda una versión nueva
+apuntando a datos viejos. Está en la base y no en la caché porque con
+LocMemCache cada worker tendría su propia marca: los que no atendieron la
+escritura seguirían respondiendo 304 con el listado viejo.
+
+``GetCondicionalMixin`` arma el ETag con las versiones de las tablas que
+usa la página, el usuario, su sesión y la URL completa. Si el navegador
+ya tiene esa versión responde 304 con una sola consulta (la de las
+versiones) y sin renderizar la plantilla. Si hay mensajes pendientes
+(``messages``) la página siempre se renderiza, porque debe mostrarlos.
+Las versiones leídas quedan en ``self.versiones_tablas`` para que la
+vista las reutilice (p. ej. como clave de caché) sin otra consulta.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import VersionTabla
+
+# Versión de una tabla que nunca cambió (aún no tiene fila)
+SIN_CAMBIOS = (0, None)
+
+
+def _clave(modelo):
+    return modelo._meta.label_lower
+
+
+def _marcar(claves):
+    ahora = timezone.now()
+    filas = VersionTabla.objects.filter(clave__in=claves)
+    if filas.update(version=F('version') + 1, fecha_actualizacion=ahora) < len(claves):
+        # Primera vez de alguna: se crea en 0 (si otro la creó a la vez,
+        # vale la suya) y se sube, así nunca queda en la versión de "sin fila"
+        existentes = set(filas.values_list('clave', flat=True))
+        faltantes = [c for c in claves if c not in existentes]
+        VersionTabla.objects.bulk_create(
+            [VersionTabla(clave=c, fecha_actualizacion=ahora) for c in faltantes],
+            ignore_conflicts=True,
+        )
+        VersionTabla.objects.filter(clave__in=faltantes).update(
+            version=F('version') + 1, fecha_actualizacion=ahora,
+        )
+
+
+def cambiar(*modelos):
+    """
+    Sube la versión de las tablas de ``modelos`` al confirmar la
+    transacción en curso (o de inmediato si no hay una).
+    """
+    claves = sorted({_clave(m) for m in modelos})
+    transaction.on_commit(lambda: _marcar(claves))
+
+
+def versiones(*modelos):
+    """
+    {modelo: (version, fecha del último cambio)} con una sola consulta.
+    Una tabla sin fila todavía no cambió: ``SIN_CAMBIOS``.
+    """
+    claves = {_clave(m): m for m in modelos}
+    filas = (
+        VersionTabla.objects
+        .filter(clave__in=list(claves))
+        .values_list('clave', 'version', 'fecha_actualizacion')
+    )
+    actuales = {clave: (version, fecha) for clave, version, fecha in filas}
+    return {modelo: actuales.get(clave, SIN_CAMBIOS) for clave, modelo in claves.items()}
+
+
+class GetCondicionalMixin:
+    """
+    Para vistas de solo lectura. ``tablas_condicionales`` son los modelos
+    cuyos cambios alteran la página (los de la consulta, los de los
+    ``select_related`` y los catálogos que muestra).
+    """
+    tablas_condicionales = ()
+    versiones_tablas = None
+
+    def get_tablas_condicionales(self):
+        return self.tablas_condicionales or (self.model,)
+
+    def get_etag(self, marcas):
+        request = self.request
+        partes = [
+            getattr(settings, 'GMEXPRESS_CONDICIONAL_SEMILLA', ''),
+            str(request.user.pk),
+            # Login/logout cambian sesión y token CSRF de los formularios
+            request.session.session_key or '',
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            request.get_full_path(),
+        ]
+        partes += sorted(f'{_clave(m)}={version}' for m, (version, _) in marcas.items())
+        return quote_etag(hashlib.sha1('|'.join(partes).encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            return super().get(request, *args, **kwargs)
+
+        marcas = self.versiones_tablas = versiones(*self.get_tablas_condicionales())
+        etag = self.get_etag(marcas)
+        fechas = [fecha for _, fecha in marcas.values() if fecha is not None]
+        ultima = int(max(fechas).timestamp()) if fechas else None
+
+        respuesta = get_conditional_response(request, etag=etag, last_modified=ultima)
+        if respuesta is None:
+            respuesta = super().get(request, *args, **kwargs)
+        respuesta['ETag'] = etag
+        if ultima is not None:
+            respuesta['Last-Modified'] = http_date(ultima)
+        # Que el navegador pregunte siempre; el contenido es por usuario
+        patch_cache_control(respuesta, private=True, no_cache=True)
+        return respuesta
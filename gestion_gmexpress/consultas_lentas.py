@@ -0,0 +1,251 @@
+# gestion_gmexpress/consultas_lentas.py
+
+"""
+Registro de consultas lentas con su plan de ejecución.
+
+Cada conexión a la base de datos recibe (al crearse) un ``execute_wrapper``
+que toma el tiempo de cada consulta. Las que tardan
+``GMEXPRESS_CONSULTAS_LENTAS_MS`` o más se agregan como una línea JSON a
+``GMEXPRESS_CONSULTAS_LENTAS_ARCHIVO`` (con rotación por tamaño) con:
+
+- el SQL, los parámetros y su huella (el SQL sin valores, ver ``huella``);
+- el origen: el nombre de la ruta de la request (``pedido-list``...) o el
+  comando que la lanzó;
+- dónde se hizo en nuestro código (los frames del proyecto, sin Django);
+- el ``EXPLAIN`` de la misma consulta en la misma conexión.
+
+El EXPLAIN se hace una vez por huella cada
+``GMEXPRESS_CONSULTAS_LENTAS_EXPLAIN_CADA`` segundos, para no duplicar la
+carga justo cuando la base ya está lenta. ``reporte_consultas_lentas``
+agrupa el archivo por huella y muestra las peores.
+
+Los workers escriben al mismo archivo; si dos rotan a la vez se puede
+perder alguna línea, aceptable para un registro de diagnóstico.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+# Solo estas se explican: EXPLAIN de un INSERT no dice nada útil
+EXPLICABLES = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+PREFIJO_EXPLAIN = {
+    'mysql': 'EXPLAIN ',
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+MAX_PARAMETRO = 200
+MAX_FRAMES = 5
+
+_solicitud = contextvars.ContextVar('gmexpress_solicitud', default=None)
+_local = threading.local()
+_ultimo_explain = {}
+_manejadores = {}
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def archivo():
+    return Path(_config('GMEXPRESS_CONSULTAS_LENTAS_ARCHIVO', settings.BASE_DIR / 'cache' / 'consultas_lentas.jsonl'))
+
+
+def huella(sql):
+    """
+    La consulta sin sus valores: las que solo cambian en el id se agrupan
+    (así un N+1 aparece como una sola línea repetida).
+    """
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'^SELECT .*? FROM', 'SELECT ... FROM', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\((?:\?, )+\?\)', '(...)', sql)
+
+
+# ------------------------
+# Captura
+# ------------------------
+
+def _origen():
+    request = _solicitud.get()
+    if request is not None:
+        coincidencia = getattr(request, 'resolver_match', None)
+        return coincidencia.view_name if coincidencia else request.path
+    # Fuera de una request: el comando (manage.py enviar_notificaciones...)
+    return ' '.join(Path(a).name if i == 0 else a for i, a in enumerate(sys.argv[:2]))
+
+
+def _ubicacion():
+    """
+    Los frames más internos que son código del proyecto, del más profundo
+    al más externo: "gestion_gmexpress/secuencias.py:31 en siguiente_numero_pedido".
+    """
+    base = str(settings.BASE_DIR)
+    propios = []
+    for frame in reversed(traceback.extract_stack()):
+        ruta = frame.filename
+        if not ruta.startswith(base) or 'site-packages' in ruta or ruta == __file__:
+            continue
+        propios.append(f'{Path(ruta).relative_to(base)}:{frame.lineno} en {frame.name}')
+        if len(propios) == MAX_FRAMES:
+            break
+    return propios
+
+
+def _parametros(params):
+    if not _config('GMEXPRESS_CONSULTAS_LENTAS_PARAMETROS', True) or params is None:
+        return None
+    valores = params.values() if isinstance(params, dict) else params
+    return [str(v)[:MAX_PARAMETRO] if v is not None else None for v in valores]
+
+
+def _explicar(conexion, sql, params, clave):
+    prefijo = PREFIJO_EXPLAIN.get(conexion.vendor)
+    if prefijo is None or not sql.lstrip().upper().startswith(EXPLICABLES):
+        return None
+    ahora = time.monotonic()
+    if ahora - _ultimo_explain.get(clave, -1e9) < _config('GMEXPRESS_CONSULTAS_LENTAS_EXPLAIN_CADA', 300):
+        return None
+    _ultimo_explain[clave] = ahora
+
+    _local.explicando = True
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(prefijo + sql, params)
+            columnas = [c[0] for c in cursor.description]
+            return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+    except DatabaseError as e:
+        return [{'error': str(e)}]
+    finally:
+        _local.explicando = False
+
+
+class _CapturaLenta:
+    def __call__(self, execute, sql, params, many, context):
+        umbral = _config('GMEXPRESS_CONSULTAS_LENTAS_MS', None)
+        if umbral is None or getattr(_local, 'explicando', False):
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        resultado = execute(sql, params, many, context)
+        ms = (time.perf_counter() - inicio) * 1000
+        if ms >= umbral:
+            try:
+                self._registrar(context['connection'], sql, params, many, ms)
+            except Exception:
+                # El diagnóstico nunca debe romper la consulta que ya se hizo
+                logging.getLogger(__name__).exception("No se pudo registrar una consulta lenta")
+        return resultado
+
+    def _registrar(self, conexion, sql, params, many, ms):
+        clave = huella(sql)
+        plan = None
+        if not many and not conexion.needs_rollback:
+            plan = _explicar(conexion, sql, params, clave)
+        _escribir({
+            'momento': timezone.now().isoformat(),
+            'ms': round(ms, 2),
+            'origen': _origen(),
+            'huella': clave,
+            'sql': sql,
+            'parametros': None if many else _parametros(params),
+            'ubicacion': _ubicacion(),
+            'motor': conexion.vendor,
+            'plan': plan,
+        })
+
+
+captura = _CapturaLenta()
+
+
+@receiver(connection_created)
+def instalar(sender, connection, **kwargs):
+    # Se dispara en cada reconexión (CONN_MAX_AGE=0): no apilar el wrapper
+    if captura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(captura)
+
+
+def _escribir(entrada):
+    ruta = archivo()
+    manejador = _manejadores.get(ruta)
+    if manejador is None:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        manejador = _manejadores[ruta] = RotatingFileHandler(
+            ruta, encoding='utf-8', delay=True,
+            maxBytes=_config('GMEXPRESS_CONSULTAS_LENTAS_MAX_BYTES', 10_000_000),
+            backupCount=_config('GMEXPRESS_CONSULTAS_LENTAS_RESPALDOS', 5),
+        )
+    linea = json.dumps(entrada, ensure_ascii=False, default=str)
+    manejador.handle(logging.makeLogRecord({'msg': linea}))
+
+
+def leer(ruta=None):
+    """
+    Entradas del archivo y sus respaldos rotados, de la más antigua a la más
+    reciente. Las líneas dañadas (un corte a mitad de escritura) se saltan.
+    """
+    ruta = Path(ruta or archivo())
+    respaldos = sorted(
+        (p for p in ruta.parent.glob(ruta.name + '.*') if p.suffix[1:].isdigit()),
+        key=lambda p: int(p.suffix[1:]), reverse=True,
+    )
+    for parte in respaldos + [ruta]:
+        if not parte.exists():
+            continue
+        with open(parte, encoding='utf-8') as lineas:
+            for linea in lineas:
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    continue
+
+
+# ------------------------
+# Middleware
+# ------------------------
+
+class ConsultasLentasMiddleware:
+    """
+    Deja la request a mano para que una consulta lenta sepa de qué vista
+    viene. Con ContextVar funciona también bajo ASGI: sync_to_async copia
+    el contexto al hilo del ORM.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        token = _solicitud.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _solicitud.reset(token)
+
+    async def __acall__(self, request):
+        token = _solicitud.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _solicitud.reset(token)
@@ -0,0 +1,147 @@
+# gestion_gmexpress/contadores.py
+
+"""
+Contadores del dashboard.
+
+Las métricas del ``home`` de administración se guardan en la tabla
+ContadorDashboard y se actualizan con deltas atómicos (``F('valor') + n``)
+desde las señales de Vehiculo, Conductor, Pedido y Viaje (ver signals.py).
+Leer el dashboard cuesta una sola consulta sobre el índice único de ``clave``.
+
+Si una clave no existe todavía se calcula en vivo y se guarda; para
+reconstruir todo desde cero: ``python manage.py recalcular_contadores``.
+"""
+
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import ContadorDashboard, Vehiculo, Conductor, Pedido, Viaje
+
+TOTAL_VEHICULOS = 'total_vehiculos'
+TOTAL_CONDUCTORES = 'total_conductores'
+TOTAL_PEDIDOS = 'total_pedidos'
+TOTAL_VIAJES = 'total_viajes'
+PEDIDOS_PENDIENTES = 'pedidos_pendientes'
+PREFIJO_VIAJES_FECHA = 'viajes_fecha:'
+
+CLAVES_TOTALES = (
+    TOTAL_VEHICULOS,
+    TOTAL_CONDUCTORES,
+    TOTAL_PEDIDOS,
+    TOTAL_VIAJES,
+    PEDIDOS_PENDIENTES,
+)
+
+
+def clave_viajes_fecha(fecha):
+    return f'{PREFIJO_VIAJES_FECHA}{fecha}'
+
+
+def _calcular(clave):
+    """
+    Valor real de una clave, calculado directamente sobre las tablas.
+    """
+    if clave == TOTAL_VEHICULOS:
+        return Vehiculo.objects.count()
+    if clave == TOTAL_CONDUCTORES:
+        return Conductor.objects.count()
+    if clave == TOTAL_PEDIDOS:
+        return Pedido.objects.count()
+    if clave == TOTAL_VIAJES:
+        return Viaje.objects.count()
+    if clave == PEDIDOS_PENDIENTES:
+        return Pedido.objects.filter(viaje__isnull=True).count()
+    if clave.startswith(PREFIJO_VIAJES_FECHA):
+        fecha = date.fromisoformat(clave[len(PREFIJO_VIAJES_FECHA):])
+        return Viaje.objects.filter(fecha_programada=fecha).count()
+    raise KeyError(clave)
+
+
+def _inicializar(clave):
+    """
+    Crea la fila de una clave con su valor real y lo devuelve.
+    Devuelve None si otra transacción la creó primero.
+    """
+    valor = _calcular(clave)
+    try:
+        with transaction.atomic():
+            ContadorDashboard.objects.create(clave=clave, valor=valor)
+    except IntegrityError:
+        return None
+    return valor
+
+
+def incrementar(clave, delta=1):
+    if not delta:
+        return
+    actualizados = (
+        ContadorDashboard.objects
+        .filter(clave=clave)
+        .update(valor=F('valor') + delta)
+    )
+    # El valor calculado al inicializar ya incluye este cambio
+    if not actualizados and _inicializar(clave) is None:
+        ContadorDashboard.objects.filter(clave=clave).update(valor=F('valor') + delta)
+
+
+def leer(claves):
+    """
+    Devuelve {clave: valor} con una sola consulta.
+    """
+    valores = dict(
+        ContadorDashboard.objects
+        .filter(clave__in=claves)
+        .values_list('clave', 'valor')
+    )
+    for clave in claves:
+        if clave not in valores:
+            valor = _inicializar(clave)
+            if valor is None:
+                valor = ContadorDashboard.objects.get(clave=clave).valor
+            valores[clave] = valor
+    return valores
+
+
+def resumen_dashboard(hoy=None):
+    hoy = hoy or date.today()
+    clave_hoy = clave_viajes_fecha(hoy)
+    valores = leer(CLAVES_TOTALES + (clave_hoy,))
+
+    return {
+        'total_vehiculos': valores[TOTAL_VEHICULOS],
+        'total_conductores': valores[TOTAL_CONDUCTORES],
+        'total_pedidos': valores[TOTAL_PEDIDOS],
+        'total_viajes': valores[TOTAL_VIAJES],
+        'viajes_hoy': valores[clave_hoy],
+        'pedidos_pendientes': valores[PEDIDOS_PENDIENTES],
+    }
+
+
+@transaction.atomic
+def recalcular_todos():
+    """
+    Reconstruye todos los contadores desde cero. Devuelve la cantidad de claves.
+    """
+    filas = [
+        ContadorDashboard(clave=clave, valor=_calcular(clave))
+        for clave in CLAVES_TOTALES
+    ]
+    por_fecha = (
+        Viaje.objects
+        .order_by()
+        .values('fecha_programada')
+        .annotate(cantidad=Count('id'))
+    )
+    filas += [
+        ContadorDashboard(
+            clave=clave_viajes_fecha(f['fecha_programada']),
+            valor=f['cantidad'],
+        )
+        for f in por_fecha
+    ]
+
+    ContadorDashboard.objects.all().delete()
+    ContadorDashboard.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
@@ -0,0 +1,395 @@
+# gestion_gmexpress/despacho.py
+
+"""
+Despacho automático: reparte los pedidos PENDIENTE_ASIGNACION de una
+fecha de entrega en viajes, respetando la capacidad de cada vehículo.
+
+El plan se arma en memoria con *first-fit decreasing* por comuna:
+
+1. Los pedidos de cada comuna (de la que más cajas suma a la que menos)
+   se ordenan de mayor a menor y se ponen en el primer viaje de esa
+   comuna donde quepan: primero los viajes ya programados para la fecha,
+   luego los que se van abriendo.
+2. Si no cabe en ninguno se abre un viaje nuevo con el vehículo libre más
+   chico que alcance para lo que queda de la comuna (o el más grande si
+   ninguno alcanza).
+3. Lo que no entró por falta de vehículos se acomoda en el espacio libre
+   de cualquier viaje (mezclando comunas); el resto queda sin asignar.
+
+``ejecutar_plan`` crea los viajes nuevos y asigna todos los pedidos con
+``asignacion.asignar_pedidos`` en una sola transacción. Antes vuelve a
+revisar, con las filas bloqueadas, lo que pudo cambiar desde que se armó
+el plan: pedidos ya asignados, vehículos o conductores que tomó otro viaje
+y espacio libre de los viajes existentes. Lo que ya no cabe queda
+pendiente para el próximo despacho.
+"""
+
+import bisect
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .asignacion import asignar_pedidos
+from .catalogos import estados_pedido, estados_viaje, estados_vehiculo
+from .models import (
+    Vehiculo, Viaje, Pedido, TipoRuta,
+    EstadoPedido, EstadoViaje, EstadoVehiculo,
+)
+from .rutas import optimizar_ruta
+
+
+def _estados_vehiculo_ids():
+    nombres = getattr(settings, 'GMEXPRESS_DESPACHO_ESTADOS_VEHICULO', ['OPERATIVO', 'DISPONIBLE'])
+    ids = []
+    for nombre in nombres:
+        try:
+            ids.append(estados_vehiculo.id_de(nombre))
+        except EstadoVehiculo.DoesNotExist:
+            pass
+    return ids
+
+
+def _estado_programado():
+    try:
+        return estados_viaje.por_nombre('PROGRAMADO')
+    except EstadoViaje.DoesNotExist:
+        todos = estados_viaje.todos()
+        if not todos:
+            raise
+        return todos[0]
+
+
+def _clave_comuna(comuna):
+    return ' '.join(comuna.split()).casefold()
+
+
+# ------------------------
+# Plan
+# ------------------------
+
+class Carga:
+    """
+    Un viaje del plan (existente o por crear) y los pedidos que recibe.
+    """
+    def __init__(self, vehiculo, comuna=None, viaje=None, ocupado=0):
+        self.vehiculo = vehiculo
+        self.comuna = comuna
+        self.viaje = viaje
+        self.es_nuevo = viaje is None    # se mantiene tras crear el viaje
+        self.capacidad = vehiculo.capacidad_cajas
+        self.ocupado = ocupado          # cajas que el viaje ya traía
+        self.pedidos = []               # [(pedido_id, cajas)]
+        self.cajas_nuevas = 0
+
+    @property
+    def libre(self):
+        return self.capacidad - self.ocupado - self.cajas_nuevas
+
+    @property
+    def utilizacion(self):
+        if self.capacidad <= 0:
+            return 0.0
+        return (self.ocupado + self.cajas_nuevas) / self.capacidad
+
+    def agregar(self, pedido_id, cajas):
+        self.pedidos.append((pedido_id, cajas))
+        self.cajas_nuevas += cajas
+
+
+class Plan:
+    def __init__(self, fecha):
+        self.fecha = fecha
+        self.cargas = []
+        self.sin_asignar = []           # [(pedido_id, comuna, cajas)]
+
+    @property
+    def cargas_usadas(self):
+        return [c for c in self.cargas if c.pedidos]
+
+    @property
+    def total_pedidos(self):
+        return sum(len(c.pedidos) for c in self.cargas)
+
+    @property
+    def viajes_nuevos(self):
+        return sum(1 for c in self.cargas_usadas if c.es_nuevo)
+
+    def utilizacion(self):
+        """
+        Filas del reporte por vehículo, de la más llena a la más vacía.
+        """
+        filas = [
+            {
+                'placa': c.vehiculo.placa,
+                'viaje_id': c.viaje.pk if c.viaje else None,
+                'nuevo': c.es_nuevo,
+                'comuna': c.comuna or '-',
+                'pedidos': len(c.pedidos),
+                'cajas_previas': c.ocupado,
+                'cajas_nuevas': c.cajas_nuevas,
+                'capacidad': c.capacidad,
+                'utilizacion': round(c.utilizacion * 100, 1),
+            }
+            for c in self.cargas_usadas
+        ]
+        filas.sort(key=lambda f: (-f['utilizacion'], f['placa']))
+        return filas
+
+
+def _pedidos_pendientes(fecha):
+    # Sin el estado no hay forma de distinguir los pendientes de, p. ej.,
+    # los cancelados: no se despacha nada
+    try:
+        pendiente = estados_pedido.por_nombre('PENDIENTE_ASIGNACION')
+    except EstadoPedido.DoesNotExist:
+        raise ValueError("No existe el estado de pedido PENDIENTE_ASIGNACION.")
+    return Pedido.objects.filter(viaje__isnull=True, fecha_entrega_solicitada=fecha, estado=pendiente)
+
+
+def _cargas_existentes(fecha):
+    """
+    Viajes PROGRAMADO de la fecha con su espacio libre y su comuna
+    principal (la más repetida entre sus pedidos; None si está vacío).
+    """
+    viajes = list(
+        Viaje.objects
+        .filter(fecha_programada=fecha, estado=_estado_programado())
+        .select_related('vehiculo')
+        .order_by('id')
+    )
+    conteo = defaultdict(Counter)
+    filas = (
+        Pedido.objects
+        .filter(viaje__in=viajes)
+        .order_by()
+        .values_list('viaje_id', 'comuna')
+        .annotate(n=Count('id'))
+    )
+    for viaje_id, comuna, n in filas:
+        conteo[viaje_id][_clave_comuna(comuna)] += n
+
+    return [
+        Carga(
+            viaje.vehiculo,
+            comuna=conteo[viaje.pk].most_common(1)[0][0] if conteo[viaje.pk] else None,
+            viaje=viaje,
+            ocupado=viaje.cantidad_cajas_total,
+        )
+        for viaje in viajes
+    ]
+
+
+def _disponibles(vehiculos, fecha):
+    return (
+        vehiculos
+        .filter(
+            conductor_asignado__isnull=False,
+            estado_id__in=_estados_vehiculo_ids(),
+            capacidad_cajas__gt=0,
+        )
+        .exclude(viajes__fecha_programada=fecha)
+        .exclude(conductor_asignado__viajes__fecha_programada=fecha)
+    )
+
+
+def _vehiculos_libres(fecha):
+    """
+    Vehículos operativos con conductor y sin viaje esa fecha (ni ellos
+    ni su conductor), ordenados por capacidad ascendente.
+    """
+    return list(
+        _disponibles(Vehiculo.objects.all(), fecha)
+        .select_related('conductor_asignado')
+        .order_by('capacidad_cajas', 'id')
+        .distinct()
+    )
+
+
+def planificar(fecha):
+    """
+    Arma el plan de despacho de ``fecha`` sin escribir nada en la base.
+    """
+    plan = Plan(fecha)
+    plan.cargas = _cargas_existentes(fecha)
+
+    vehiculos = _vehiculos_libres(fecha)
+    capacidades = [v.capacidad_cajas for v in vehiculos]
+
+    def tomar_vehiculo(necesario, minimo):
+        # El más chico que alcance para ``necesario``, o el más grande; si
+        # ni ese recibe ``minimo`` no se toma (quedaría ocupado sin uso)
+        if not vehiculos or capacidades[-1] < minimo:
+            return None
+        i = bisect.bisect_left(capacidades, necesario)
+        i = min(i, len(vehiculos) - 1)
+        capacidades.pop(i)
+        return vehiculos.pop(i)
+
+    grupos = defaultdict(list)
+    for pk, comuna, cajas in _pedidos_pendientes(fecha).values_list('id', 'comuna', 'cantidad_cajas'):
+        grupos[_clave_comuna(comuna)].append((pk, cajas))
+
+    por_comuna = defaultdict(list)
+    libres = []
+    for carga in plan.cargas:
+        (por_comuna[carga.comuna] if carga.comuna else libres).append(carga)
+
+    sobrantes = []
+    orden_grupos = sorted(grupos.items(), key=lambda g: -sum(c for _, c in g[1]))
+    for comuna, items in orden_grupos:
+        items.sort(key=lambda it: (-it[1], it[0]))
+        restante = sum(c for _, c in items)
+        cargas = por_comuna[comuna]
+
+        for pk, cajas in items:
+            destino = next((c for c in cargas if c.libre >= cajas), None)
+            if destino is None:
+                destino = next((c for c in libres if c.libre >= cajas), None)
+                if destino is not None:
+                    libres.remove(destino)
+                    destino.comuna = comuna
+                    cargas.append(destino)
+            if destino is None:
+                vehiculo = tomar_vehiculo(restante, cajas)
+                if vehiculo is not None:
+                    destino = Carga(vehiculo, comuna=comuna)
+                    plan.cargas.append(destino)
+                    cargas.append(destino)
+            if destino is None:
+                sobrantes.append((pk, comuna, cajas))
+            else:
+                destino.agregar(pk, cajas)
+            restante -= cajas
+
+    # Lo que no entró: mejor ajuste en el espacio libre de cualquier viaje
+    for pk, comuna, cajas in sobrantes:
+        candidatas = [c for c in plan.cargas if c.libre >= cajas]
+        if candidatas:
+            min(candidatas, key=lambda c: c.libre).agregar(pk, cajas)
+        else:
+            plan.sin_asignar.append((pk, comuna, cajas))
+
+    return plan
+
+
+# ------------------------
+# Ejecución
+# ------------------------
+
+def _nuevo_viaje(carga, fecha, perfil, tipo_ruta, estado):
+    hora = getattr(settings, 'GMEXPRESS_DESPACHO_HORA_SALIDA', '08:00')
+    viaje = Viaje(
+        nombre_ruta=f"Despacho {fecha:%d-%m} {carga.comuna.title()}"[:100],
+        tipo_ruta=tipo_ruta,
+        origen=getattr(settings, 'GMEXPRESS_DESPACHO_ORIGEN', 'Centro de distribución'),
+        destino=carga.comuna.title(),
+        fecha_programada=fecha,
+        hora_salida=datetime.strptime(hora, '%H:%M').time(),
+        vehiculo=carga.vehiculo,
+        conductor_id=carga.vehiculo.conductor_asignado_id,
+        estado=estado,
+        creado_por=perfil,
+        observaciones="Creado por el despacho automático.",
+    )
+    viaje.save()
+    return viaje
+
+
+def _espacio_vigente(usadas, fecha, estado):
+    """
+    {id(carga): cajas libres} releído con las filas bloqueadas. Las cargas
+    cuyo viaje ya no está PROGRAMADO, o cuyo vehículo (o su conductor) ya
+    no está libre, no aparecen. Bloquea en el mismo orden que
+    ``asignar_pedidos``: viajes antes que pedidos.
+    """
+    viajes = (
+        Viaje.objects
+        .select_for_update()
+        .select_related('vehiculo')
+        .in_bulk([c.viaje.pk for c in usadas if c.viaje is not None])
+    )
+    nuevas = [c for c in usadas if c.viaje is None]
+    vehiculos = Vehiculo.objects.select_for_update().in_bulk([c.vehiculo.pk for c in nuevas])
+    libres = set(
+        _disponibles(Vehiculo.objects.filter(pk__in=list(vehiculos)), fecha)
+        .values_list('id', flat=True)
+    )
+
+    espacio = {}
+    for carga in usadas:
+        if carga.viaje is None:
+            vehiculo = vehiculos.get(carga.vehiculo.pk)
+            if vehiculo is None or vehiculo.pk not in libres:
+                continue
+            carga.vehiculo = vehiculo   # con el conductor vigente
+            espacio[id(carga)] = vehiculo.capacidad_cajas
+        else:
+            viaje = viajes.get(carga.viaje.pk)
+            if viaje is None or viaje.estado_id != estado.pk:
+                continue
+            espacio[id(carga)] = viaje.vehiculo.capacidad_cajas - viaje.cantidad_cajas_total
+    return espacio
+
+
+def ejecutar_plan(plan, perfil, tipo_ruta=None, optimizar=False):
+    """
+    Crea los viajes nuevos del plan y asigna todos sus pedidos en una sola
+    transacción. Se omiten los pedidos que otro usuario asignó entre medio,
+    los que ya no caben en su viaje y los de vehículos que dejaron de
+    estar libres; quedan pendientes.
+
+    Devuelve la cantidad de pedidos asignados.
+    """
+    usadas = plan.cargas_usadas
+    if not usadas:
+        return 0
+
+    if any(c.es_nuevo for c in usadas) and tipo_ruta is None:
+        tipo_ruta = TipoRuta.objects.order_by('id').first()
+        if tipo_ruta is None:
+            raise ValueError("No hay tipos de ruta registrados para crear viajes.")
+
+    ids = [pk for c in usadas for pk, _ in c.pedidos]
+
+    with transaction.atomic():
+        estado = _estado_programado()
+        espacio = _espacio_vigente(usadas, plan.fecha, estado)
+        # Las cajas actuales: el pedido pudo editarse después del plan
+        vigentes = dict(
+            Pedido.objects
+            .select_for_update()
+            .filter(pk__in=ids, viaje__isnull=True)
+            .values_list('id', 'cantidad_cajas')
+        )
+
+        asignaciones = []
+        for carga in usadas:
+            libre = espacio.get(id(carga))
+            if libre is None:
+                continue
+            pedido_ids = []
+            for pk, _ in carga.pedidos:
+                cajas = vigentes.get(pk)
+                if cajas is not None and cajas <= libre:
+                    pedido_ids.append(pk)
+                    libre -= cajas
+            if not pedido_ids:
+                continue
+            if carga.viaje is None:
+                carga.viaje = _nuevo_viaje(carga, plan.fecha, perfil, tipo_ruta, estado)
+            asignaciones.append((carga.viaje, pedido_ids))
+
+        resultado = asignar_pedidos(
+            asignaciones,
+            perfil=perfil,
+            comentario=f"Despacho automático {plan.fecha:%d-%m-%Y}",
+        )
+
+    if optimizar:
+        for viaje, _ in asignaciones:
+            optimizar_ruta(viaje)
+
+    return sum(len(asignados) for asignados in resultado.values())
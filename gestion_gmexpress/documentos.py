@@ -0,0 +1,90 @@
+# gestion_gmexpress/documentos.py
+
+"""
+Armado de documentos DOCX con python-docx.
+
+Este módulo no importa Django: sus funciones corren en procesos aparte
+(ver hojas_ruta.py) y reciben solo datos simples.
+"""
+
+import io
+import os
+import tempfile
+
+from docx import Document
+from docx.enum.section import WD_ORIENT
+from docx.shared import Cm, Pt
+
+
+def renderizar_hoja_ruta(datos):
+    """
+    Arma el DOCX de una hoja de ruta y devuelve sus bytes.
+    """
+    doc = Document()
+    seccion = doc.sections[0]
+    seccion.orientation = WD_ORIENT.LANDSCAPE
+    seccion.page_width, seccion.page_height = seccion.page_height, seccion.page_width
+    for margen in ('left_margin', 'right_margin', 'top_margin', 'bottom_margin'):
+        setattr(seccion, margen, Cm(1.5))
+    doc.styles['Normal'].font.size = Pt(10)
+
+    doc.add_heading(f"Hoja de Ruta - Viaje #{datos['id']}", level=1)
+    doc.add_paragraph(datos['nombre_ruta'])
+
+    info = doc.add_table(rows=0, cols=4)
+    info.style = 'Table Grid'
+    pares = [
+        ('Fecha', datos['fecha'], 'Hora salida', datos['hora_salida']),
+        ('Vehículo', datos['vehiculo'], 'Conductor', datos['conductor']),
+        ('Origen', datos['origen'], 'Destino', datos['destino']),
+        ('Estado', datos['estado'], 'Total raciones', str(datos['total_cajas'])),
+    ]
+    for fila in pares:
+        celdas = info.add_row().cells
+        for i, texto in enumerate(fila):
+            celdas[i].text = texto
+            if i % 2 == 0:
+                celdas[i].paragraphs[0].runs[0].bold = True
+
+    if datos['observaciones']:
+        doc.add_paragraph(f"Observaciones: {datos['observaciones']}")
+
+    doc.add_heading(f"Paradas ({len(datos['paradas'])})", level=2)
+    encabezados = ['#', 'Pedido', 'Cliente', 'Dirección', 'Contacto',
+                   'Raciones', 'Instrucciones', 'Estado', 'Firma recepción']
+    tabla = doc.add_table(rows=1, cols=len(encabezados))
+    tabla.style = 'Table Grid'
+    for celda, texto in zip(tabla.rows[0].cells, encabezados):
+        celda.text = texto
+        celda.paragraphs[0].runs[0].bold = True
+
+    for p in datos['paradas']:
+        celdas = tabla.add_row().cells
+        valores = [
+            str(p['secuencia']), p['numero_pedido'], p['cliente'], p['direccion'],
+            p['telefono'], str(p['cajas']), p['instrucciones'], p['estado'], '',
+        ]
+        for celda, texto in zip(celdas, valores):
+            celda.text = texto
+
+    salida = io.BytesIO()
+    doc.save(salida)
+    return salida.getvalue()
+
+
+def guardar_hoja_ruta(datos, ruta):
+    """
+    Arma la hoja de ruta y la escribe en ``ruta`` de forma atómica. Corre
+    en el proceso del pool: el archivo queda listo aunque nadie espere el
+    resultado.
+    """
+    contenido = renderizar_hoja_ruta(datos)
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return ruta
@@ -0,0 +1,302 @@
+# gestion_gmexpress/entregas.py
+
+"""
+Actualización del estado de entrega de las paradas por el conductor.
+
+La usan el formulario de la hoja de ruta (una parada) y la sincronización
+en lote del teléfono del conductor, que acumula cambios sin cobertura y
+los envía juntos. Para cualquier cantidad de paradas el costo es fijo:
+
+- una consulta verifica que todas las paradas sean de viajes del conductor,
+- ``bulk_update`` de paradas y pedidos y ``bulk_create`` del historial,
+- las claves de idempotencia (SincronizacionEntrega) se leen y se guardan
+  en bloque: un reenvío de la misma clave no se vuelve a aplicar.
+
+Los cambios se aplican en el orden de la hora del teléfono
+(``registrado_en``). El estado (con su motivo de fallo) y las
+observaciones llevan cada uno la hora del último cambio aplicado
+(``Parada.estado_registrado_en`` / ``observaciones_registradas_en``): lo
+que llegue más antiguo se descarta, y si no queda nada por aplicar el
+cambio es ``obsoleto``. Así una nota tardía no invalida un cambio de
+estado ni al revés. La hora de llegada solo se registra cuando el estado
+es una llegada real (entregado o fallido).
+
+Las claves de idempotencia son por conductor: las genera cada teléfono.
+
+Como las operaciones en bulk no disparan señales, las marcas de versión
+(condicional.py) y los eventos en vivo (eventos.py) se actualizan a mano. Los avisos al cliente (pedido
+entregado, entrega fallida) se encolan en la misma transacción (ver
+notificaciones.py).
+"""
+
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import condicional, eventos, notificaciones
+from .catalogos import estados_entrega, estados_pedido
+from .models import (
+    Parada, Pedido, HistorialEstadoPedido, SincronizacionEntrega,
+    EstadoEntrega, EstadoPedido,
+)
+
+TAMANO_LOTE = 500
+LARGO_CLAVE = 64
+# Estados de entrega que significan que el conductor llegó a la dirección
+LLEGADAS = ('ENTREGADO', 'FALLIDO')
+
+APLICADO = 'aplicado'
+REPETIDO = 'repetido'
+OBSOLETO = 'obsoleto'
+ERROR = 'error'
+
+# ``estado``, ``motivo_fallo`` y ``observaciones`` en None no se modifican
+Actualizacion = namedtuple(
+    'Actualizacion',
+    ['parada_id', 'estado', 'motivo_fallo', 'observaciones', 'registrado_en', 'clave'],
+    defaults=(None, None, None, None, None),
+)
+
+
+def _resultado(clave, parada_id, resultado, error=None):
+    fila = {'clave': clave, 'parada': parada_id, 'resultado': resultado}
+    if error:
+        fila['error'] = error
+    return fila
+
+
+def _posterior(registrado_en, actualizacion):
+    # Lo ya aplicado es más nuevo que esta actualización
+    return registrado_en is not None and registrado_en > actualizacion.registrado_en
+
+
+# ------------------------
+# Lectura del lote (JSON)
+# ------------------------
+
+def _estado_entrega(valor):
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return estados_entrega.por_id(valor)
+    return estados_entrega.por_nombre(str(valor).strip().upper())
+
+
+def leer_actualizacion(item, ahora=None):
+    """
+    Convierte un elemento del JSON en Actualizacion. Lanza ValueError con
+    el mensaje para el teléfono si no es válido.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Cada elemento debe ser un objeto.")
+
+    clave = item.get('clave')
+    if not isinstance(clave, str) or not clave.strip() or len(clave) > LARGO_CLAVE:
+        raise ValueError(f"Falta la clave de idempotencia (máximo {LARGO_CLAVE} caracteres).")
+
+    parada_id = item.get('parada')
+    if not isinstance(parada_id, int) or isinstance(parada_id, bool):
+        raise ValueError("La parada debe ser un id numérico.")
+
+    estado = None
+    if item.get('estado') not in (None, ''):
+        try:
+            estado = _estado_entrega(item['estado'])
+        except EstadoEntrega.DoesNotExist:
+            raise ValueError(f"Estado de entrega desconocido: {item['estado']}.")
+
+    motivo = item.get('motivo_fallo') or None
+    if motivo is not None and motivo not in Parada.MotivoFallo.values:
+        raise ValueError(f"Motivo de fallo desconocido: {motivo}.")
+
+    observaciones = item.get('observaciones') or None
+    if observaciones is not None and not isinstance(observaciones, str):
+        raise ValueError("Las observaciones deben ser texto.")
+
+    ahora = ahora or timezone.now()
+    registrado_en = ahora
+    if item.get('registrado_en'):
+        try:
+            registrado_en = parse_datetime(str(item['registrado_en']))
+        except ValueError:
+            registrado_en = None
+        if registrado_en is None:
+            raise ValueError("registrado_en debe ser una fecha y hora ISO 8601.")
+        if timezone.is_naive(registrado_en):
+            registrado_en = timezone.make_aware(registrado_en)
+        # Un reloj adelantado no puede dejar la parada "en el futuro"
+        registrado_en = min(registrado_en, ahora)
+
+    return Actualizacion(
+        parada_id=parada_id,
+        estado=estado,
+        motivo_fallo=motivo,
+        observaciones=observaciones,
+        registrado_en=registrado_en,
+        clave=clave,
+    )
+
+
+# ------------------------
+# Aplicación
+# ------------------------
+
+def aplicar_actualizaciones(conductor, perfil, actualizaciones):
+    """
+    Aplica las actualizaciones del conductor en una transacción.
+
+    Devuelve una lista de dicts {clave, parada, resultado[, error]} en el
+    mismo orden recibido; ``resultado`` es aplicado, repetido, obsoleto o
+    error.
+    """
+    ahora = timezone.now()
+    actualizaciones = [a._replace(registrado_en=a.registrado_en or ahora) for a in actualizaciones]
+    resultados = [None] * len(actualizaciones)
+
+    # Claves repetidas dentro del mismo lote: vale la primera
+    vistas = {}
+    for i, a in enumerate(actualizaciones):
+        if a.clave is None:
+            continue
+        if a.clave in vistas:
+            resultados[i] = _resultado(a.clave, a.parada_id, REPETIDO)
+        else:
+            vistas[a.clave] = i
+
+    try:
+        estado_entregado = estados_pedido.por_nombre('ENTREGADO')
+    except EstadoPedido.DoesNotExist:
+        estado_entregado = None
+    comentario = None
+
+    with transaction.atomic():
+        registradas = dict(
+            SincronizacionEntrega.objects
+            .filter(conductor=conductor, clave__in=list(vistas))
+            .values_list('clave', 'resultado')
+        )
+        for clave, resultado in registradas.items():
+            i = vistas.pop(clave)
+            resultados[i] = _resultado(clave, actualizaciones[i].parada_id, REPETIDO)
+            resultados[i]['original'] = resultado
+
+        pendientes = [i for i, r in enumerate(resultados) if r is None]
+
+        # Una consulta para verificar que todas las paradas sean del conductor
+        paradas = (
+            Parada.objects
+            .select_for_update()
+            .select_related('pedido')
+            .filter(
+                pk__in={actualizaciones[i].parada_id for i in pendientes},
+                viaje__conductor=conductor,
+            )
+            .in_bulk()
+        )
+
+        estados_antes = {pk: p.estado_entrega_id for pk, p in paradas.items()}
+        try:
+            estado_fallido = estados_entrega.id_de('FALLIDO')
+        except EstadoEntrega.DoesNotExist:
+            estado_fallido = None
+        cambiadas = {}
+        pedidos = {}
+        historial = []
+        for i in sorted(pendientes, key=lambda i: actualizaciones[i].registrado_en):
+            a = actualizaciones[i]
+            parada = paradas.get(a.parada_id)
+            if parada is None:
+                resultados[i] = _resultado(
+                    a.clave, a.parada_id, ERROR, "La parada no existe o no es de tus viajes."
+                )
+                continue
+            trae_estado = a.estado is not None or a.motivo_fallo is not None
+            cambia_estado = trae_estado and not _posterior(parada.estado_registrado_en, a)
+            cambia_observaciones = (
+                a.observaciones is not None
+                and not _posterior(parada.observaciones_registradas_en, a)
+            )
+            if (trae_estado or a.observaciones is not None) and not (cambia_estado or cambia_observaciones):
+                resultados[i] = _resultado(a.clave, a.parada_id, OBSOLETO)
+                continue
+
+            if cambia_estado:
+                parada.estado_registrado_en = a.registrado_en
+                if a.motivo_fallo is not None:
+                    parada.motivo_fallo = a.motivo_fallo
+            if cambia_estado and a.estado is not None:
+                parada.estado_entrega = a.estado
+                pedido = parada.pedido
+                if (
+                    a.estado.nombre == 'ENTREGADO'
+                    and estado_entregado is not None
+                    and pedido.estado_id != estado_entregado.pk
+                ):
+                    pedido.estado = estado_entregado
+                    pedido.fecha_actualizacion = ahora
+                    pedidos[pedido.pk] = pedido
+                    comentario = comentario or f"Entregado por conductor {conductor}"
+                    historial.append(HistorialEstadoPedido(
+                        pedido=pedido,
+                        estado=estado_entregado,
+                        comentario=comentario,
+                        fecha_cambio=a.registrado_en,
+                        cambiado_por=perfil,
+                    ))
+                if a.estado.nombre in LLEGADAS:
+                    parada.fecha_entrega_real = timezone.localdate(a.registrado_en)
+                    parada.hora_llegada_real = a.registrado_en
+            if cambia_observaciones:
+                parada.observaciones = a.observaciones
+                parada.observaciones_registradas_en = a.registrado_en
+
+            parada.atendido_por = conductor
+            parada.fecha_actualizacion = ahora
+            cambiadas[parada.pk] = parada
+            resultados[i] = _resultado(a.clave, a.parada_id, APLICADO)
+
+        Parada.objects.bulk_update(
+            cambiadas.values(),
+            [
+                'estado_entrega', 'motivo_fallo', 'observaciones', 'atendido_por',
+                'fecha_entrega_real', 'hora_llegada_real', 'fecha_actualizacion',
+                'estado_registrado_en', 'observaciones_registradas_en',
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+        Pedido.objects.bulk_update(
+            pedidos.values(), ['estado', 'fecha_actualizacion'], batch_size=TAMANO_LOTE
+        )
+        HistorialEstadoPedido.objects.bulk_create(historial, batch_size=TAMANO_LOTE)
+
+        # Solo se registran las claves con resultado definitivo: un error
+        # (parada ajena) se puede corregir y reenviar con la misma clave.
+        # Un reenvío simultáneo choca con el índice único y revierte todo.
+        SincronizacionEntrega.objects.bulk_create([
+            SincronizacionEntrega(
+                clave=clave,
+                conductor=conductor,
+                parada_id=actualizaciones[i].parada_id,
+                resultado=resultados[i]['resultado'],
+                fecha_cliente=actualizaciones[i].registrado_en,
+            )
+            for clave, i in vistas.items()
+            if resultados[i]['resultado'] in (APLICADO, OBSOLETO)
+        ], batch_size=TAMANO_LOTE)
+
+        if cambiadas:
+            condicional.cambiar(Parada, Pedido)
+        nuevas = [p for p in cambiadas.values() if p.estado_entrega_id != estados_antes[p.pk]]
+        eventos.publicar(
+            *(eventos.evento_parada(p) for p in nuevas),
+            *(eventos.evento_pedido(p) for p in pedidos.values()),
+        )
+        notificaciones.encolar([
+            *(notificaciones.aviso_estado_pedido(p) for p in pedidos.values()),
+            *(
+                notificaciones.aviso_entrega_fallida(p) for p in nuevas
+                if p.estado_entrega_id == estado_fallido
+            ),
+        ])
+
+    return resultados
@@ -0,0 +1,394 @@
+# gestion_gmexpress/eventos.py
+
+"""
+Cambios de estado en vivo por Server-Sent Events (SSE).
+
+Las señales (y las operaciones en bulk que no las disparan) publican los
+cambios de ``Viaje.estado``, ``Parada.estado_entrega`` y ``Pedido.estado``
+al confirmar la transacción. Cada evento va a uno o más canales:
+
+- ``viaje:<id>``: el viaje, sus paradas y sus pedidos,
+- ``pedido:<id>``: el pedido y sus paradas,
+- ``cliente:<id>``: los pedidos del cliente (listado "Mis pedidos").
+
+La vista ``eventos_estado`` es asíncrona: bajo ASGI cada navegador
+conectado es una corrutina esperando en una cola, sin ocupar un hilo.
+
+El broker se elige con ``GMEXPRESS_EVENTOS_BROKER``:
+
+- ``BrokerMemoria``: reparte dentro del proceso. Sirve con un solo worker.
+- ``BrokerBaseDatos``: guarda cada evento en EventoEstado y cada worker
+  los lee con una sola consulta por intervalo, sin importar cuántos
+  navegadores tenga conectados. Permite además retomar desde
+  ``Last-Event-ID`` tras una reconexión.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .catalogos import estados_entrega, estados_pedido, estados_viaje
+from .models import Viaje, Pedido, EventoEstado
+from .roles import es_gestion
+
+logger = logging.getLogger(__name__)
+
+CANAL = re.compile(r'^(viaje|pedido|cliente):\d+$')
+MAX_CANALES = 50
+TAMANO_COLA = 100
+# Eventos ya entregados que recuerda cada suscripción (evita duplicados
+# entre lo recuperado con Last-Event-ID y lo que llega en vivo)
+MEMORIA_IDS = 1000
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+# ------------------------
+# Eventos
+# ------------------------
+
+def evento_viaje(viaje):
+    return [f'viaje:{viaje.pk}'], {
+        'tipo': 'viaje',
+        'viaje': viaje.pk,
+        'estado': estados_viaje.por_id(viaje.estado_id).nombre,
+    }
+
+
+def evento_parada(parada):
+    return [f'viaje:{parada.viaje_id}', f'pedido:{parada.pedido_id}'], {
+        'tipo': 'parada',
+        'parada': parada.pk,
+        'viaje': parada.viaje_id,
+        'pedido': parada.pedido_id,
+        'estado': estados_entrega.por_id(parada.estado_entrega_id).nombre,
+    }
+
+
+def evento_pedido(pedido):
+    canales = [f'pedido:{pedido.pk}', f'cliente:{pedido.cliente_id}']
+    if pedido.viaje_id:
+        canales.append(f'viaje:{pedido.viaje_id}')
+    return canales, {
+        'tipo': 'pedido',
+        'pedido': pedido.pk,
+        'numero_pedido': pedido.numero_pedido,
+        'viaje': pedido.viaje_id,
+        'estado': estados_pedido.por_id(pedido.estado_id).nombre,
+    }
+
+
+def publicar(*eventos):
+    """
+    Publica [(canales, datos), ...] al confirmar la transacción en curso.
+    """
+    eventos = list(eventos)
+    if not eventos:
+        return
+    fecha = timezone.now().isoformat()
+    for _, datos in eventos:
+        datos['fecha'] = fecha
+    transaction.on_commit(lambda: _enviar(eventos))
+
+
+def _enviar(eventos):
+    # Un broker caído no puede hacer fallar el guardado que ya se confirmó
+    try:
+        obtener_broker().publicar(eventos)
+    except Exception:
+        logger.exception("No se pudieron publicar %d eventos de estado", len(eventos))
+
+
+# ------------------------
+# Brokers
+# ------------------------
+
+class Suscripcion:
+    """
+    Cola de eventos de un navegador conectado. ``entregar`` se puede llamar
+    desde cualquier hilo; la cola vive en el event loop de la conexión.
+    """
+    def __init__(self, canales):
+        self.canales = frozenset(canales)
+        self.cerrada = False
+        self._loop = asyncio.get_running_loop()
+        self._cola = asyncio.Queue()
+        self._ids = set()
+        self._orden = deque()
+
+    def entregar(self, evento):
+        try:
+            self._loop.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            # El loop ya terminó: la conexión se cerró
+            pass
+
+    def _poner(self, evento):
+        if self.cerrada or evento['id'] in self._ids:
+            return
+        self._ids.add(evento['id'])
+        self._orden.append(evento['id'])
+        if len(self._orden) > MEMORIA_IDS:
+            self._ids.discard(self._orden.popleft())
+
+        if self._cola.qsize() >= TAMANO_COLA:
+            # Cliente demasiado lento: se corta y el navegador se reconecta
+            self.cerrada = True
+            self._cola.put_nowait(None)
+            return
+        self._cola.put_nowait(evento)
+
+    async def siguiente(self):
+        """
+        Próximo evento, o None si la suscripción se cerró.
+        """
+        return await self._cola.get()
+
+
+class BrokerMemoria:
+    """
+    Reparte los eventos entre las conexiones del mismo proceso.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_canal = defaultdict(set)
+        self._ids = itertools.count(1)
+
+    def publicar(self, eventos):
+        for canales, datos in eventos:
+            self._repartir(canales, dict(datos, id=next(self._ids)))
+
+    def _repartir(self, canales, evento):
+        with self._lock:
+            destinos = set().union(*(self._por_canal.get(c, ()) for c in canales))
+        for suscripcion in destinos:
+            suscripcion.entregar(evento)
+
+    def _registrar(self, suscripcion):
+        with self._lock:
+            for canal in suscripcion.canales:
+                self._por_canal[canal].add(suscripcion)
+
+    def _quitar(self, suscripcion):
+        with self._lock:
+            for canal in suscripcion.canales:
+                self._por_canal[canal].discard(suscripcion)
+                if not self._por_canal[canal]:
+                    del self._por_canal[canal]
+
+    def hay_suscriptores(self):
+        with self._lock:
+            return bool(self._por_canal)
+
+    async def pendientes(self, canales, desde):
+        """
+        Eventos posteriores a ``desde`` (Last-Event-ID). En memoria no se
+        guarda historia.
+        """
+        return []
+
+    @contextlib.asynccontextmanager
+    async def suscribir(self, canales, desde=None):
+        suscripcion = Suscripcion(canales)
+        self._registrar(suscripcion)
+        try:
+            # Ya registrada: lo que se publique mientras tanto no se pierde
+            for evento in await self.pendientes(suscripcion.canales, desde):
+                suscripcion._poner(evento)
+            yield suscripcion
+        finally:
+            self._quitar(suscripcion)
+
+
+class BrokerBaseDatos(BrokerMemoria):
+    """
+    Para varios workers o servidores: los eventos pasan por la tabla
+    EventoEstado. Cada proceso con conexiones abiertas corre una tarea que
+    cada ``GMEXPRESS_EVENTOS_INTERVALO`` segundos lee los eventos nuevos y
+    los reparte en memoria.
+
+    Se leen los eventos de los últimos ``VENTANA`` segundos (no solo los de
+    id mayor al último visto) porque dos inserciones concurrentes pueden
+    confirmarse en otro orden que el de sus ids.
+    """
+    VENTANA = timedelta(seconds=10)
+    LIMPIEZA_CADA = 60
+
+    def __init__(self):
+        super().__init__()
+        self._tarea = None
+
+    def publicar(self, eventos):
+        EventoEstado.objects.bulk_create([
+            EventoEstado(canales=',' + ','.join(canales) + ',', datos=datos)
+            for canales, datos in eventos
+        ])
+
+    def _registrar(self, suscripcion):
+        super()._registrar(suscripcion)
+        loop = asyncio.get_running_loop()
+        if self._tarea is None or self._tarea.done() or self._tarea.get_loop() is not loop:
+            self._tarea = loop.create_task(self._sondear())
+
+    @staticmethod
+    def _fila_a_evento(fila):
+        return fila.canales.strip(',').split(','), dict(fila.datos, id=fila.pk)
+
+    async def pendientes(self, canales, desde):
+        if desde is None:
+            return []
+        return await sync_to_async(self._leer_desde)(canales, desde)
+
+    def _leer_desde(self, canales, desde):
+        filtro = Q()
+        for canal in canales:
+            filtro |= Q(canales__contains=f',{canal},')
+        filas = EventoEstado.objects.filter(filtro, pk__gt=desde).order_by('pk')[:TAMANO_COLA]
+        return [self._fila_a_evento(fila)[1] for fila in filas]
+
+    def _leer_recientes(self, desde):
+        close_old_connections()
+        return [
+            self._fila_a_evento(fila)
+            for fila in EventoEstado.objects.filter(fecha__gte=desde).order_by('pk')
+        ]
+
+    def _limpiar(self):
+        retencion = _config('GMEXPRESS_EVENTOS_RETENCION', 3600)
+        EventoEstado.objects.filter(fecha__lt=timezone.now() - timedelta(seconds=retencion)).delete()
+
+    async def _sondear(self):
+        inicio = timezone.now()
+        vistos = {}
+        ultima_limpieza = 0
+        while self.hay_suscriptores():
+            ahora = timezone.now()
+            try:
+                eventos = await sync_to_async(self._leer_recientes)(max(inicio, ahora - self.VENTANA))
+                for canales, evento in eventos:
+                    if evento['id'] not in vistos:
+                        vistos[evento['id']] = ahora
+                        self._repartir(canales, evento)
+                vistos = {pk: fecha for pk, fecha in vistos.items() if fecha >= ahora - self.VENTANA * 2}
+
+                if time.monotonic() - ultima_limpieza > self.LIMPIEZA_CADA:
+                    ultima_limpieza = time.monotonic()
+                    await sync_to_async(self._limpiar)()
+            except Exception:
+                logger.exception("Error leyendo eventos de estado")
+            await asyncio.sleep(_config('GMEXPRESS_EVENTOS_INTERVALO', 1))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(_config(
+                'GMEXPRESS_EVENTOS_BROKER', 'gestion_gmexpress.eventos.BrokerMemoria'
+            ))()
+        return _broker
+
+
+@receiver(setting_changed)
+def reiniciar_broker(setting, **kwargs):
+    global _broker
+    if setting == 'GMEXPRESS_EVENTOS_BROKER':
+        with _broker_lock:
+            _broker = None
+
+
+# ------------------------
+# Suscripción desde el navegador
+# ------------------------
+
+def canales_permitidos(user, canales):
+    """
+    Filtra los canales pedidos a los que ``user`` puede suscribirse:
+    admin / logística a todos; el cliente a sus pedidos y a su propio
+    canal; el conductor a sus viajes y a los pedidos de sus viajes.
+    """
+    canales = [c for c in dict.fromkeys(canales) if CANAL.match(c)][:MAX_CANALES]
+    if not canales or es_gestion(user):
+        return canales
+
+    perfil = getattr(user, 'perfil', None)
+    cliente = getattr(perfil, 'cliente', None) if perfil else None
+    conductor = getattr(perfil, 'conductor', None) if perfil else None
+
+    ids = defaultdict(set)
+    for canal in canales:
+        tipo, pk = canal.split(':')
+        ids[tipo].add(int(pk))
+
+    propios = set()
+    if cliente is not None and cliente.pk in ids['cliente']:
+        propios.add(f'cliente:{cliente.pk}')
+
+    alcance = Q(pk__in=[])
+    if cliente is not None:
+        alcance |= Q(cliente=cliente)
+    if conductor is not None:
+        alcance |= Q(viaje__conductor=conductor)
+    if ids['pedido'] and (cliente or conductor):
+        propios.update(
+            f'pedido:{pk}'
+            for pk in Pedido.objects.filter(alcance, pk__in=ids['pedido']).values_list('id', flat=True)
+        )
+    if ids['viaje'] and conductor is not None:
+        propios.update(
+            f'viaje:{pk}'
+            for pk in Viaje.objects.filter(conductor=conductor, pk__in=ids['viaje']).values_list('id', flat=True)
+        )
+
+    return [c for c in canales if c in propios]
+
+
+def _formato_sse(evento):
+    datos = json.dumps(evento, ensure_ascii=False)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+async def flujo_sse(canales, desde=None):
+    """
+    Generador asíncrono con el cuerpo text/event-stream. Envía un
+    comentario cada ``GMEXPRESS_EVENTOS_LATIDO`` segundos para que los
+    proxies no corten la conexión, y la cierra tras
+    ``GMEXPRESS_EVENTOS_DURACION_MAX`` (el navegador se reconecta solo, con
+    Last-Event-ID, y así las conexiones se reparten entre workers).
+    """
+    latido = _config('GMEXPRESS_EVENTOS_LATIDO', 20)
+    fin = time.monotonic() + _config('GMEXPRESS_EVENTOS_DURACION_MAX', 1800)
+
+    yield f"retry: {_config('GMEXPRESS_EVENTOS_REINTENTO_MS', 5000)}\n\n"
+    async with obtener_broker().suscribir(canales, desde) as suscripcion:
+        while time.monotonic() < fin:
+            try:
+                evento = await asyncio.wait_for(suscripcion.siguiente(), timeout=latido)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+                continue
+            if evento is None:
+                return
+            yield _formato_sse(evento)
@@ -0,0 +1,276 @@
+# gestion_gmexpress/exportaciones.py
+
+"""
+Exportación de pedidos, viajes y paradas a CSV y XLSX en streaming.
+
+Las filas se leen en lotes por rango de clave primaria
+(``WHERE id > ultimo ORDER BY id LIMIT n``) con ``values_list``, así que
+los joins se resuelven en SQL y nunca hay más de un lote en memoria. No se
+usa ``.iterator()``: con MySQL (mysqlclient) el driver trae el resultado
+completo al cliente antes de entregar la primera fila.
+
+La respuesta es un ``StreamingHttpResponse``: el encabezado sale antes de
+la primera consulta y cada lote se envía apenas se arma. El XLSX se
+escribe a mano (hoja única con celdas ``inlineStr``) dentro de un zip que
+se va vaciando por partes, sin archivos temporales.
+"""
+
+import codecs
+import csv
+import re
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+TAMANO_LOTE = 2000
+
+# Caracteres de control que XML 1.0 no admite
+_XML_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+# ------------------------
+# Definiciones de exportación
+# ------------------------
+
+# (encabezado, campo de values_list)
+COLUMNAS_PEDIDOS = [
+    ('N° pedido', 'numero_pedido'),
+    ('Cliente', 'cliente__nombre'),
+    ('Estado', 'estado__nombre'),
+    ('Servicio', 'tipo_servicio__nombre'),
+    ('Raciones', 'cantidad_cajas'),
+    ('Monto total', 'monto_total'),
+    ('Dirección', 'direccion_entrega'),
+    ('Comuna', 'comuna'),
+    ('Ciudad', 'ciudad'),
+    ('Fecha servicio', 'fecha_entrega_solicitada'),
+    ('Viaje', 'viaje_id'),
+    ('Creado', 'fecha_creacion'),
+]
+
+COLUMNAS_VIAJES = [
+    ('Viaje', 'id'),
+    ('Ruta', 'nombre_ruta'),
+    ('Tipo ruta', 'tipo_ruta__nombre'),
+    ('Fecha programada', 'fecha_programada'),
+    ('Hora salida', 'hora_salida'),
+    ('Origen', 'origen'),
+    ('Destino', 'destino'),
+    ('Vehículo', 'vehiculo__placa'),
+    ('Conductor', 'conductor__usuario__user__username'),
+    ('Estado', 'estado__nombre'),
+    ('Raciones', 'cantidad_cajas_total'),
+]
+
+COLUMNAS_PARADAS = [
+    ('Viaje', 'viaje_id'),
+    ('Fecha programada', 'viaje__fecha_programada'),
+    ('Vehículo', 'viaje__vehiculo__placa'),
+    ('Secuencia', 'secuencia'),
+    ('N° pedido', 'pedido__numero_pedido'),
+    ('Cliente', 'pedido__cliente__nombre'),
+    ('Dirección', 'pedido__direccion_entrega'),
+    ('Comuna', 'pedido__comuna'),
+    ('Raciones', 'pedido__cantidad_cajas'),
+    ('Estado entrega', 'estado_entrega__nombre'),
+    ('Llegada real', 'hora_llegada_real'),
+    ('Motivo fallo', 'motivo_fallo'),
+    ('Observaciones', 'observaciones'),
+]
+
+
+def filas_por_lotes(queryset, campos, tamano_lote=TAMANO_LOTE):
+    """
+    Genera las filas (tuplas con ``campos``) de ``queryset`` recorriendo
+    la clave primaria en lotes.
+    """
+    base = queryset.order_by('pk').values_list('pk', *campos)
+    ultimo = None
+    while True:
+        lote = base if ultimo is None else base.filter(pk__gt=ultimo)
+        filas = list(lote[:tamano_lote])
+        if not filas:
+            return
+        ultimo = filas[-1][0]
+        yield [fila[1:] for fila in filas]
+        if len(filas) < tamano_lote:
+            return
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.strftime('%d-%m-%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d-%m-%Y')
+    if isinstance(valor, time):
+        return valor.strftime('%H:%M')
+    return str(valor)
+
+
+# ------------------------
+# CSV
+# ------------------------
+
+class _Eco:
+    """
+    Pseudo-archivo: ``write`` devuelve lo escrito en vez de guardarlo.
+    """
+    def write(self, valor):
+        return valor
+
+
+def _generar_csv(encabezados, lotes):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel reconozca el UTF-8 (tildes, ñ)
+    yield codecs.BOM_UTF8.decode() + escritor.writerow(encabezados)
+    for filas in lotes:
+        yield ''.join(
+            escritor.writerow([
+                valor if isinstance(valor, (int, Decimal)) else _texto(valor)
+                for valor in fila
+            ])
+            for fila in filas
+        )
+
+
+# ------------------------
+# XLSX
+# ------------------------
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _workbook(nombre_hoja):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(nombre_hoja[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _celda(valor):
+    if isinstance(valor, bool):
+        valor = 'Sí' if valor else 'No'
+    elif isinstance(valor, (int, float, Decimal)):
+        return f'<c t="n"><v>{valor}</v></c>'
+    texto = _XML_INVALIDOS.sub('', _texto(valor))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return '<row>' + ''.join(_celda(v) for v in valores) + '</row>'
+
+
+class _Buffer:
+    """
+    Destino no posicionable para ZipFile: acumula lo escrito hasta que el
+    generador lo retira con ``vaciar``.
+    """
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _generar_xlsx(encabezados, lotes, nombre_hoja):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _RELS)
+        zf.writestr('xl/workbook.xml', _workbook(nombre_hoja))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _fila_xml(encabezados)
+            ).encode())
+            yield buffer.vaciar()
+
+            for filas in lotes:
+                hoja.write(''.join(_fila_xml(fila) for fila in filas).encode())
+                yield buffer.vaciar()
+
+            hoja.write(b'</sheetData></worksheet>')
+    yield buffer.vaciar()
+
+
+# ------------------------
+# Respuesta HTTP
+# ------------------------
+
+FORMATOS = ('csv', 'xlsx')
+
+
+def respuesta_exportacion(queryset, columnas, nombre, formato='csv'):
+    """
+    StreamingHttpResponse con ``queryset`` exportado según ``columnas``
+    [(encabezado, campo), ...]. ``nombre`` se usa para el archivo y la hoja.
+    """
+    encabezados = [encabezado for encabezado, _ in columnas]
+    lotes = filas_por_lotes(queryset, [campo for _, campo in columnas])
+    archivo = f"{nombre}_{timezone.localdate():%Y%m%d}.{formato}"
+
+    if formato == 'xlsx':
+        respuesta = StreamingHttpResponse(
+            _generar_xlsx(encabezados, lotes, nombre),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        respuesta = StreamingHttpResponse(
+            _generar_csv(encabezados, lotes),
+            content_type='text/csv; charset=utf-8',
+        )
+    respuesta['Content-Disposition'] = f'attachment; filename="{archivo}"'
+    # Que un proxy (nginx) no acumule la respuesta antes de reenviarla
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
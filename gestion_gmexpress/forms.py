@@ -1,12 +1,58 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
 from .models import (
     Vehiculo, Conductor, Cliente,
     Viaje, Pedido, Parada,
-    EstadoViaje, EstadoPedido, HistorialEstadoPedido,
 )
+from .catalogos import estados_pedido, estados_entrega, estados_viaje, estados_vehiculo
+
+
+# ------------------------
+# Campos sobre catálogos en memoria
+# ------------------------
+
+class CatalogoChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.catalogo.todos():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.catalogo.todos()) + (self.field.empty_label is not None)
+
+
+class CatalogoChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField que arma las opciones y valida contra un catálogo
+    en memoria (ver catalogos.py) en vez de consultar la base de datos.
+    """
+    iterator = CatalogoChoiceIterator
+
+    def __init__(self, catalogo, **kwargs):
+        self.catalogo = catalogo
+        super().__init__(queryset=catalogo.modelo.objects.none(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.catalogo.modelo):
+            return value
+        try:
+            return self.catalogo.por_id(value)
+        except self.catalogo.modelo.DoesNotExist:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
 
 
 class VehiculoForm(forms.ModelForm):
+    estado = CatalogoChoiceField(estados_vehiculo, label="Estado")
+
     class Meta:
         model = Vehiculo
         fields = [
@@ -16,6 +62,11 @@ class VehiculoForm(forms.ModelForm):
             'conductor_asignado',
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # str(Conductor) pasa por perfil y usuario: sin esto, 2 consultas por opción
+        self.fields['conductor_asignado'].queryset = Conductor.objects.select_related('usuario__user')
+
 
 class ConductorForm(forms.ModelForm):
     class Meta:
@@ -25,6 +76,10 @@ class ConductorForm(forms.ModelForm):
             'vencimiento_licencia', 'experiencia_meses',
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['usuario'].queryset = self.fields['usuario'].queryset.select_related('user')
+
 
 class ClienteForm(forms.ModelForm):
     class Meta:
@@ -33,14 +88,21 @@ class ClienteForm(forms.ModelForm):
 
 
 class ViajeForm(forms.ModelForm):
+    estado = CatalogoChoiceField(estados_viaje, label="Estado")
+
     class Meta:
         model = Viaje
         fields = [
             'nombre_ruta', 'tipo_ruta', 'origen', 'destino',
             'fecha_programada', 'hora_salida', 'hora_llegada_estimada',
             'vehiculo', 'conductor', 'estado',
-            'cantidad_cajas_total', 'observaciones',
+            'observaciones',
         ]
+        # cantidad_cajas_total se calcula a partir de las paradas (ver cajas.py)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['conductor'].queryset = Conductor.objects.select_related('usuario__user')
 
 
 class PedidoForm(forms.ModelForm):
@@ -52,6 +114,8 @@ class PedidoForm(forms.ModelForm):
             'direccion_entrega',
             'ciudad',
             'comuna',
+            'latitud',
+            'longitud',
             'fecha_entrega_solicitada',
             'instrucciones_especiales',
         ]
@@ -75,6 +139,8 @@ class PedidoForm(forms.ModelForm):
 
 
 class ParadaForm(forms.ModelForm):
+    estado_entrega = CatalogoChoiceField(estados_entrega, label="Estado entrega")
+
     class Meta:
         model = Parada
         fields = [
@@ -84,8 +150,14 @@ class ParadaForm(forms.ModelForm):
             'motivo_fallo', 'observaciones',
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['atendido_por'].queryset = Conductor.objects.select_related('usuario__user')
+
 
 class CambiarEstadoViajeForm(forms.ModelForm):
+    estado = CatalogoChoiceField(estados_viaje, label="Estado")
+
     class Meta:
         model = Viaje
         fields = ['estado', 'observaciones']
@@ -100,8 +172,8 @@ class CambiarEstadoViajeForm(forms.ModelForm):
 
 
 class CambiarEstadoPedidoForm(forms.Form):
-    nuevo_estado = forms.ModelChoiceField(
-        queryset=EstadoPedido.objects.all(),
+    nuevo_estado = CatalogoChoiceField(
+        estados_pedido,
         label="Nuevo estado",
     )
     comentario = forms.CharField(
@@ -120,4 +192,75 @@ class AsignarLogisticaPedidoForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['viaje'].widget.attrs.update({'class': 'form-select'})
\ No newline at end of file
+        self.fields['viaje'].widget.attrs.update({'class': 'form-select'})
+
+
+class AsignacionMasivaForm(forms.Form):
+    """
+    Selección de varios pedidos pendientes para agregarlos a un viaje.
+    """
+    pedidos = forms.ModelMultipleChoiceField(
+        queryset=Pedido.objects.none(),
+        widget=forms.CheckboxSelectMultiple,
+        label="Pedidos pendientes",
+    )
+
+    def __init__(self, *args, pendientes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if pendientes is not None:
+            self.fields['pedidos'].queryset = pendientes
+
+
+class DespachoForm(forms.Form):
+    fecha = forms.DateField(
+        label="Fecha de entrega",
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    optimizar = forms.BooleanField(
+        label="Optimizar el orden de las paradas",
+        required=False,
+    )
+
+
+class FiltroFechasForm(forms.Form):
+    """
+    Rango opcional para filtrar los listados (?desde=&hasta=).
+    """
+    desde = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    hasta = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned = super().clean()
+        desde, hasta = cleaned.get('desde'), cleaned.get('hasta')
+        if desde and hasta and hasta < desde:
+            raise forms.ValidationError("La fecha final no puede ser anterior a la inicial.")
+        return cleaned
+
+
+class ExportacionRangoForm(forms.Form):
+    desde = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    hasta = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    formato = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)')],
+        initial='csv',
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        desde, hasta = cleaned.get('desde'), cleaned.get('hasta')
+        if desde and hasta and hasta < desde:
+            raise forms.ValidationError("La fecha final no puede ser anterior a la inicial.")
+        return cleaned
+
+
+class ImportacionPedidosForm(forms.Form):
+    archivo = forms.FileField(
+        label="Archivo CSV o XLSX",
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Sube un archivo .csv o .xlsx.")
+        return archivo
@@ -0,0 +1,369 @@
+# gestion_gmexpress/hojas_ruta.py
+
+"""
+Hoja de ruta en DOCX (python-docx) por viaje, y en JSON para el teléfono
+del conductor.
+
+Los datos son los mismos de ``HojaRutaView`` y se leen con dos consultas
+para cualquier cantidad de viajes. El documento se arma en un pool de
+procesos (``GMEXPRESS_HOJAS_RUTA_PROCESOS``) para no ocupar la CPU del
+proceso web, y queda guardado en ``GMEXPRESS_HOJAS_RUTA_DIR``.
+
+Una request espera el documento a lo más ``GMEXPRESS_HOJAS_RUTA_ESPERA``
+segundos; si no alcanza se lanza ``HojaEnPreparacion`` y el proceso del
+pool termina de escribirlo igual, así que el reintento lo encuentra hecho.
+Si un proceso del pool muere, el pool se descarta y se reintenta una vez.
+
+El nombre del archivo incluye una huella del viaje: su
+``fecha_actualizacion``, la última de sus paradas y de sus pedidos, y la
+cantidad de paradas. Si algo cambia la huella cambia y el documento se
+vuelve a generar; si no, se sirve el archivo guardado. La misma huella es
+el ETag de la versión JSON: el teléfono consulta con ``If-None-Match`` y,
+si nada cambió, recibe un 304 tras una sola consulta.
+"""
+
+import hashlib
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from .documentos import guardar_hoja_ruta
+from .models import Viaje, Parada
+
+_pool = None
+# Reentrante: un future ya terminado corre su callback (que toma el lock) al registrarlo
+_pool_lock = threading.RLock()
+# Ruta -> future de los documentos que se están armando (sin duplicar trabajo)
+_en_curso = {}
+
+
+class HojaEnPreparacion(Exception):
+    """
+    El documento no estuvo listo dentro del tiempo de espera; se sigue
+    generando en el pool.
+    """
+
+
+def _directorio():
+    directorio = Path(getattr(
+        settings, 'GMEXPRESS_HOJAS_RUTA_DIR', Path(settings.BASE_DIR) / 'cache' / 'hojas_ruta'
+    ))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def _obtener_pool():
+    """
+    Pool compartido por el proceso web; se crea con la primera hoja.
+    Se usa "spawn" para no copiar al hijo las conexiones ni los hilos
+    del servidor; los hijos solo cargan documentos.py (no usan Django).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'GMEXPRESS_HOJAS_RUTA_PROCESOS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _en_curso.clear()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------
+# Datos
+# ------------------------
+
+def huellas(viaje_ids, queryset=None):
+    """
+    {viaje_id: huella} con una sola consulta agregada. ``queryset`` permite
+    restringir los viajes (p. ej. a los del conductor).
+    """
+    queryset = Viaje.objects.all() if queryset is None else queryset
+    filas = (
+        queryset
+        .filter(pk__in=viaje_ids)
+        .annotate(
+            n_paradas=Count('paradas'),
+            ult_parada=Max('paradas__fecha_actualizacion'),
+            ult_pedido=Max('paradas__pedido__fecha_actualizacion'),
+        )
+        .values_list('id', 'fecha_actualizacion', 'n_paradas', 'ult_parada', 'ult_pedido')
+    )
+    return {
+        fila[0]: hashlib.sha1(repr(fila).encode()).hexdigest()[:16]
+        for fila in filas
+    }
+
+
+def _nombre_conductor(conductor):
+    user = conductor.usuario.user
+    return user.get_full_name() or user.username
+
+
+def datos_hojas_ruta(viaje_ids):
+    """
+    {viaje_id: dict} con lo que muestra la hoja de ruta. Son datos simples
+    (se envían a los procesos del pool, ver documentos.py).
+    """
+    viajes = (
+        Viaje.objects
+        .filter(pk__in=viaje_ids)
+        .select_related('vehiculo', 'estado', 'conductor__usuario__user')
+    )
+    datos = {
+        v.pk: {
+            'id': v.pk,
+            'nombre_ruta': v.nombre_ruta,
+            'fecha': v.fecha_programada.strftime('%d/%m/%Y'),
+            'hora_salida': v.hora_salida.strftime('%H:%M') if v.hora_salida else '',
+            'vehiculo': v.vehiculo.placa,
+            'conductor': _nombre_conductor(v.conductor),
+            'estado': v.estado.nombre,
+            'origen': v.origen,
+            'destino': v.destino,
+            'total_cajas': v.cantidad_cajas_total,
+            'observaciones': v.observaciones,
+            'paradas': [],
+        }
+        for v in viajes
+    }
+    paradas = (
+        Parada.objects
+        .filter(viaje_id__in=datos)
+        .select_related('pedido', 'pedido__cliente', 'estado_entrega')
+        .order_by('viaje_id', 'secuencia')
+    )
+    for p in paradas:
+        datos[p.viaje_id]['paradas'].append({
+            'secuencia': p.secuencia,
+            'numero_pedido': p.pedido.numero_pedido,
+            'cliente': p.pedido.cliente.nombre,
+            'telefono': p.pedido.cliente.telefono,
+            'direccion': f"{p.pedido.direccion_entrega}, {p.pedido.comuna}",
+            'cajas': p.pedido.cantidad_cajas,
+            'instrucciones': p.pedido.instrucciones_especiales,
+            'estado': p.estado_entrega.nombre,
+        })
+    return datos
+
+
+def datos_ruta_json(viaje_id, desde=None):
+    """
+    Viaje y paradas para el teléfono del conductor. Con ``desde`` solo
+    vienen las paradas que cambiaron (la parada o su pedido) después de esa
+    hora, más la lista completa de ids para detectar las que se quitaron.
+    Si cambió el viaje se envían todas (``completo``).
+    """
+    viaje = (
+        Viaje.objects
+        .select_related('vehiculo', 'estado')
+        .get(pk=viaje_id)
+    )
+    completo = desde is None or viaje.fecha_actualizacion > desde
+
+    paradas = (
+        Parada.objects
+        .filter(viaje_id=viaje_id)
+        .select_related('pedido', 'pedido__cliente', 'estado_entrega')
+        .order_by('secuencia')
+    )
+    if not completo:
+        paradas = paradas.filter(
+            Q(fecha_actualizacion__gt=desde) | Q(pedido__fecha_actualizacion__gt=desde)
+        )
+    paradas = list(paradas)
+
+    datos = {
+        'viaje': {
+            'id': viaje.pk,
+            'nombre_ruta': viaje.nombre_ruta,
+            'fecha_programada': viaje.fecha_programada,
+            'hora_salida': viaje.hora_salida,
+            'estado': viaje.estado.nombre,
+            'vehiculo': viaje.vehiculo.placa,
+            'origen': viaje.origen,
+            'destino': viaje.destino,
+            'total_cajas': viaje.cantidad_cajas_total,
+            'observaciones': viaje.observaciones,
+        },
+        'completo': completo,
+        'paradas': [
+            {
+                'id': p.pk,
+                'secuencia': p.secuencia,
+                'estado_entrega': p.estado_entrega.nombre,
+                'estado_entrega_id': p.estado_entrega_id,
+                'motivo_fallo': p.motivo_fallo,
+                'observaciones': p.observaciones,
+                'hora_llegada_real': p.hora_llegada_real,
+                'pedido': {
+                    'id': p.pedido.pk,
+                    'numero_pedido': p.pedido.numero_pedido,
+                    'cliente': p.pedido.cliente.nombre,
+                    'telefono': p.pedido.cliente.telefono,
+                    'direccion': p.pedido.direccion_entrega,
+                    'comuna': p.pedido.comuna,
+                    'ciudad': p.pedido.ciudad,
+                    'cajas': p.pedido.cantidad_cajas,
+                    'instrucciones': p.pedido.instrucciones_especiales,
+                    'latitud': p.pedido.latitud,
+                    'longitud': p.pedido.longitud,
+                },
+            }
+            for p in paradas
+        ],
+    }
+    if completo:
+        datos['ids'] = [p.pk for p in paradas]
+    else:
+        datos['ids'] = list(
+            Parada.objects
+            .filter(viaje_id=viaje_id)
+            .order_by('secuencia')
+            .values_list('id', flat=True)
+        )
+    return datos
+
+
+# ------------------------
+# Caché en disco
+# ------------------------
+
+def _ruta(viaje_id, huella):
+    return _directorio() / f"viaje_{viaje_id}_{huella}.docx"
+
+
+def _limpiar_versiones(viaje_id, ruta):
+    # Quien ya abrió una versión vieja la sigue leyendo: borrar solo quita el nombre
+    for vieja in ruta.parent.glob(f"viaje_{viaje_id}_*.docx"):
+        if vieja != ruta:
+            vieja.unlink(missing_ok=True)
+
+
+def _enviar(pool, viaje_id, ruta, datos):
+    with _pool_lock:
+        futuro = _en_curso.get(ruta)
+        if futuro is None:
+            futuro = _en_curso[ruta] = pool.submit(guardar_hoja_ruta, datos, str(ruta))
+
+            def terminado(f):
+                with _pool_lock:
+                    if _en_curso.get(ruta) is f:
+                        del _en_curso[ruta]
+                if not f.cancelled() and f.exception() is None:
+                    _limpiar_versiones(viaje_id, ruta)
+
+            futuro.add_done_callback(terminado)
+        return futuro
+
+
+def _generar(faltantes, espera):
+    """
+    Manda a armar las hojas de ``faltantes`` ({viaje_id: ruta}) y espera a
+    lo más ``espera`` segundos. Si el pool se rompió (murió un proceso) se
+    crea otro y se reintenta una vez.
+    """
+    datos = datos_hojas_ruta(list(faltantes))
+    for intento in range(2):
+        pool = _obtener_pool()
+        try:
+            futuros = {
+                viaje_id: _enviar(pool, viaje_id, ruta, datos[viaje_id])
+                for viaje_id, ruta in faltantes.items() if viaje_id in datos
+            }
+            _, pendientes = wait(futuros.values(), timeout=espera)
+            if pendientes:
+                raise HojaEnPreparacion(f"{len(pendientes)} hojas de ruta en preparación.")
+            for viaje_id, futuro in futuros.items():
+                futuro.result()
+                # También lo hace el callback, pero puede correr después de wait()
+                _limpiar_versiones(viaje_id, faltantes[viaje_id])
+            return
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+            if intento:
+                raise
+
+
+def obtener_hojas(viaje_ids, espera=None):
+    """
+    {viaje_id: archivo DOCX abierto en modo binario}; quien llama los
+    cierra. Genera en paralelo solo las que no están en caché o quedaron
+    desactualizadas. Lanza HojaEnPreparacion si no alcanzan a estar.
+
+    Los archivos se abren aquí mismo: otra request puede borrar la versión
+    anterior en cualquier momento, pero un archivo abierto sigue legible.
+    """
+    if espera is None:
+        espera = getattr(settings, 'GMEXPRESS_HOJAS_RUTA_ESPERA', 10)
+    abiertos = {}
+    try:
+        pendientes = list(viaje_ids)
+        # Se reintenta lo que desapareció entre calcular la huella y abrir el
+        # archivo (la huella cambió o se acaba de generar otra versión)
+        for intento in range(3):
+            faltantes = {}
+            for viaje_id, huella in huellas(pendientes).items():
+                ruta = _ruta(viaje_id, huella)
+                try:
+                    abiertos[viaje_id] = open(ruta, 'rb')
+                except FileNotFoundError:
+                    faltantes[viaje_id] = ruta
+            if not faltantes:
+                break
+            if intento == 2:
+                raise HojaEnPreparacion("La hoja de ruta cambió mientras se generaba.")
+            _generar(faltantes, espera)
+            pendientes = list(faltantes)
+    except BaseException:
+        for archivo in abiertos.values():
+            archivo.close()
+        raise
+    return abiertos
+
+
+def obtener_hoja(viaje):
+    return obtener_hojas([viaje.pk])[viaje.pk]
+
+
+def nombre_archivo(viaje):
+    return f"hoja_ruta_{viaje.fecha_programada:%Y%m%d}_viaje_{viaje.pk}.docx"
+
+
+def zip_hojas(viajes):
+    """
+    Archivo temporal con un ZIP de las hojas de ruta de ``viajes``
+    (posicionado al inicio, listo para enviar).
+    """
+    archivos = obtener_hojas([v.pk for v in viajes])
+    salida = tempfile.TemporaryFile()
+    try:
+        # Los DOCX ya vienen comprimidos
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for viaje in viajes:
+                if viaje.pk in archivos:
+                    info = zipfile.ZipInfo(nombre_archivo(viaje), date_time=time.localtime()[:6])
+                    with zf.open(info, 'w') as destino:
+                        shutil.copyfileobj(archivos[viaje.pk], destino)
+    finally:
+        for archivo in archivos.values():
+            archivo.close()
+    salida.seek(0)
+    return salida
@@ -0,0 +1,382 @@
+# gestion_gmexpress/importacion.py
+
+"""
+Importación masiva de pedidos desde CSV o XLSX.
+
+1. El archivo se lee como flujo: el CSV con ``csv.reader`` y el XLSX con
+   ``lxml.etree.iterparse`` sobre la hoja, liberando cada fila ya leída.
+2. Todas las filas se validan en una sola pasada en memoria; el tipo de
+   servicio se resuelve contra el catálogo cacheado (ver catalogos.py).
+3. Si no hay errores se reserva de una vez el bloque de números de pedido,
+   se calcula ``monto_total`` y se hace ``bulk_create`` por lotes dentro de
+   una transacción. Si hay errores no se guarda nada y se devuelve el
+   detalle por fila.
+
+Como ``bulk_create`` no dispara señales, aquí se actualizan a mano los
+contadores del dashboard y la marca de versión de Pedido (ver
+condicional.py), de la que dependen también las pestañas del listado.
+"""
+
+import codecs
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from lxml import etree
+
+from . import condicional, contadores
+from .catalogos import estados_pedido, tipos_servicio
+from .models import Pedido
+from .secuencias import reservar_numeros_pedido
+
+TAMANO_LOTE = 1000
+
+# Campo -> nombres de columna aceptados (normalizados, ver _normalizar)
+COLUMNAS = {
+    'tipo_servicio': ('tipo_servicio', 'tipo de servicio', 'servicio'),
+    'cantidad_cajas': ('cantidad_cajas', 'cantidad de raciones', 'raciones', 'cantidad', 'cajas'),
+    'direccion_entrega': ('direccion_entrega', 'direccion de entrega', 'direccion'),
+    'ciudad': ('ciudad',),
+    'comuna': ('comuna',),
+    'fecha_entrega_solicitada': ('fecha_entrega_solicitada', 'fecha del servicio',
+                                 'fecha servicio', 'fecha de entrega', 'fecha'),
+    'instrucciones_especiales': ('instrucciones_especiales', 'instrucciones especiales',
+                                 'instrucciones'),
+    'latitud': ('latitud', 'lat'),
+    'longitud': ('longitud', 'lng', 'lon'),
+}
+OBLIGATORIAS = ('tipo_servicio', 'cantidad_cajas', 'direccion_entrega', 'ciudad', 'comuna')
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y')
+# Día 0 de las fechas seriales de Excel
+EPOCA_EXCEL = date(1899, 12, 30)
+
+ErrorFila = namedtuple('ErrorFila', ['fila', 'columna', 'mensaje'])
+ResultadoImportacion = namedtuple('ResultadoImportacion', ['filas', 'creados', 'errores'])
+
+
+class ArchivoInvalido(Exception):
+    """
+    El archivo no se puede leer o no trae las columnas obligatorias.
+    """
+
+
+def _max_filas():
+    return getattr(settings, 'GMEXPRESS_IMPORTACION_MAX_FILAS', 20000)
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.replace('_', ' ').split()).casefold()
+
+
+_ALIAS = {
+    _normalizar(alias): campo
+    for campo, aliases in COLUMNAS.items()
+    for alias in aliases
+}
+
+
+# ------------------------
+# Lectura
+# ------------------------
+
+def _codificacion(archivo):
+    """
+    UTF-8 (con o sin BOM) si todo el archivo lo es; si no, cp1252, que es
+    como Excel en Windows guarda "CSV (delimitado por comas)". Se recorre
+    el archivo entero por bloques: un byte inválido puede estar en la
+    última fila.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while bloque := archivo.read(1 << 20):
+            decodificador.decode(bloque)
+        decodificador.decode(b'', final=True)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp1252'
+    finally:
+        archivo.seek(0)
+
+
+def _filas_csv(archivo):
+    texto = io.TextIOWrapper(archivo, encoding=_codificacion(archivo), newline='')
+    try:
+        primera = texto.readline()
+        # Excel en español guarda los CSV con ';'
+        delimitador = ';' if primera.count(';') > primera.count(',') else ','
+        yield next(csv.reader([primera], delimiter=delimitador), [])
+        yield from csv.reader(texto, delimiter=delimitador)
+    except (UnicodeDecodeError, csv.Error):
+        raise ArchivoInvalido("No se pudo leer el CSV: guárdalo como UTF-8 o CSV de Excel.")
+
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+def _columna(referencia):
+    """
+    'C12' -> 2
+    """
+    indice = 0
+    for letra in re.match(r'[A-Z]+', referencia).group():
+        indice = indice * 26 + ord(letra) - 64
+    return indice - 1
+
+
+def _textos_compartidos(zf):
+    try:
+        origen = zf.open('xl/sharedStrings.xml')
+    except KeyError:
+        return []
+    textos = []
+    with origen:
+        for _, si in etree.iterparse(origen, tag=f'{_NS}si'):
+            textos.append(''.join(si.itertext()))
+            si.clear()
+    return textos
+
+
+def _primera_hoja(zf):
+    libro = etree.fromstring(zf.read('xl/workbook.xml'))
+    hoja = libro.find(f'{_NS}sheets/{_NS}sheet')
+    rel_id = hoja.get(f'{_NS_REL}id')
+    rels = etree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels:
+        if rel.get('Id') == rel_id:
+            destino = rel.get('Target').lstrip('/')
+            return destino if destino.startswith('xl/') else f'xl/{destino}'
+    raise ArchivoInvalido("El libro no tiene hojas.")
+
+
+def _filas_xlsx(archivo):
+    try:
+        zf = zipfile.ZipFile(archivo)
+        compartidos = _textos_compartidos(zf)
+        ruta_hoja = _primera_hoja(zf)
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        raise ArchivoInvalido("El archivo no es un XLSX válido.")
+
+    try:
+        yield from _leer_hoja(zf, ruta_hoja, compartidos)
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError, IndexError, ValueError):
+        # Hoja cortada, XML dañado o un índice de texto compartido que no existe
+        raise ArchivoInvalido("El archivo no es un XLSX válido.")
+
+
+def _leer_hoja(zf, ruta_hoja, compartidos):
+    with zf, zf.open(ruta_hoja) as hoja:
+        for _, fila in etree.iterparse(hoja, tag=f'{_NS}row'):
+            valores = []
+            for celda in fila.iterchildren(f'{_NS}c'):
+                referencia = celda.get('r')
+                if referencia:
+                    faltan = _columna(referencia) - len(valores)
+                    valores.extend([''] * max(faltan, 0))
+                tipo = celda.get('t')
+                if tipo == 'inlineStr':
+                    valor = ''.join(celda.find(f'{_NS}is').itertext())
+                else:
+                    v = celda.find(f'{_NS}v')
+                    valor = v.text if v is not None and v.text is not None else ''
+                    if tipo == 's' and valor:
+                        valor = compartidos[int(valor)]
+                valores.append(valor)
+            fila.clear()
+            # Libera también las filas hermanas ya procesadas
+            while fila.getprevious() is not None:
+                del fila.getparent()[0]
+            yield valores
+
+
+def leer_filas(archivo, nombre):
+    """
+    Generador de filas (listas de strings) del archivo; la primera es el
+    encabezado.
+    """
+    if nombre.lower().endswith('.xlsx'):
+        return _filas_xlsx(archivo)
+    if nombre.lower().endswith('.csv'):
+        return _filas_csv(archivo)
+    raise ArchivoInvalido("Formato no soportado: sube un archivo .csv o .xlsx.")
+
+
+# ------------------------
+# Validación
+# ------------------------
+
+def _fecha(valor):
+    valor = valor.strip()
+    if re.fullmatch(r'\d+(\.0+)?', valor):
+        # Fecha serial de Excel (celda con formato fecha)
+        return EPOCA_EXCEL + timedelta(days=int(float(valor)))
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor[:10], formato).date()
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def _coordenada(valor, limite):
+    numero = Decimal(valor.strip().replace(',', '.'))
+    if abs(numero) > limite:
+        raise InvalidOperation
+    return numero.quantize(Decimal('0.000001'))
+
+
+def _mapear_encabezado(encabezado):
+    indices = {}
+    for i, titulo in enumerate(encabezado):
+        campo = _ALIAS.get(_normalizar(titulo))
+        if campo and campo not in indices:
+            indices[campo] = i
+    faltantes = [c for c in OBLIGATORIAS if c not in indices]
+    if faltantes:
+        raise ArchivoInvalido(
+            "Faltan columnas obligatorias: " + ", ".join(faltantes) + "."
+        )
+    return indices
+
+
+def validar_filas(filas):
+    """
+    Valida todas las filas (sin el encabezado ya consumido por el llamador).
+    Devuelve (pedidos_sin_guardar, errores, cantidad_de_filas).
+    """
+    por_nombre = {
+        _normalizar(t.nombre): t for t in tipos_servicio.todos() if t.activo
+    }
+    hoy = timezone.localdate()
+    max_filas = _max_filas()
+    pedidos, errores = [], []
+    n = 0
+    indices = None
+
+    for numero, fila in enumerate(filas, start=1):
+        if indices is None:
+            indices = _mapear_encabezado(fila)
+            continue
+        if not any(str(v).strip() for v in fila):
+            continue
+        n += 1
+        if n > max_filas:
+            raise ArchivoInvalido(f"El archivo supera el máximo de {max_filas} filas.")
+
+        def valor(campo):
+            i = indices.get(campo)
+            return str(fila[i]).strip() if i is not None and i < len(fila) else ''
+
+        datos, errores_fila = {}, []
+        for campo in OBLIGATORIAS:
+            if not valor(campo):
+                errores_fila.append(ErrorFila(numero, campo, "Campo obligatorio."))
+
+        texto = valor('tipo_servicio')
+        if texto:
+            tipo = por_nombre.get(_normalizar(texto))
+            if tipo is None:
+                errores_fila.append(ErrorFila(numero, 'tipo_servicio', f"Servicio desconocido: {texto}."))
+            datos['tipo_servicio'] = tipo
+
+        texto = valor('cantidad_cajas')
+        if texto:
+            try:
+                numero_cajas = Decimal(texto.replace(',', '.'))
+                # "2.0" (celda numérica del XLSX) vale; "2.5" no se redondea
+                if not numero_cajas.is_finite() or numero_cajas != numero_cajas.to_integral_value():
+                    raise ValueError
+                cantidad = int(numero_cajas)
+                if cantidad <= 0:
+                    raise ValueError
+                datos['cantidad_cajas'] = cantidad
+            except (ValueError, InvalidOperation):
+                errores_fila.append(ErrorFila(numero, 'cantidad_cajas', "Debe ser un entero mayor que 0."))
+
+        for campo, largo in (('ciudad', 100), ('comuna', 100)):
+            if len(valor(campo)) > largo:
+                errores_fila.append(ErrorFila(numero, campo, f"Máximo {largo} caracteres."))
+            datos[campo] = valor(campo)
+        datos['direccion_entrega'] = valor('direccion_entrega')
+        datos['instrucciones_especiales'] = valor('instrucciones_especiales')
+
+        texto = valor('fecha_entrega_solicitada')
+        datos['fecha_entrega_solicitada'] = None
+        if texto:
+            try:
+                fecha = _fecha(texto)
+                if fecha < hoy:
+                    errores_fila.append(ErrorFila(numero, 'fecha_entrega_solicitada', "La fecha ya pasó."))
+                datos['fecha_entrega_solicitada'] = fecha
+            except (ValueError, OverflowError):
+                errores_fila.append(ErrorFila(
+                    numero, 'fecha_entrega_solicitada', "Fecha inválida (use AAAA-MM-DD o DD-MM-AAAA)."
+                ))
+
+        for campo, limite in (('latitud', 90), ('longitud', 180)):
+            texto = valor(campo)
+            datos[campo] = None
+            if texto:
+                try:
+                    datos[campo] = _coordenada(texto, limite)
+                except InvalidOperation:
+                    errores_fila.append(ErrorFila(numero, campo, "Coordenada inválida."))
+
+        if errores_fila:
+            errores.extend(errores_fila)
+        elif not errores:
+            # Con el primer error ya no se guardará nada: solo se sigue validando
+            pedidos.append(datos)
+
+    if indices is None:
+        raise ArchivoInvalido("El archivo está vacío.")
+    return pedidos, errores, n
+
+
+# ------------------------
+# Importación
+# ------------------------
+
+def importar_pedidos(archivo, nombre, cliente):
+    """
+    Importa los pedidos del archivo para ``cliente``. Todo o nada: si alguna
+    fila tiene errores no se crea ningún pedido.
+
+    Devuelve ResultadoImportacion(filas, creados, errores).
+    """
+    datos, errores, n = validar_filas(leer_filas(archivo, nombre))
+    if errores or not datos:
+        return ResultadoImportacion(n, 0, errores)
+
+    estado = estados_pedido.por_nombre('PENDIENTE_ASIGNACION')
+    # Fuera de la transacción: el bloqueo de la secuencia dura poco
+    numeros = reservar_numeros_pedido(len(datos))
+
+    pedidos = [
+        Pedido(
+            numero_pedido=numero,
+            cliente=cliente,
+            estado=estado,
+            monto_total=d['cantidad_cajas'] * d['tipo_servicio'].precio_por_racion,
+            **d,
+        )
+        for numero, d in zip(numeros, datos)
+    ]
+
+    with transaction.atomic():
+        Pedido.objects.bulk_create(pedidos, batch_size=TAMANO_LOTE)
+        contadores.incrementar(contadores.TOTAL_PEDIDOS, len(pedidos))
+        contadores.incrementar(contadores.PEDIDOS_PENDIENTES, len(pedidos))
+        condicional.cambiar(Pedido)
+
+    return ResultadoImportacion(n, len(pedidos), [])
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_gmexpress.despacho import planificar, ejecutar_plan
+
+
+class Command(BaseCommand):
+    help = 'Reparte en viajes los pedidos pendientes de una fecha según la capacidad de los vehículos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha', type=date.fromisoformat,
+            help='Fecha de entrega a despachar (AAAA-MM-DD, por defecto mañana)',
+        )
+        parser.add_argument(
+            '--usuario', required=True,
+            help='Usuario que figura como creador de los viajes nuevos',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo muestra el plan, sin crear viajes ni asignar pedidos',
+        )
+        parser.add_argument(
+            '--optimizar', action='store_true',
+            help='Optimiza el orden de las paradas de cada viaje al terminar',
+        )
+
+    def handle(self, *args, **options):
+        fecha = options['fecha'] or date.today() + timedelta(days=1)
+        try:
+            perfil = User.objects.get(username=options['usuario']).perfil
+        except (User.DoesNotExist, User.perfil.RelatedObjectDoesNotExist):
+            raise CommandError(f"El usuario {options['usuario']!r} no existe o no tiene perfil.")
+
+        self.stdout.write(f"Planificando despacho del {fecha:%d-%m-%Y}...")
+        try:
+            plan = planificar(fecha)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for fila in plan.utilizacion():
+            viaje = 'nuevo' if fila['nuevo'] else f"#{fila['viaje_id']}"
+            self.stdout.write(
+                f"  {fila['placa']:<10} {viaje:<8} {fila['comuna']:<20} "
+                f"{fila['pedidos']:>4} pedidos  "
+                f"{fila['cajas_previas'] + fila['cajas_nuevas']:>5}/{fila['capacidad']:<5} "
+                f"({fila['utilizacion']}%)"
+            )
+        if plan.sin_asignar:
+            self.stdout.write(self.style.WARNING(
+                f"{len(plan.sin_asignar)} pedidos no caben en los vehículos disponibles."
+            ))
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"Plan: {plan.total_pedidos} pedidos en {len(plan.cargas_usadas)} viajes "
+                f"({plan.viajes_nuevos} nuevos). No se guardó nada (--dry-run)."
+            )
+            return
+
+        try:
+            asignados = ejecutar_plan(plan, perfil, optimizar=options['optimizar'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {asignados} pedidos asignados en {len(plan.cargas_usadas)} viajes "
+            f"({plan.viajes_nuevos} nuevos)."
+        ))
@@ -0,0 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from gestion_gmexpress.notificaciones import trabajar
+from gestion_gmexpress.procesos import llamar
+
+
+class Command(BaseCommand):
+    help = 'Envía las notificaciones EMAIL / SMS pendientes de la bandeja de salida'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos', type=int, default=1,
+            help='Procesos que envían en paralelo (por defecto 1)',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=100,
+            help='Envíos que toma cada proceso por vez (por defecto 100)',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera cuando la bandeja está vacía (por defecto 5)',
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Vacía la bandeja y termina, en vez de quedar esperando',
+        )
+
+    def handle(self, *args, **options):
+        if options['procesos'] < 1 or options['lote'] < 1:
+            raise CommandError("--procesos y --lote deben ser mayores que 0.")
+        if options['procesos'] > 1 and not connection.features.has_select_for_update_skip_locked:
+            # Sin SKIP LOCKED los procesos tomarían los mismos envíos
+            raise CommandError(
+                f"{connection.vendor} no soporta SELECT ... FOR UPDATE SKIP LOCKED: usa --procesos 1."
+            )
+        argumentos = (options['lote'], options['intervalo'], options['una_vez'])
+        inicio = time.monotonic()
+
+        self.stdout.write(f"Enviando notificaciones con {options['procesos']} procesos...")
+        try:
+            if options['procesos'] == 1:
+                total = trabajar(*argumentos)
+            else:
+                # Los hijos no pueden heredar conexiones abiertas del padre
+                connections.close_all()
+                tarea = partial(llamar, 'gestion_gmexpress.notificaciones._trabajar_proceso', *argumentos)
+                with ProcessPoolExecutor(max_workers=options['procesos']) as pool:
+                    futuros = [pool.submit(tarea) for _ in range(options['procesos'])]
+                    total = sum(f.result() for f in futuros)
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {total} envíos procesados en {time.monotonic() - inicio:.1f} s."
+        ))
@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from gestion_gmexpress.models import TipoRuta
+from gestion_gmexpress.sinteticos import (
+    Parametros, crear_maestros, generar_historia, preparar_catalogos, reconstruir_derivados,
+)
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos a escala (clientes, flota, pedidos, viajes e historial) para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=50, help='Clientes nuevos (por defecto 50)')
+        parser.add_argument('--conductores', type=int, default=10, help='Conductores nuevos (por defecto 10)')
+        parser.add_argument('--vehiculos', type=int, default=10, help='Vehículos nuevos (por defecto 10)')
+        parser.add_argument(
+            '--dias', type=int, default=30,
+            help='Días de historia hasta hoy inclusive (por defecto 30)',
+        )
+        parser.add_argument(
+            '--pedidos-por-dia', type=int, default=200,
+            help='Pedidos de un día hábil; sábado y domingo tienen menos (por defecto 200)',
+        )
+        parser.add_argument(
+            '--paradas-por-viaje', type=int, default=15,
+            help='Paradas de cada viaje (por defecto 15)',
+        )
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla de los datos (por defecto 42)')
+        parser.add_argument(
+            '--password', default='password123',
+            help='Contraseña de todos los usuarios generados (por defecto password123)',
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo para la historia (por defecto uno por CPU)',
+        )
+        parser.add_argument(
+            '--dias-por-lote', type=int, default=7,
+            help='Días que genera cada proceso por vez (por defecto 7)',
+        )
+
+    def handle(self, *args, **options):
+        for opcion in ('clientes', 'conductores', 'vehiculos', 'dias', 'paradas_por_viaje', 'dias_por_lote'):
+            if options[opcion] < 1:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser mayor que 0.")
+        if options['pedidos_por_dia'] < 0:
+            raise CommandError("--pedidos-por-dia no puede ser negativo.")
+
+        procesos = options['procesos']
+        if procesos > 1 and connection.vendor == 'sqlite':
+            # SQLite admite un solo escritor: los procesos se bloquearían entre sí
+            self.stdout.write(self.style.WARNING("SQLite no admite escrituras en paralelo: se usa 1 proceso."))
+            procesos = 1
+
+        inicio = time.monotonic()
+        hasta = timezone.localdate()
+        desde = hasta - timedelta(days=options['dias'] - 1)
+
+        self.stdout.write("Creando catálogos y maestros...")
+        preparar_catalogos()
+        clientes, conductores, vehiculos, admin = crear_maestros(
+            options['semilla'], options['clientes'], options['conductores'],
+            options['vehiculos'], options['password'],
+        )
+
+        self.stdout.write(
+            f"Generando pedidos del {desde} al {hasta} con {procesos} procesos..."
+        )
+        pedidos, paradas, historial = generar_historia(
+            desde, hasta,
+            Parametros(
+                semilla=options['semilla'],
+                pedidos_por_dia=options['pedidos_por_dia'],
+                paradas_por_viaje=options['paradas_por_viaje'],
+                clientes=clientes, conductores=conductores, vehiculos=vehiculos,
+                creado_por=admin, tipo_ruta=TipoRuta.objects.get(nombre='URBANA').pk,
+            ),
+            procesos=procesos,
+            dias_por_lote=options['dias_por_lote'],
+        )
+
+        self.stdout.write("Reconstruyendo contadores, reportes y cachés...")
+        reconstruir_derivados(desde, procesos=procesos)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {pedidos} pedidos, {paradas} paradas y {historial} cambios de estado "
+            f"en {time.monotonic() - inicio:.1f} s. Usuarios sint_* con contraseña {options['password']}."
+        ))
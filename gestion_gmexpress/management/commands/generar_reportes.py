@@ -0,0 +1,61 @@
+from datetime import date, timedelta
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_gmexpress.reportes import generar_reportes, generar_rango
+
+
+class Command(BaseCommand):
+    help = 'Genera (o regenera) los reportes diarios de viajes y entregas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha', type=date.fromisoformat,
+            help='Día a generar (AAAA-MM-DD, por defecto ayer)',
+        )
+        parser.add_argument(
+            '--desde', type=date.fromisoformat,
+            help='Inicio del rango a rellenar (AAAA-MM-DD)',
+        )
+        parser.add_argument(
+            '--hasta', type=date.fromisoformat,
+            help='Fin del rango a rellenar (AAAA-MM-DD, por defecto ayer)',
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo para el rango (por defecto uno por CPU)',
+        )
+        parser.add_argument(
+            '--dias-por-lote', type=int, default=31,
+            help='Días que calcula cada proceso por vez (por defecto 31)',
+        )
+
+    def handle(self, *args, **options):
+        ayer = date.today() - timedelta(days=1)
+        inicio = time.monotonic()
+
+        if options['desde']:
+            hasta = options['hasta'] or ayer
+            if hasta < options['desde']:
+                raise CommandError("--hasta no puede ser anterior a --desde.")
+            if options['dias_por_lote'] < 1:
+                raise CommandError("--dias-por-lote debe ser mayor que 0.")
+            self.stdout.write(
+                f"Generando reportes del {options['desde']} al {hasta} "
+                f"con {options['procesos']} procesos..."
+            )
+            dias = generar_rango(
+                options['desde'], hasta,
+                procesos=options['procesos'],
+                dias_por_lote=options['dias_por_lote'],
+            )
+        else:
+            fecha = options['fecha'] or ayer
+            self.stdout.write(f"Generando reporte del {fecha}...")
+            dias = generar_reportes(fecha)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {dias} días en {time.monotonic() - inicio:.1f} s."
+        ))
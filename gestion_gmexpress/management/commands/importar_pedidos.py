@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_gmexpress.importacion import ArchivoInvalido, importar_pedidos
+from gestion_gmexpress.models import Cliente
+
+
+class Command(BaseCommand):
+    help = 'Importa pedidos de un cliente desde un archivo CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx')
+        parser.add_argument(
+            '--cliente', type=int, required=True,
+            help='ID del cliente dueño de los pedidos',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cliente = Cliente.objects.get(pk=options['cliente'])
+        except Cliente.DoesNotExist:
+            raise CommandError(f"No existe el cliente {options['cliente']}.")
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_pedidos(archivo, options['archivo'], cliente)
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir el archivo: {e}")
+        except ArchivoInvalido as e:
+            raise CommandError(str(e))
+
+        if resultado.errores:
+            for error in resultado.errores:
+                self.stderr.write(f"  fila {error.fila}, {error.columna}: {error.mensaje}")
+            raise CommandError(
+                f"{len(resultado.errores)} errores en {resultado.filas} filas; no se importó nada."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {resultado.creados} pedidos importados para {cliente.nombre}."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gestion_gmexpress import bandeja, contadores
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero los contadores del dashboard y de notificaciones no leídas'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Recalculando contadores...")
+        cantidad = contadores.recalcular_todos()
+        self.stdout.write(self.style.SUCCESS(f"Contadores recalculados: {cantidad} claves."))
+        perfiles = bandeja.recalcular_no_leidas()
+        self.stdout.write(self.style.SUCCESS(f"Notificaciones no leídas: {perfiles} perfiles."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from gestion_gmexpress.cajas import reparar_cajas
+
+
+class Command(BaseCommand):
+    help = 'Corrige Viaje.cantidad_cajas_total según la suma real de sus paradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de ids de viaje revisados por consulta (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Revisando totales de cajas por viaje...")
+        lotes, reparados = reparar_cajas(tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {lotes} lotes revisados, {reparados} viajes corregidos."
+        ))
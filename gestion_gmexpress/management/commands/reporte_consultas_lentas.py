@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import datetime, time as dtime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion_gmexpress.consultas_lentas import archivo, leer
+
+ORDENES = {
+    'total': lambda g: g['total_ms'],
+    'maximo': lambda g: g['max_ms'],
+    'cantidad': lambda g: g['cantidad'],
+}
+# Columnas del EXPLAIN que no ayudan a leer el plan
+COLUMNAS_OMITIDAS = {'id', 'parent', 'notused', 'partitions', 'key_len', 'select_type'}
+
+
+def _fecha(valor):
+    try:
+        momento = datetime.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (AAAA-MM-DD o AAAA-MM-DDTHH:MM)")
+    if len(valor) == 10:
+        momento = datetime.combine(momento.date(), dtime.min)
+    return timezone.make_aware(momento) if timezone.is_naive(momento) else momento
+
+
+class Command(BaseCommand):
+    help = 'Resume el registro de consultas lentas agrupando por huella de SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archivo',
+            help='Registro a leer (por defecto GMEXPRESS_CONSULTAS_LENTAS_ARCHIVO)',
+        )
+        parser.add_argument(
+            '--desde', type=_fecha,
+            help='Solo consultas desde este momento (AAAA-MM-DD o AAAA-MM-DDTHH:MM)',
+        )
+        parser.add_argument('--origen', help='Solo las de esta vista o comando (p. ej. pedido-list)')
+        parser.add_argument(
+            '--orden', choices=sorted(ORDENES), default='total',
+            help='Criterio para elegir las peores (por defecto tiempo total)',
+        )
+        parser.add_argument('--limite', type=int, default=15, help='Cuántas huellas mostrar')
+        parser.add_argument('--sin-planes', action='store_true', help='No mostrar los EXPLAIN')
+
+    def handle(self, *args, **options):
+        ruta = options['archivo'] or archivo()
+        grupos = {}
+        for entrada in leer(ruta):
+            if options['desde'] and datetime.fromisoformat(entrada['momento']) < options['desde']:
+                continue
+            if options['origen'] and entrada['origen'] != options['origen']:
+                continue
+            grupo = grupos.setdefault(entrada['huella'], {
+                'cantidad': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'origenes': Counter(), 'ubicaciones': Counter(), 'plan': None,
+            })
+            grupo['cantidad'] += 1
+            grupo['total_ms'] += entrada['ms']
+            grupo['origenes'][entrada['origen']] += 1
+            if entrada['ubicacion']:
+                grupo['ubicaciones'][entrada['ubicacion'][0]] += 1
+            if entrada['ms'] >= grupo['max_ms']:
+                grupo['max_ms'] = entrada['ms']
+                grupo['ejemplo'] = entrada
+            if entrada['plan']:
+                grupo['plan'] = (entrada['momento'], entrada['motor'], entrada['plan'])
+
+        if not grupos:
+            self.stdout.write(f"No hay consultas lentas registradas en {ruta}.")
+            return
+
+        peores = sorted(grupos.items(), key=lambda par: ORDENES[options['orden']](par[1]), reverse=True)
+        total = sum(g['cantidad'] for g in grupos.values())
+        self.stdout.write(f"{total} consultas lentas en {len(grupos)} huellas distintas ({ruta}).\n")
+        for posicion, (clave, grupo) in enumerate(peores[:options['limite']], start=1):
+            self._escribir_grupo(posicion, clave, grupo, not options['sin_planes'])
+
+    def _escribir_grupo(self, posicion, clave, grupo, con_plan):
+        ejemplo = grupo['ejemplo']
+        self.stdout.write(self.style.WARNING(
+            f"{posicion}. {grupo['cantidad']} {'vez' if grupo['cantidad'] == 1 else 'veces'} · total {grupo['total_ms'] / 1000:.2f} s · "
+            f"promedio {grupo['total_ms'] / grupo['cantidad']:.0f} ms · máximo {grupo['max_ms']:.0f} ms"
+        ))
+        self.stdout.write("   Origen: " + ", ".join(f"{o} ({n})" for o, n in grupo['origenes'].most_common(5)))
+        for ubicacion, n in grupo['ubicaciones'].most_common(3):
+            self.stdout.write(f"   En: {ubicacion} ({n})")
+        self.stdout.write(f"   Huella: {clave}")
+        if ejemplo.get('parametros') is not None:
+            self.stdout.write(f"   Parámetros de la más lenta: {ejemplo['parametros']}")
+        if con_plan:
+            if grupo['plan'] is None:
+                self.stdout.write("   Plan: sin EXPLAIN registrado")
+            else:
+                momento, motor, plan = grupo['plan']
+                self.stdout.write(f"   Plan ({motor}, {momento}):")
+                for fila in plan:
+                    self.stdout.write("     " + "  ".join(
+                        f"{columna}={valor}" for columna, valor in fila.items()
+                        if valor is not None and columna.lower() not in COLUMNAS_OMITIDAS
+                    ))
+        self.stdout.write("")
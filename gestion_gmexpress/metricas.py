@@ -0,0 +1,367 @@
+# gestion_gmexpress/metricas.py
+
+"""
+Métricas de requests y SQL por vista, en formato Prometheus.
+
+``MetricasMiddleware`` mide cada request y la etiqueta con el nombre de la
+ruta resuelta (``pedido-list``, ``hoja-ruta``...), el método y la clase
+del código de respuesta:
+
+- latencia y tamaño de la respuesta (histogramas) y cantidad de requests;
+- consultas SQL y tiempo en SQL (histogramas), con un ``execute_wrapper``
+  sobre las conexiones que solo suma un contador y un tiempo por consulta.
+
+Para que el costo quede bajo el 1 % hay dos tasas de muestreo:
+``GMEXPRESS_METRICAS_MUESTREO`` (requests medidas) y
+``GMEXPRESS_METRICAS_MUESTREO_SQL`` (de esas, cuántas instrumentan SQL).
+Los histogramas de SQL tienen su propio ``_count``: los promedios y
+percentiles siguen siendo correctos aunque se muestree.
+
+Cada proceso acumula en memoria y cada ``GMEXPRESS_METRICAS_INTERVALO``
+segundos vuelca su estado a ``<pid>.json`` en
+``GMEXPRESS_METRICAS_DIRECTORIO`` (por defecto en /dev/shm, memoria
+compartida). ``/metricas/`` suma los archivos de todos los workers. Los de
+procesos terminados se conservan para que los contadores no retrocedan;
+conviene vaciar el directorio al reiniciar el servicio.
+"""
+
+import atexit
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+BUCKETS = {
+    'gmexpress_solicitud_duracion_segundos': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'gmexpress_solicitud_consultas_sql': (1, 2, 5, 10, 20, 50, 100, 200, 500),
+    'gmexpress_solicitud_sql_segundos': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    'gmexpress_respuesta_bytes': (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000),
+}
+AYUDA = {
+    'gmexpress_solicitudes_total': 'Requests atendidas',
+    'gmexpress_solicitud_duracion_segundos': 'Latencia hasta entregar la respuesta',
+    'gmexpress_solicitud_consultas_sql': 'Consultas SQL por request (muestreado)',
+    'gmexpress_solicitud_sql_segundos': 'Tiempo en SQL por request (muestreado)',
+    'gmexpress_respuesta_bytes': 'Tamaño del cuerpo de la respuesta (sin streaming)',
+}
+ETIQUETAS = ('vista', 'metodo')
+SIN_RUTA = '<sin_ruta>'
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def directorio():
+    defecto = Path('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()) / 'gmexpress-metricas'
+    return Path(_config('GMEXPRESS_METRICAS_DIRECTORIO', defecto))
+
+
+# ------------------------
+# Registro por proceso
+# ------------------------
+
+class Registro:
+    """
+    Acumula las series de este proceso. Cada serie es una lista:
+    [cuenta] para contadores, [bucket_1, ..., bucket_n, suma, cuenta] para
+    histogramas (buckets no acumulados). La clave es "metrica|v1|v2...".
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.pid = os.getpid()
+        self.series = {}
+        self.ultimo_volcado = time.monotonic()
+
+    def _revisar_fork(self):
+        # Un worker creado con fork hereda las series del padre: no son suyas
+        if os.getpid() != self.pid:
+            self._reiniciar()
+
+    def contar(self, metrica, etiquetas):
+        clave = '|'.join((metrica,) + etiquetas)
+        with self._lock:
+            self._revisar_fork()
+            serie = self.series.get(clave)
+            if serie is None:
+                self.series[clave] = [1]
+            else:
+                serie[0] += 1
+
+    def observar(self, metrica, etiquetas, valor):
+        limites = BUCKETS[metrica]
+        clave = '|'.join((metrica,) + etiquetas)
+        with self._lock:
+            self._revisar_fork()
+            serie = self.series.get(clave)
+            if serie is None:
+                serie = self.series[clave] = [0] * (len(limites) + 3)
+            # El último bucket (índice len(limites)) es +Inf
+            serie[bisect_left(limites, valor)] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def volcar(self, forzar=False):
+        """
+        Escribe ``<pid>.json`` si pasó el intervalo (o si ``forzar``).
+        La escritura es atómica: quien lee nunca ve un archivo a medias.
+        """
+        ahora = time.monotonic()
+        if not forzar and ahora - self.ultimo_volcado < _config('GMEXPRESS_METRICAS_INTERVALO', 5):
+            return
+        with self._lock:
+            self._revisar_fork()
+            self.ultimo_volcado = ahora
+            contenido = json.dumps(self.series)
+        carpeta = directorio()
+        carpeta.mkdir(parents=True, exist_ok=True)
+        temporal = carpeta / f'.{self.pid}.tmp'
+        temporal.write_text(contenido, encoding='utf-8')
+        os.replace(temporal, carpeta / f'{self.pid}.json')
+
+    def copia(self):
+        with self._lock:
+            self._revisar_fork()
+            return {clave: list(serie) for clave, serie in self.series.items()}
+
+
+registro = Registro()
+
+
+@atexit.register
+def _volcar_al_salir():
+    if registro.series:
+        try:
+            registro.volcar(forzar=True)
+        except OSError:
+            pass
+
+
+def leer():
+    """
+    Series de todos los workers sumadas. Las de este proceso se toman de la
+    memoria (su archivo puede tener hasta un intervalo de atraso).
+    """
+    total = registro.copia()
+    propio = f'{os.getpid()}.json'
+    carpeta = directorio()
+    archivos = carpeta.glob('*.json') if carpeta.is_dir() else []
+    for archivo in archivos:
+        if archivo.name == propio:
+            continue
+        try:
+            series = json.loads(archivo.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue   # borrado o reemplazado mientras se leía
+        for clave, serie in series.items():
+            actual = total.get(clave)
+            if actual is None:
+                total[clave] = serie
+            else:
+                for i, valor in enumerate(serie):
+                    actual[i] += valor
+    return total
+
+
+# ------------------------
+# Exposición
+# ------------------------
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exposicion(series=None):
+    """
+    Texto en el formato de exposición de Prometheus (versión 0.0.4).
+    """
+    series = leer() if series is None else series
+    por_metrica = {}
+    for clave, serie in sorted(series.items()):
+        metrica, *valores = clave.split('|')
+        por_metrica.setdefault(metrica, []).append((valores, serie))
+
+    lineas = []
+    for metrica, filas in por_metrica.items():
+        es_histograma = metrica in BUCKETS
+        lineas.append(f'# HELP {metrica} {AYUDA.get(metrica, metrica)}')
+        lineas.append(f'# TYPE {metrica} {"histogram" if es_histograma else "counter"}')
+        for valores, serie in filas:
+            if not es_histograma:
+                lineas.append(f'{metrica}{_etiquetas(ETIQUETAS + ("codigo",), valores)} {serie[0]}')
+                continue
+            acumulado = 0
+            for limite, cantidad in zip(BUCKETS[metrica] + ('+Inf',), serie):
+                acumulado += cantidad
+                le = f'le="{limite}"'
+                lineas.append(f'{metrica}_bucket{_etiquetas(ETIQUETAS, valores, le)} {acumulado}')
+            lineas.append(f'{metrica}_sum{_etiquetas(ETIQUETAS, valores)} {_numero(serie[-2])}')
+            lineas.append(f'{metrica}_count{_etiquetas(ETIQUETAS, valores)} {serie[-1]}')
+    return '\n'.join(lineas) + '\n'
+
+
+def cuantil(metrica, serie, q):
+    """
+    Estimación del cuantil ``q`` interpolando dentro del bucket, como
+    ``histogram_quantile`` de Prometheus. None si no hay observaciones.
+    """
+    cuenta = serie[-1]
+    if not cuenta:
+        return None
+    limites = BUCKETS[metrica]
+    objetivo = q * cuenta
+    acumulado = 0
+    for i, cantidad in enumerate(serie[:len(limites) + 1]):
+        if acumulado + cantidad >= objetivo and cantidad:
+            if i == len(limites):
+                return limites[-1]   # en +Inf: el mayor límite conocido
+            inferior = limites[i - 1] if i else 0
+            return inferior + (limites[i] - inferior) * (objetivo - acumulado) / cantidad
+        acumulado += cantidad
+    return limites[-1]
+
+
+def resumen():
+    """
+    Filas para el panel: por vista y método, requests, latencia p50/p95/p99,
+    promedio de consultas, de tiempo SQL y de bytes. Ordenadas por tiempo
+    total (las vistas que más pesan primero).
+    """
+    series = leer()
+    filas = {}
+    for clave, serie in series.items():
+        metrica, *valores = clave.split('|')
+        vista, metodo = valores[:2]
+        fila = filas.setdefault((vista, metodo), {'vista': vista, 'metodo': metodo, 'solicitudes': 0})
+        if metrica == 'gmexpress_solicitudes_total':
+            fila['solicitudes'] += serie[0]
+            if valores[2] == '5xx':
+                fila['errores'] = fila.get('errores', 0) + serie[0]
+            continue
+        fila[metrica] = serie
+
+    resultado = []
+    for fila in filas.values():
+        duracion = fila.pop('gmexpress_solicitud_duracion_segundos', None)
+        consultas = fila.pop('gmexpress_solicitud_consultas_sql', None)
+        sql = fila.pop('gmexpress_solicitud_sql_segundos', None)
+        tamano = fila.pop('gmexpress_respuesta_bytes', None)
+        if duracion:
+            fila['p50_ms'] = cuantil('gmexpress_solicitud_duracion_segundos', duracion, 0.5) * 1000
+            fila['p95_ms'] = cuantil('gmexpress_solicitud_duracion_segundos', duracion, 0.95) * 1000
+            fila['p99_ms'] = cuantil('gmexpress_solicitud_duracion_segundos', duracion, 0.99) * 1000
+            fila['total_s'] = duracion[-2]
+        if consultas and consultas[-1]:
+            fila['consultas'] = consultas[-2] / consultas[-1]
+            fila['muestras_sql'] = consultas[-1]
+        if sql and sql[-1]:
+            fila['sql_ms'] = sql[-2] / sql[-1] * 1000
+        if tamano and tamano[-1]:
+            fila['kb'] = tamano[-2] / tamano[-1] / 1024
+        resultado.append(fila)
+    return sorted(resultado, key=lambda f: f.get('total_s', 0), reverse=True)
+
+
+# ------------------------
+# Middleware
+# ------------------------
+
+class _ContadorSQL:
+    __slots__ = ('consultas', 'segundos')
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+def _muestrear(nombre, defecto):
+    return random.random() < _config(nombre, defecto)
+
+
+class MetricasMiddleware:
+    """
+    Va primero en MIDDLEWARE: así la latencia incluye al resto de la cadena.
+    Bajo ASGI el ORM corre en otros hilos (y otras conexiones), así que ahí
+    se mide latencia y tamaño pero no SQL.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not _muestrear('GMEXPRESS_METRICAS_MUESTREO', 1.0):
+            return self.get_response(request)
+
+        contador = None
+        inicio = time.perf_counter()
+        if _muestrear('GMEXPRESS_METRICAS_MUESTREO_SQL', 0.1):
+            contador = _ContadorSQL()
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(contador))
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio, contador)
+        return response
+
+    async def __acall__(self, request):
+        if not _muestrear('GMEXPRESS_METRICAS_MUESTREO', 1.0):
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio, None)
+        return response
+
+    def _registrar(self, request, response, duracion, contador):
+        coincidencia = getattr(request, 'resolver_match', None)
+        etiquetas = (coincidencia.view_name if coincidencia else SIN_RUTA, request.method)
+        registro.contar('gmexpress_solicitudes_total', etiquetas + (f'{response.status_code // 100}xx',))
+        registro.observar('gmexpress_solicitud_duracion_segundos', etiquetas, duracion)
+        if contador is not None:
+            registro.observar('gmexpress_solicitud_consultas_sql', etiquetas, contador.consultas)
+            registro.observar('gmexpress_solicitud_sql_segundos', etiquetas, contador.segundos)
+        if not response.streaming:
+            registro.observar('gmexpress_respuesta_bytes', etiquetas, len(response.content))
+        try:
+            registro.volcar()
+        except OSError:
+            pass   # sin directorio escribible se siguen viendo las de este proceso
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0003_indices_paginacion_pedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefijo', models.CharField(max_length=30, unique=True)),
+                ('ultimo_numero', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:52
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def eliminar_duplicados(apps, schema_editor):
+    # Antes del unique: deja solo el reporte más reciente de cada fecha
+    ReporteViaje = apps.get_model('gestion_gmexpress', 'ReporteViaje')
+    duplicadas = (
+        ReporteViaje.objects
+        .values('fecha')
+        .annotate(n=Count('id'), ultimo=Max('id'))
+        .filter(n__gt=1)
+    )
+    for fila in duplicadas:
+        (
+            ReporteViaje.objects
+            .filter(fecha=fila['fecha'])
+            .exclude(pk=fila['ultimo'])
+            .delete()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0005_coordenadas_pedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reporteviaje',
+            name='fecha',
+            field=models.DateField(unique=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0006_reporteviaje_fecha_unica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacionEntrega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('resultado', models.CharField(max_length=20)),
+                ('fecha_cliente', models.DateTimeField()),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True)),
+                ('conductor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sincronizaciones', to='gestion_gmexpress.conductor')),
+                ('parada', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sincronizaciones', to='gestion_gmexpress.parada')),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def contar_no_leidas(apps, schema_editor):
+    # Carga inicial del contador con las notificaciones ya existentes
+    PerfilUsuario = apps.get_model('gestion_gmexpress', 'PerfilUsuario')
+    Notificacion = apps.get_model('gestion_gmexpress', 'Notificacion')
+    no_leidas = (
+        Notificacion.objects
+        .filter(usuario=OuterRef('pk'), leida=False)
+        .order_by()
+        .values('usuario')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    PerfilUsuario.objects.update(
+        notificaciones_no_leidas=Coalesce(Subquery(no_leidas, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0009_envio_notificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='notificaciones_no_leidas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'leida', 'fecha_envio'], name='gestion_gme_usuario_222ee6_idx'),
+        ),
+        migrations.RunPython(contar_no_leidas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0010_bandeja_notificaciones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['fecha_programada', 'id'], name='viaje_programada_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copiar_hora_llegada(apps, schema_editor):
+    # Hasta ahora la sincronización comparaba contra la hora de llegada
+    Parada = apps.get_model('gestion_gmexpress', 'Parada')
+    Parada.objects.filter(hora_llegada_real__isnull=False).update(
+        estado_registrado_en=F('hora_llegada_real'),
+        observaciones_registradas_en=F('hora_llegada_real'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_gmexpress', '0012_version_tabla'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parada',
+            name='estado_registrado_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='parada',
+            name='observaciones_registradas_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copiar_hora_llegada, migrations.RunPython.noop),
+        # La nueva restricción antes de quitar la anterior: nunca sin índice único
+        migrations.AddConstraint(
+            model_name='sincronizacionentrega',
+            constraint=models.UniqueConstraint(fields=('conductor', 'clave'), name='sincronizacion_conductor_clave'),
+        ),
+        migrations.AlterField(
+            model_name='sincronizacionentrega',
+            name='clave',
+            field=models.CharField(max_length=64),
+        ),
+    ]
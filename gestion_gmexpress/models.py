@@ -4,6 +4,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .roles import roles_de, ROL_ADMIN, ROL_CLIENTE
+
 # ------------------------
 # Usuarios, roles y auditoría
 # ------------------------
@@ -25,6 +27,8 @@ class PerfilUsuario(models.Model):
     activo = models.BooleanField(default=True)
     intentos_login = models.IntegerField(default=0)
     bloqueado_hasta = models.DateTimeField(null=True, blank=True)
+    # Denormalizado para el ícono de la barra de navegación (ver bandeja.py)
+    notificaciones_no_leidas = models.IntegerField(default=0)
     roles = models.ManyToManyField(
         Rol,
         through='UsuarioRol',
@@ -37,16 +41,21 @@ class PerfilUsuario(models.Model):
     def __str__(self):
         return self.user.get_full_name() or self.user.username
 
+    @property
+    def roles_activos(self) -> frozenset:
+        # Se resuelven una vez y quedan en la instancia (ver roles.py)
+        return roles_de(self)
+
     @property
     def es_cliente(self) -> bool:
-        return self.roles.filter(nombre='CLIENTE', activo=True).exists()
+        return ROL_CLIENTE in self.roles_activos
 
     @property
     def es_admin(self) -> bool:
         
         if self.user.is_superuser or self.user.is_staff:
             return True
-        return self.roles.filter(nombre='ADMIN', activo=True).exists()
+        return ROL_ADMIN in self.roles_activos
 
 class UsuarioRol(models.Model):
     usuario = models.ForeignKey(
@@ -289,6 +298,12 @@ class Viaje(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Soporta la paginación por cursor (fecha_programada, id) del listado
+        indexes = [
+            models.Index(fields=['fecha_programada', 'id'], name='viaje_programada_idx'),
+        ]
+
     def __str__(self):
         return f"Viaje #{self.id} - {self.nombre_ruta} ({self.fecha_programada})"
 
@@ -305,6 +320,10 @@ class Pedido(models.Model):
     ciudad = models.CharField(max_length=100)
     comuna = models.CharField(max_length=100)
 
+    # Coordenadas de la dirección de entrega (las usa el optimizador de rutas)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
     tipo_servicio = models.ForeignKey(
         'TipoServicio',
         on_delete=models.PROTECT,
@@ -341,10 +360,30 @@ class Pedido(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Soportan la paginación por cursor (fecha_creacion, id) de los listados
+        indexes = [
+            models.Index(fields=['fecha_creacion', 'id'], name='pedido_creacion_idx'),
+            models.Index(fields=['cliente', 'fecha_creacion', 'id'], name='pedido_cliente_creacion_idx'),
+            models.Index(fields=['estado', 'fecha_creacion', 'id'], name='pedido_estado_creacion_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido {self.numero_pedido}"
 
 
+class SecuenciaPedido(models.Model):
+    """
+    Último correlativo entregado por prefijo de fecha (``PED-YYYYMMDD-``).
+    Ver secuencias.py.
+    """
+    prefijo = models.CharField(max_length=30, unique=True)
+    ultimo_numero = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefijo}{self.ultimo_numero:04d}"
+
+
 class HistorialEstadoPedido(models.Model):
     pedido = models.ForeignKey(
         Pedido,
@@ -422,6 +461,12 @@ class Parada(models.Model):
     )
     observaciones = models.TextField(blank=True)
 
+    # Hora del teléfono del último cambio aplicado de estado (con su motivo)
+    # y de observaciones: la sincronización descarta lo que llegue más
+    # antiguo (ver entregas.py)
+    estado_registrado_en = models.DateTimeField(null=True, blank=True, editable=False)
+    observaciones_registradas_en = models.DateTimeField(null=True, blank=True, editable=False)
+
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
@@ -437,6 +482,39 @@ class Parada(models.Model):
         return f"Parada {self.secuencia} - {self.pedido}"
 
 
+class SincronizacionEntrega(models.Model):
+    """
+    Clave de idempotencia de cada actualización de entrega recibida por la
+    sincronización en lote de los conductores (ver entregas.py). Si el
+    teléfono reenvía una clave ya registrada se responde lo mismo sin
+    volver a aplicarla. La clave la genera el teléfono: es única por
+    conductor, no entre todos.
+    """
+    clave = models.CharField(max_length=64)
+    conductor = models.ForeignKey(
+        Conductor,
+        on_delete=models.CASCADE,
+        related_name='sincronizaciones'
+    )
+    parada = models.ForeignKey(
+        Parada,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='sincronizaciones'
+    )
+    resultado = models.CharField(max_length=20)
+    fecha_cliente = models.DateTimeField()
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conductor', 'clave'], name='sincronizacion_conductor_clave'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.resultado})"
+
+
 # ------------------------
 # Notificaciones y reportes
 # ------------------------
@@ -473,12 +551,71 @@ class Notificacion(models.Model):
     leida = models.BooleanField(default=False)
     fecha_envio = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Bandeja del usuario (no leídas primero) paginada por fecha
+        indexes = [models.Index(fields=['usuario', 'leida', 'fecha_envio'])]
+
     def __str__(self):
         return f"[{self.tipo}] {self.titulo}"
 
 
+class EnvioNotificacion(models.Model):
+    """
+    Bandeja de salida de notificaciones EMAIL / SMS (ver notificaciones.py).
+    Se escribe en la misma transacción que el cambio de estado y la vacía
+    ``python manage.py enviar_notificaciones``; al enviarse se registra la
+    Notificacion del usuario.
+    """
+    class Estado(models.TextChoices):
+        PENDIENTE = 'PENDIENTE', 'Pendiente'
+        ENVIADO = 'ENVIADO', 'Enviado'
+        FALLIDO = 'FALLIDO', 'Fallido'
+
+    canal = models.CharField(max_length=10, choices=Notificacion.Tipo.choices)
+    usuario = models.ForeignKey(
+        PerfilUsuario,
+        on_delete=models.CASCADE,
+        related_name='envios_notificacion'
+    )
+    pedido = models.ForeignKey(
+        Pedido,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='envios_notificacion'
+    )
+    viaje = models.ForeignKey(
+        Viaje,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='envios_notificacion'
+    )
+    destino = models.CharField(max_length=254)
+    titulo = models.CharField(max_length=200)
+    mensaje = models.TextField()
+
+    estado = models.CharField(max_length=10, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # El worker busca PENDIENTE con proximo_intento vencido
+        indexes = [models.Index(fields=['estado', 'proximo_intento'])]
+
+    def __str__(self):
+        return f"[{self.canal}] {self.destino}: {self.titulo} ({self.estado})"
+
+
 class ReporteViaje(models.Model):
-    fecha = models.DateField()
+    """
+    Resumen diario de viajes y entregas. Lo llena
+    ``python manage.py generar_reportes`` (ver reportes.py).
+    """
+    fecha = models.DateField(unique=True)
     total_viajes = models.IntegerField()
     viajes_completados = models.IntegerField()
     viajes_en_curso = models.IntegerField()
@@ -489,3 +626,46 @@ class ReporteViaje(models.Model):
 
     def __str__(self):
         return f"Reporte {self.fecha}"
+
+
+class EventoEstado(models.Model):
+    """
+    Cambio de estado publicado para los navegadores suscritos por SSE
+    cuando se usa ``BrokerBaseDatos`` (ver eventos.py). ``canales`` va
+    delimitado por comas en ambos extremos: ``,viaje:3,pedido:12,``.
+    """
+    canales = models.CharField(max_length=255)
+    datos = models.JSONField()
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.canales.strip(',')}"
+
+
+class ContadorDashboard(models.Model):
+    """
+    Métricas precalculadas del dashboard (ver contadores.py).
+    Se mantienen con señales y se reconstruyen con
+    ``python manage.py recalcular_contadores``.
+    """
+    clave = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+
+class VersionTabla(models.Model):
+    """
+    Versión compartida de cada tabla (``clave`` = app.modelo) para el GET
+    condicional de los listados y los catálogos en memoria (ver
+    condicional.py). Vive en la base y no en la caché: con LocMemCache
+    cada worker tendría la suya y no vería los cambios de los demás.
+    """
+    clave = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.clave} v{self.version}"
@@ -0,0 +1,302 @@
+# gestion_gmexpress/notificaciones.py
+
+"""
+Notificaciones al cliente cuando cambia el estado de su pedido.
+
+``encolar`` se llama dentro de la transacción del cambio de estado y solo
+escribe filas (dos ``bulk_create``): la request no espera a ningún
+proveedor de correo o SMS.
+
+- SISTEMA: la Notificacion queda registrada de inmediato (y suma al
+  contador de no leídas, ver bandeja.py).
+- EMAIL / SMS: se guarda un EnvioNotificacion (bandeja de salida). Si la
+  transacción se revierte, el aviso desaparece con ella; si se confirma,
+  el envío queda garantizado. El EnvioNotificacion es también el registro
+  de la entrega: no se copia a la bandeja del usuario, donde ya está el
+  aviso SISTEMA (se vería dos veces y sumaría dos no leídas).
+
+``python manage.py enviar_notificaciones`` vacía la bandeja con uno o más
+procesos. Cada uno toma un lote con ``SELECT ... FOR UPDATE SKIP LOCKED``
+(los procesos no se pisan ni se esperan), lo envía agrupado por canal con
+el backend de ``GMEXPRESS_NOTIFICACIONES_BACKENDS`` y reprograma lo que
+falló con espera exponencial. Tras ``GMEXPRESS_NOTIFICACIONES_REINTENTOS``
+intentos el envío queda FALLIDO (se puede reintentar desde el admin).
+
+La entrega es "al menos una vez": si el proceso muere a mitad de un lote,
+la transacción se revierte y ese lote se vuelve a enviar.
+"""
+
+import json
+import logging
+import random
+import sys
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .bandeja import sumar_creadas
+from .catalogos import estados_pedido
+from .models import Cliente, Notificacion, EnvioNotificacion
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 500
+CANALES_DEFECTO = ['SISTEMA', 'EMAIL']
+BACKENDS_DEFECTO = {
+    'EMAIL': 'gestion_gmexpress.notificaciones.BackendEmail',
+    'SMS': 'gestion_gmexpress.notificaciones.BackendConsola',
+}
+# Dato del cliente que se usa como destino en cada canal
+DESTINOS = {
+    Notificacion.Tipo.EMAIL: 'email',
+    Notificacion.Tipo.SMS: 'telefono',
+}
+
+Aviso = namedtuple('Aviso', ['cliente_id', 'pedido_id', 'viaje_id', 'titulo', 'mensaje'])
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+# ------------------------
+# Avisos
+# ------------------------
+
+def aviso_estado_pedido(pedido, comentario=''):
+    estado = estados_pedido.por_id(pedido.estado_id).nombre
+    mensaje = f"Tu pedido {pedido.numero_pedido} cambió a {estado}."
+    if comentario:
+        mensaje += f"\n\n{comentario}"
+    return Aviso(
+        cliente_id=pedido.cliente_id,
+        pedido_id=pedido.pk,
+        viaje_id=pedido.viaje_id,
+        titulo=f"Pedido {pedido.numero_pedido}: {estado}",
+        mensaje=mensaje,
+    )
+
+
+def aviso_entrega_fallida(parada):
+    pedido = parada.pedido
+    mensaje = f"No pudimos entregar tu pedido {pedido.numero_pedido}."
+    if parada.motivo_fallo:
+        mensaje += f" Motivo: {parada.get_motivo_fallo_display()}."
+    return Aviso(
+        cliente_id=pedido.cliente_id,
+        pedido_id=pedido.pk,
+        viaje_id=parada.viaje_id,
+        titulo=f"Entrega fallida del pedido {pedido.numero_pedido}",
+        mensaje=mensaje,
+    )
+
+
+def encolar(avisos):
+    """
+    Registra los avisos en los canales de ``GMEXPRESS_NOTIFICACIONES_CANALES``.
+    Debe llamarse dentro de la transacción del cambio que los origina.
+    Los clientes sin cuenta (sin perfil) no reciben avisos. Devuelve la
+    cantidad de filas creadas.
+    """
+    avisos = list(avisos)
+    canales = set(_config('GMEXPRESS_NOTIFICACIONES_CANALES', CANALES_DEFECTO))
+    if not avisos or not canales:
+        return 0
+
+    clientes = {
+        fila['pk']: fila
+        for fila in Cliente.objects
+        .filter(pk__in={a.cliente_id for a in avisos}, perfil__isnull=False)
+        .values('pk', 'perfil_id', 'email', 'telefono')
+    }
+
+    sistema = []
+    envios = []
+    for aviso in avisos:
+        cliente = clientes.get(aviso.cliente_id)
+        if cliente is None:
+            continue
+        comunes = dict(
+            usuario_id=cliente['perfil_id'],
+            pedido_id=aviso.pedido_id,
+            viaje_id=aviso.viaje_id,
+            titulo=aviso.titulo[:200],
+            mensaje=aviso.mensaje,
+        )
+        if Notificacion.Tipo.SISTEMA in canales:
+            sistema.append(Notificacion(tipo=Notificacion.Tipo.SISTEMA, **comunes))
+        for canal, campo in DESTINOS.items():
+            if canal in canales and cliente[campo]:
+                envios.append(EnvioNotificacion(canal=canal, destino=cliente[campo], **comunes))
+
+    Notificacion.objects.bulk_create(sistema, batch_size=TAMANO_LOTE)
+    sumar_creadas(sistema)
+    EnvioNotificacion.objects.bulk_create(envios, batch_size=TAMANO_LOTE)
+    return len(sistema) + len(envios)
+
+
+# ------------------------
+# Backends
+# ------------------------
+
+class BackendConsola:
+    """
+    Escribe los envíos en la salida estándar. Para desarrollo.
+    """
+    def enviar(self, envios):
+        for envio in envios:
+            sys.stdout.write(f"[{envio.canal}] {envio.destino}: {envio.titulo}\n{envio.mensaje}\n\n")
+        sys.stdout.flush()
+        return [None] * len(envios)
+
+
+class BackendArchivo:
+    """
+    Agrega cada envío como una línea JSON a ``GMEXPRESS_NOTIFICACIONES_ARCHIVO``.
+    Para pruebas.
+    """
+    def enviar(self, envios):
+        with open(settings.GMEXPRESS_NOTIFICACIONES_ARCHIVO, 'a', encoding='utf-8') as archivo:
+            for envio in envios:
+                archivo.write(json.dumps({
+                    'id': envio.pk,
+                    'canal': envio.canal,
+                    'destino': envio.destino,
+                    'titulo': envio.titulo,
+                    'mensaje': envio.mensaje,
+                }, ensure_ascii=False) + '\n')
+        return [None] * len(envios)
+
+
+class BackendEmail:
+    """
+    Envía con el ``EMAIL_BACKEND`` de Django, todo el lote por una sola
+    conexión. Un destinatario rechazado no hace fallar al resto.
+    """
+    def enviar(self, envios):
+        errores = []
+        with get_connection(fail_silently=False) as conexion:
+            for envio in envios:
+                try:
+                    conexion.send_messages([
+                        EmailMessage(subject=envio.titulo, body=envio.mensaje, to=[envio.destino])
+                    ])
+                except Exception as e:
+                    errores.append(str(e) or type(e).__name__)
+                else:
+                    errores.append(None)
+        return errores
+
+
+def _backend(canal):
+    rutas = _config('GMEXPRESS_NOTIFICACIONES_BACKENDS', BACKENDS_DEFECTO)
+    if canal not in rutas:
+        return None
+    return import_string(rutas[canal])()
+
+
+def _enviar_canal(canal, envios):
+    """
+    Lista de errores (None = enviado), una por envío.
+    """
+    try:
+        backend = _backend(canal)
+        if backend is None:
+            return [f"No hay backend para el canal {canal}."] * len(envios)
+        errores = backend.enviar(envios)
+    except Exception as e:
+        logger.exception("Falló el backend de %s con %d envíos", canal, len(envios))
+        return [str(e) or type(e).__name__] * len(envios)
+    if len(errores) != len(envios):
+        return ["El backend no informó el resultado de cada envío."] * len(envios)
+    return errores
+
+
+# ------------------------
+# Worker
+# ------------------------
+
+def _espera(intentos):
+    base = _config('GMEXPRESS_NOTIFICACIONES_ESPERA_BASE', 30)
+    maximo = _config('GMEXPRESS_NOTIFICACIONES_ESPERA_MAX', 3600)
+    segundos = min(base * 2 ** (intentos - 1), maximo)
+    # Al azar entre la mitad y el total: tras una caída del proveedor los
+    # reintentos no llegan todos en el mismo instante
+    return timedelta(seconds=segundos * random.uniform(0.5, 1))
+
+
+def despachar_lote(tamano=100):
+    """
+    Toma hasta ``tamano`` envíos vencidos que ningún otro proceso tenga
+    tomados, los envía y guarda el resultado. Devuelve cuántos procesó.
+    """
+    reintentos = _config('GMEXPRESS_NOTIFICACIONES_REINTENTOS', 8)
+
+    with transaction.atomic():
+        envios = list(
+            EnvioNotificacion.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado=EnvioNotificacion.Estado.PENDIENTE, proximo_intento__lte=timezone.now())
+            .order_by('proximo_intento')[:tamano]
+        )
+        if not envios:
+            return 0
+
+        por_canal = defaultdict(list)
+        for envio in envios:
+            por_canal[envio.canal].append(envio)
+
+        for canal, grupo in por_canal.items():
+            errores = _enviar_canal(canal, grupo)
+            ahora = timezone.now()
+            for envio, error in zip(grupo, errores):
+                envio.intentos += 1
+                if error is None:
+                    envio.estado = EnvioNotificacion.Estado.ENVIADO
+                    envio.fecha_envio = ahora
+                    envio.ultimo_error = ''
+                    continue
+                envio.ultimo_error = error
+                if envio.intentos >= reintentos:
+                    envio.estado = EnvioNotificacion.Estado.FALLIDO
+                else:
+                    envio.proximo_intento = ahora + _espera(envio.intentos)
+
+        EnvioNotificacion.objects.bulk_update(
+            envios,
+            ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'fecha_envio'],
+            batch_size=TAMANO_LOTE,
+        )
+
+    return len(envios)
+
+
+def trabajar(tamano=100, intervalo=5, una_vez=False):
+    """
+    Despacha lotes mientras haya envíos vencidos; si no hay, espera
+    ``intervalo`` segundos (o termina, con ``una_vez``). Devuelve el total
+    de envíos procesados.
+    """
+    total = 0
+    while True:
+        close_old_connections()
+        procesados = despachar_lote(tamano)
+        total += procesados
+        if procesados:
+            continue
+        if una_vez:
+            return total
+        time.sleep(intervalo)
+
+
+def _trabajar_proceso(tamano, intervalo, una_vez):
+    try:
+        return trabajar(tamano, intervalo, una_vez)
+    finally:
+        connections.close_all()
@@ -0,0 +1,163 @@
+# gestion_gmexpress/paginacion.py
+
+"""
+Paginación por cursor (keyset) para ListView.
+
+En vez de ``OFFSET`` la página siguiente se busca a partir de la última
+fila mostrada (``WHERE (fecha, id) < (ultima_fecha, ultimo_id)``), así que
+la página N cuesta lo mismo que la primera y no hace falta ``COUNT(*)``.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class PaginaCursor:
+    """
+    Página de resultados con los cursores para moverse a la anterior
+    y a la siguiente. Imita lo justo de ``django.core.paginator.Page``.
+    """
+    def __init__(self, object_list, cursor_siguiente, cursor_anterior,
+                 url_siguiente, url_anterior, count=None):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.url_siguiente = url_siguiente
+        self.url_anterior = url_anterior
+        self.count = count
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginationMixin:
+    """
+    Reemplaza la paginación por OFFSET de ListView.
+
+    - ``cursor_campos``: campos del orden (descendente); el último debe ser
+      único (normalmente ``id``) para que el orden sea total.
+    - ``cursor_param``: nombre del parámetro en el querystring.
+    - ``cursor_contar_total``: si es True calcula también ``page_obj.count``
+      (un ``COUNT(*)`` extra); por defecto no se cuenta.
+
+    El resto de parámetros del querystring (p. ej. ``?estado=``) se
+    conservan en las URLs de anterior / siguiente.
+    """
+    cursor_campos = ('fecha_creacion', 'id')
+    cursor_param = 'cursor'
+    cursor_contar_total = False
+
+    # --- codificación del cursor ---
+
+    def _codificar_cursor(self, direccion, obj):
+        valores = []
+        for campo in self.cursor_campos:
+            valor = getattr(obj, campo)
+            valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+        crudo = json.dumps([direccion, valores], separators=(',', ':'))
+        return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+    def _decodificar_cursor(self, cursor):
+        """
+        Devuelve (direccion, valores) o None si el cursor no es válido.
+        """
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            direccion, valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+            if direccion not in ('s', 'a') or len(valores) != len(self.cursor_campos):
+                return None
+            opts = self.model._meta
+            valores = [
+                opts.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.cursor_campos, valores)
+            ]
+            # Un cursor alterado con null no puede compararse en el filtro
+            if None in valores:
+                return None
+            return direccion, valores
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    # --- filtros ---
+
+    def _filtro_despues_de(self, valores, lookup):
+        """
+        Condición lexicográfica (c1, c2, ...) <lookup> (v1, v2, ...).
+        """
+        condicion = Q()
+        for i, campo in enumerate(self.cursor_campos):
+            parte = Q(**{f'{campo}__{lookup}': valores[i]})
+            for campo_previo, valor_previo in zip(self.cursor_campos[:i], valores[:i]):
+                parte &= Q(**{campo_previo: valor_previo})
+            condicion |= parte
+        # Redundante, pero deja al motor un rango simple sobre el índice
+        primero = self.cursor_campos[0]
+        return Q(**{f'{primero}__{lookup}e': valores[0]}) & condicion
+
+    def _url_con_cursor(self, cursor):
+        params = self.request.GET.copy()
+        params[self.cursor_param] = cursor
+        return f'?{params.urlencode()}'
+
+    # --- integración con ListView ---
+
+    def paginate_queryset(self, queryset, page_size):
+        orden_desc = [f'-{campo}' for campo in self.cursor_campos]
+        orden_asc = list(self.cursor_campos)
+
+        total = queryset.count() if self.cursor_contar_total else None
+
+        cursor = self._decodificar_cursor(self.request.GET.get(self.cursor_param, ''))
+        direccion = cursor[0] if cursor else 's'
+
+        qs = queryset.order_by(*orden_desc)
+        if cursor and direccion == 's':
+            qs = qs.filter(self._filtro_despues_de(cursor[1], 'lt'))
+        elif cursor:
+            # Página anterior: recorremos hacia atrás y luego damos vuelta
+            qs = queryset.order_by(*orden_asc).filter(
+                self._filtro_despues_de(cursor[1], 'gt')
+            )
+
+        filas = list(qs[:page_size + 1])
+        hay_mas = len(filas) > page_size
+        filas = filas[:page_size]
+
+        if direccion == 's':
+            hay_siguiente, hay_anterior = hay_mas, cursor is not None
+        else:
+            filas.reverse()
+            hay_siguiente, hay_anterior = True, hay_mas
+
+        cursor_siguiente = (
+            self._codificar_cursor('s', filas[-1]) if hay_siguiente and filas else None
+        )
+        cursor_anterior = (
+            self._codificar_cursor('a', filas[0]) if hay_anterior and filas else None
+        )
+
+        page = PaginaCursor(
+            filas,
+            cursor_siguiente,
+            cursor_anterior,
+            self._url_con_cursor(cursor_siguiente) if cursor_siguiente else None,
+            self._url_con_cursor(cursor_anterior) if cursor_anterior else None,
+            count=total,
+        )
+        # No hay Paginator clásico: el template usa page_obj
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,72 @@
+# gestion_gmexpress/pestanas.py
+
+"""
+Pestañas por estado del listado de pedidos.
+
+Los conteos salen de un único ``GROUP BY estado_id`` y se cruzan en memoria
+con el catálogo de EstadoPedido (ver catalogos.py). El resultado queda en
+caché por alcance (global para admin / logística, uno por Cliente) y por
+versión de la tabla de pedidos (ver condicional.py). Cualquier cambio en
+Pedido, con o sin señales, sube esa versión compartida por todos los
+workers, así que ninguno sigue leyendo conteos viejos de su propia caché.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .catalogos import estados_pedido
+from .condicional import versiones
+from .models import Pedido
+
+
+def _timeout():
+    return getattr(settings, 'GMEXPRESS_PESTANAS_CACHE_TIMEOUT', 300)
+
+
+def _clave(cliente_id, version):
+    if cliente_id is None:
+        return f'pedidos:pestanas:{version}:global'
+    return f'pedidos:pestanas:{version}:cliente:{cliente_id}'
+
+
+def _conteos(base, cliente_id, version):
+    clave = _clave(cliente_id, version)
+    conteos = cache.get(clave)
+    if conteos is None:
+        conteos = dict(
+            base.order_by()
+            .values_list('estado_id')
+            .annotate(cantidad=Count('id'))
+        )
+        cache.set(clave, conteos, _timeout())
+    return conteos
+
+
+def pestanas_estado(base, cliente_id=None, version=None):
+    """
+    Devuelve (pestanas, total) para el queryset ``base`` (sin filtro de estado).
+
+    ``cliente_id`` identifica el alcance de la caché: None para el listado
+    global; el id del cliente cuando ``base`` está filtrado por él.
+    ``version`` es la versión actual de Pedido si quien llama ya la leyó;
+    si no, se consulta.
+    """
+    if version is None:
+        version = versiones(Pedido)[Pedido][0]
+    conteos = _conteos(base, cliente_id, version)
+
+    # El catálogo ya viene ordenado por (orden, nombre)
+    pestanas = [
+        {
+            'id': estado.id,
+            'nombre': estado.nombre,
+            'orden': estado.orden,
+            'count': conteos[estado.id],
+        }
+        for estado in estados_pedido.todos()
+        if estado.id in conteos
+    ]
+
+    return pestanas, sum(conteos.values())
+
@@ -0,0 +1,30 @@
+# gestion_gmexpress/procesos.py
+
+"""
+Entrada para tareas que corren en procesos hijos y usan el ORM.
+
+Un proceso creado con "spawn" (el modo por defecto en macOS y Windows)
+parte sin Django configurado, así que la función a ejecutar no puede
+vivir en un módulo que importe modelos al cargarse. Este módulo no los
+importa: ``llamar`` configura Django y recién entonces importa la
+función indicada por su ruta.
+"""
+
+import importlib
+
+import django
+from django.apps import apps
+
+
+def iniciar_django():
+    if not apps.ready:
+        django.setup()
+
+
+def llamar(ruta, *args):
+    """
+    ``llamar('gestion_gmexpress.reportes._generar_lote', lote)``
+    """
+    iniciar_django()
+    modulo, funcion = ruta.rsplit('.', 1)
+    return getattr(importlib.import_module(modulo), funcion)(*args)
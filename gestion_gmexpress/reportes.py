@@ -0,0 +1,169 @@
+# gestion_gmexpress/reportes.py
+
+"""
+Reportes diarios de viajes (ReporteViaje).
+
+Cada rango de fechas se calcula con dos consultas agrupadas (viajes por
+``fecha_programada`` y paradas por la fecha de su viaje) y se guarda con un
+único upsert (``INSERT ... ON DUPLICATE KEY UPDATE`` sobre ``fecha``), así
+que volver a generar un día lo reemplaza.
+
+Los días sin viajes también tienen su fila (en cero), para que el admin
+lea siempre filas precalculadas.
+
+Para rellenar historia, ``generar_rango`` reparte el rango en lotes de días
+entre varios procesos.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models import Count, Q, Value
+from django.utils import timezone
+
+from .catalogos import estados_viaje, estados_entrega
+from .models import Viaje, Parada, ReporteViaje
+from .procesos import llamar
+
+CAMPOS_REPORTE = (
+    'total_viajes',
+    'viajes_completados',
+    'viajes_en_curso',
+    'total_entregas',
+    'entregas_exitosas',
+    'entregas_fallidas',
+)
+
+
+def _id_o_none(catalogo, nombre):
+    try:
+        return catalogo.id_de(nombre)
+    except catalogo.modelo.DoesNotExist:
+        return None
+
+
+def _contar_si(estado_field, estado_id):
+    # Si el estado no existe en el catálogo el conteo es 0
+    if estado_id is None:
+        return Value(0)
+    return Count('id', filter=Q(**{estado_field: estado_id}))
+
+
+def calcular_reportes(desde, hasta):
+    """
+    Devuelve {fecha: {campo: valor}} para cada día de ``desde`` a ``hasta``
+    (inclusive).
+    """
+    completado = _id_o_none(estados_viaje, 'COMPLETADO')
+    en_curso = _id_o_none(estados_viaje, 'EN_CURSO')
+    entregado = _id_o_none(estados_entrega, 'ENTREGADO')
+    fallido = _id_o_none(estados_entrega, 'FALLIDO')
+
+    reportes = {}
+    dia = desde
+    while dia <= hasta:
+        reportes[dia] = dict.fromkeys(CAMPOS_REPORTE, 0)
+        dia += timedelta(days=1)
+
+    viajes = (
+        Viaje.objects
+        .filter(fecha_programada__range=(desde, hasta))
+        .order_by()
+        .values('fecha_programada')
+        .annotate(
+            total=Count('id'),
+            completados=_contar_si('estado_id', completado),
+            en_curso=_contar_si('estado_id', en_curso),
+        )
+    )
+    for fila in viajes:
+        reporte = reportes[fila['fecha_programada']]
+        reporte['total_viajes'] = fila['total']
+        reporte['viajes_completados'] = fila['completados']
+        reporte['viajes_en_curso'] = fila['en_curso']
+
+    entregas = (
+        Parada.objects
+        .filter(viaje__fecha_programada__range=(desde, hasta))
+        .order_by()
+        .values('viaje__fecha_programada')
+        .annotate(
+            total=Count('id'),
+            exitosas=_contar_si('estado_entrega_id', entregado),
+            fallidas=_contar_si('estado_entrega_id', fallido),
+        )
+    )
+    for fila in entregas:
+        reporte = reportes[fila['viaje__fecha_programada']]
+        reporte['total_entregas'] = fila['total']
+        reporte['entregas_exitosas'] = fila['exitosas']
+        reporte['entregas_fallidas'] = fila['fallidas']
+
+    return reportes
+
+
+def guardar_reportes(reportes):
+    """
+    Inserta o reemplaza las filas de ReporteViaje en un solo statement.
+    """
+    ahora = timezone.now()
+    filas = [
+        ReporteViaje(fecha=fecha, fecha_generacion=ahora, **valores)
+        for fecha, valores in reportes.items()
+    ]
+    with transaction.atomic():
+        ReporteViaje.objects.bulk_create(
+            filas,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['fecha'],
+            update_fields=list(CAMPOS_REPORTE) + ['fecha_generacion'],
+        )
+    return len(filas)
+
+
+def generar_reportes(desde, hasta=None):
+    """
+    Calcula y guarda los reportes de ``desde`` a ``hasta`` (inclusive).
+    Devuelve la cantidad de días guardados.
+    """
+    return guardar_reportes(calcular_reportes(desde, hasta or desde))
+
+
+# ------------------------
+# Backfill en paralelo
+# ------------------------
+
+def _lotes(desde, hasta, dias_por_lote):
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=dias_por_lote - 1), hasta)
+        yield inicio, fin
+        inicio = fin + timedelta(days=1)
+
+
+def _generar_lote(lote):
+    desde, hasta = lote
+    try:
+        return generar_reportes(desde, hasta)
+    finally:
+        connections.close_all()
+
+
+def generar_rango(desde, hasta, procesos=1, dias_por_lote=31):
+    """
+    Genera los reportes de un rango largo en lotes de ``dias_por_lote``
+    días, repartidos en ``procesos`` procesos. Devuelve la cantidad de días.
+    """
+    lotes = list(_lotes(desde, hasta, dias_por_lote))
+    if procesos <= 1 or len(lotes) == 1:
+        return sum(generar_reportes(d, h) for d, h in lotes)
+
+    # Los hijos no pueden heredar conexiones abiertas del padre
+    connections.close_all()
+    # Se llama por ruta: con "spawn" el hijo aún no puede importar este módulo
+    tarea = partial(llamar, 'gestion_gmexpress.reportes._generar_lote')
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return sum(pool.map(tarea, lotes))
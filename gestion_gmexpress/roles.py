@@ -0,0 +1,114 @@
+# gestion_gmexpress/roles.py
+
+"""
+Resolución de roles de usuario.
+
+Los nombres de los roles activos de un PerfilUsuario se cargan una sola vez
+por request: quedan guardados en la instancia del perfil, que Django reutiliza
+en ``request.user.perfil`` durante todo el request (mixins, vistas y templates).
+
+Opcionalmente se guardan también en la caché de Django entre requests
+(``GMEXPRESS_ROLES_CACHE_TIMEOUT`` > 0). Las señales de UsuarioRol y Rol
+(ver signals.py) invalidan esa caché.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+ROL_ADMIN = 'ADMIN'
+ROL_LOGISTICA = 'LOGISTICA'
+ROL_CLIENTE = 'CLIENTE'
+ROL_CONDUCTOR = 'CONDUCTOR'
+
+ROLES_GESTION = frozenset({ROL_ADMIN, ROL_LOGISTICA})
+
+_ATRIBUTO_CACHE = '_roles_activos'
+_CLAVE_VERSION = 'roles:version'
+
+
+def _timeout():
+    return getattr(settings, 'GMEXPRESS_ROLES_CACHE_TIMEOUT', 0)
+
+
+def _clave(perfil_id):
+    # La versión global permite invalidar a todos los usuarios de una vez
+    # (p. ej. cuando se desactiva un Rol).
+    version = cache.get_or_set(_CLAVE_VERSION, 1, None)
+    return f'roles:{version}:{perfil_id}'
+
+
+def roles_de(perfil):
+    """
+    Devuelve un frozenset con los nombres de los roles activos del perfil.
+    """
+    if perfil is None:
+        return frozenset()
+
+    roles = getattr(perfil, _ATRIBUTO_CACHE, None)
+    if roles is not None:
+        return roles
+
+    timeout = _timeout()
+    clave = _clave(perfil.pk) if timeout else None
+    if clave:
+        roles = cache.get(clave)
+
+    if roles is None:
+        roles = frozenset(
+            perfil.roles.filter(activo=True).values_list('nombre', flat=True)
+        )
+        if clave:
+            cache.set(clave, roles, timeout)
+
+    setattr(perfil, _ATRIBUTO_CACHE, roles)
+    return roles
+
+
+def invalidar_roles(perfil_id=None):
+    """
+    Invalida la caché de roles de un perfil, o de todos si no se indica.
+    """
+    if perfil_id is not None:
+        if _timeout():
+            cache.delete(_clave(perfil_id))
+        return
+    try:
+        cache.incr(_CLAVE_VERSION)
+    except ValueError:
+        cache.set(_CLAVE_VERSION, 2, None)
+
+
+# ------------------------
+# Helpers sobre request.user
+# ------------------------
+
+def perfil_de(user):
+    if not user.is_authenticated:
+        return None
+    return getattr(user, 'perfil', None)
+
+
+def tiene_rol(user, *nombres):
+    return bool(roles_de(perfil_de(user)).intersection(nombres))
+
+
+def es_cliente(user):
+    return tiene_rol(user, ROL_CLIENTE)
+
+
+def es_admin(user):
+    """
+    Superuser / staff de Django o rol ADMIN.
+    """
+    if user.is_staff or user.is_superuser:
+        return True
+    return tiene_rol(user, ROL_ADMIN)
+
+
+def es_gestion(user):
+    """
+    Administración o logística (o superuser / staff de Django).
+    """
+    if user.is_staff or user.is_superuser:
+        return True
+    return tiene_rol(user, *ROLES_GESTION)
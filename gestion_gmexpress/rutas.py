@@ -0,0 +1,302 @@
+# gestion_gmexpress/rutas.py
+
+"""
+Optimización del orden de las paradas de un viaje.
+
+A partir de las coordenadas de los pedidos se arma una matriz de
+distancias (haversine, en km) que queda en la caché de Django: la clave
+depende solo de los puntos, así que dos corridas sobre las mismas
+direcciones la reutilizan aunque el orden haya cambiado.
+
+El orden se construye con vecino más cercano y se mejora con 2-opt y
+Or-opt (mover tramos de 1 a 3 paradas) hasta que no haya mejoras o se
+agote ``GMEXPRESS_RUTAS_TIEMPO_MAX``. La ruta es abierta: parte en el
+centro de distribución (``GMEXPRESS_RUTAS_DEPOSITO``) o, si no está
+configurado, donde convenga, y no vuelve.
+
+Solo se reordenan las paradas PENDIENTE con coordenadas, y solo entre los
+lugares que ya ocupaban: las atendidas y las que no tienen coordenadas
+conservan su secuencia.
+"""
+
+import hashlib
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import condicional
+from .catalogos import estados_entrega
+from .models import Viaje, Parada, EstadoEntrega
+
+RADIO_TIERRA_KM = 6371.0088
+
+# Mejoras menores a esto (km) se consideran ruido de punto flotante
+EPSILON = 1e-9
+
+ResultadoOptimizacion = namedtuple(
+    'ResultadoOptimizacion',
+    ['reordenadas', 'sin_coordenadas', 'km_antes', 'km_despues'],
+)
+
+
+def _tiempo_max():
+    return getattr(settings, 'GMEXPRESS_RUTAS_TIEMPO_MAX', 0.5)
+
+
+def _deposito():
+    deposito = getattr(settings, 'GMEXPRESS_RUTAS_DEPOSITO', None)
+    if deposito is None:
+        return None
+    return (round(float(deposito[0]), 6), round(float(deposito[1]), 6))
+
+
+def _timeout():
+    return getattr(settings, 'GMEXPRESS_RUTAS_CACHE_TIMEOUT', 86400)
+
+
+# ------------------------
+# Distancias
+# ------------------------
+
+def _haversine(p, q):
+    lat1, lng1 = map(math.radians, p)
+    lat2, lng2 = map(math.radians, q)
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
+
+
+def matriz_distancias(puntos):
+    """
+    Matriz de distancias (km) entre ``puntos`` [(lat, lng), ...], en ese orden.
+
+    Se calcula y guarda sobre los puntos únicos ordenados, de modo que la
+    misma caché sirve para cualquier permutación de las mismas direcciones.
+    """
+    unicos = sorted(set(puntos))
+    clave = 'rutas:matriz:' + hashlib.sha1(repr(unicos).encode()).hexdigest()
+    base = cache.get(clave)
+    if base is None:
+        n = len(unicos)
+        base = [[0.0] * n for _ in range(n)]
+        for i in range(n):
+            for j in range(i + 1, n):
+                base[i][j] = base[j][i] = _haversine(unicos[i], unicos[j])
+        cache.set(clave, base, _timeout())
+
+    posicion = {p: i for i, p in enumerate(unicos)}
+    indices = [posicion[p] for p in puntos]
+    return [[base[i][j] for j in indices] for i in indices]
+
+
+# ------------------------
+# Heurísticas
+# ------------------------
+
+def largo_ruta(ruta, d):
+    return sum(d[a][b] for a, b in zip(ruta, ruta[1:]))
+
+
+def _vecino_mas_cercano(d, inicio):
+    pendientes = set(range(len(d))) - {inicio}
+    ruta = [inicio]
+    while pendientes:
+        fila = d[ruta[-1]]
+        siguiente = min(pendientes, key=fila.__getitem__)
+        ruta.append(siguiente)
+        pendientes.remove(siguiente)
+    return ruta
+
+
+def _dos_opt(ruta, d, limite):
+    """
+    Invierte tramos ruta[i..j] mientras acorten la ruta. La posición 0 es
+    el origen y no se mueve; el final es abierto.
+    """
+    n = len(ruta)
+    mejoro = False
+    for i in range(1, n - 1):
+        a = ruta[i - 1]
+        for j in range(i + 1, n):
+            b, c = ruta[i], ruta[j]
+            delta = d[a][c] - d[a][b]
+            if j + 1 < n:
+                e = ruta[j + 1]
+                delta += d[b][e] - d[c][e]
+            if delta < -EPSILON:
+                ruta[i:j + 1] = ruta[i:j + 1][::-1]
+                mejoro = True
+        if time.monotonic() > limite:
+            break
+    return mejoro
+
+
+def _or_opt(ruta, d, limite):
+    """
+    Mueve tramos de 1 a 3 paradas (opcionalmente invertidos) a la mejor
+    posición del resto de la ruta.
+    """
+    mejoro = False
+    for largo in (1, 2, 3):
+        i = 1
+        while i + largo <= len(ruta):
+            n = len(ruta)
+            s0, s1 = ruta[i], ruta[i + largo - 1]
+            previo = ruta[i - 1]
+            siguiente = ruta[i + largo] if i + largo < n else None
+
+            # Lo que se ahorra al sacar el tramo
+            ahorro = d[previo][s0]
+            if siguiente is not None:
+                ahorro += d[s1][siguiente] - d[previo][siguiente]
+
+            mejor = (-EPSILON, None, False)
+            for p in range(n):
+                if i - 1 <= p < i + largo:
+                    continue
+                x = ruta[p]
+                y = ruta[p + 1] if p + 1 < n else None
+                if y is None:
+                    costo, costo_inv = d[x][s0], d[x][s1]
+                else:
+                    costo = d[x][s0] + d[s1][y] - d[x][y]
+                    costo_inv = d[x][s1] + d[s0][y] - d[x][y]
+                if costo - ahorro < mejor[0]:
+                    mejor = (costo - ahorro, x, False)
+                if costo_inv - ahorro < mejor[0]:
+                    mejor = (costo_inv - ahorro, x, True)
+
+            if mejor[1] is not None:
+                tramo = ruta[i:i + largo]
+                if mejor[2]:
+                    tramo.reverse()
+                del ruta[i:i + largo]
+                destino = ruta.index(mejor[1]) + 1
+                ruta[destino:destino] = tramo
+                mejoro = True
+            else:
+                i += 1
+
+            if time.monotonic() > limite:
+                return mejoro
+    return mejoro
+
+
+def optimizar_orden(d, inicio=0, tiempo_max=None):
+    """
+    Devuelve una permutación de ``range(len(d))`` que empieza en ``inicio``
+    y recorre todos los puntos con el menor largo que encuentre en el
+    tiempo dado (segundos).
+    """
+    if tiempo_max is None:
+        tiempo_max = _tiempo_max()
+    limite = time.monotonic() + tiempo_max
+
+    ruta = _vecino_mas_cercano(d, inicio)
+    while time.monotonic() < limite:
+        mejoro = _dos_opt(ruta, d, limite)
+        mejoro = _or_opt(ruta, d, limite) or mejoro
+        if not mejoro:
+            break
+    return ruta
+
+
+# ------------------------
+# Paradas de un viaje
+# ------------------------
+
+def _coordenadas(parada):
+    pedido = parada.pedido
+    if pedido.latitud is None or pedido.longitud is None:
+        return None
+    return (round(float(pedido.latitud), 6), round(float(pedido.longitud), 6))
+
+
+def _reescribir_secuencias(viaje, paradas):
+    """
+    Asigna secuencia 1..n a ``paradas`` en ese orden.
+
+    Por el unique (viaje, secuencia) se hace en dos pasos: primero todas
+    pasan a ``-id`` (valores negativos que no chocan entre sí) y luego un
+    solo UPDATE con los valores definitivos.
+    """
+    ahora = timezone.now()
+    ids = [p.pk for p in paradas]
+    Parada.objects.filter(pk__in=ids).update(secuencia=-F('id'))
+    for i, parada in enumerate(paradas, start=1):
+        parada.secuencia = i
+        parada.fecha_actualizacion = ahora
+    Parada.objects.bulk_update(paradas, ['secuencia', 'fecha_actualizacion'])
+    # Las hojas de ruta y cachés que dependen del viaje ven el cambio
+    Viaje.objects.filter(pk=viaje.pk).update(fecha_actualizacion=ahora)
+    condicional.cambiar(Parada, Viaje)
+
+
+def optimizar_ruta(viaje, tiempo_max=None):
+    """
+    Reordena las paradas pendientes del viaje y guarda las nuevas secuencias.
+    Devuelve un ResultadoOptimizacion con los km antes y después (solo del
+    tramo reordenado).
+    """
+    try:
+        pendiente_id = estados_entrega.id_de('PENDIENTE')
+    except EstadoEntrega.DoesNotExist:
+        pendiente_id = None
+
+    with transaction.atomic():
+        # Bloquear el viaje evita chocar con asignaciones concurrentes
+        viaje = Viaje.objects.select_for_update().get(pk=viaje.pk)
+        paradas = list(
+            viaje.paradas
+            .select_related('pedido')
+            .only('id', 'secuencia', 'estado_entrega_id', 'pedido__latitud', 'pedido__longitud')
+            .order_by('secuencia')
+        )
+
+        atendidas, movibles, sin_coordenadas = [], [], []
+        for parada in paradas:
+            if pendiente_id is not None and parada.estado_entrega_id != pendiente_id:
+                atendidas.append(parada)
+            elif _coordenadas(parada) is None:
+                sin_coordenadas.append(parada)
+            else:
+                movibles.append(parada)
+
+        if len(movibles) < 2:
+            return ResultadoOptimizacion(0, len(sin_coordenadas), 0.0, 0.0)
+
+        # Origen: la última parada ya atendida con coordenadas, o el depósito
+        origen = next(
+            (c for c in map(_coordenadas, reversed(atendidas)) if c is not None),
+            _deposito(),
+        )
+        puntos = [_coordenadas(p) for p in movibles]
+        if origen is not None:
+            d = matriz_distancias([origen] + puntos)
+        else:
+            # Origen virtual a distancia 0 de todas: la ruta parte donde convenga
+            d = matriz_distancias(puntos)
+            d = [[0.0] * (len(puntos) + 1)] + [[0.0] + fila for fila in d]
+
+        actual = list(range(len(d)))
+        ruta = optimizar_orden(d, 0, tiempo_max)
+        km_antes, km_despues = largo_ruta(actual, d), largo_ruta(ruta, d)
+
+        if km_despues >= km_antes - EPSILON:
+            return ResultadoOptimizacion(0, len(sin_coordenadas), km_antes, km_antes)
+
+        # Las reordenadas vuelven a los mismos lugares; el resto no se mueve
+        reordenadas = iter(movibles[i - 1] for i in ruta[1:])
+        lugares = {p.pk for p in movibles}
+        nuevo_orden = [next(reordenadas) if p.pk in lugares else p for p in paradas]
+        _reescribir_secuencias(viaje, nuevo_orden)
+
+    return ResultadoOptimizacion(len(movibles), len(sin_coordenadas), km_antes, km_despues)
@@ -0,0 +1,89 @@
+# gestion_gmexpress/secuencias.py
+
+"""
+Correlativos de número de pedido (``PED-YYYYMMDD-NNNN``).
+
+Cada prefijo de fecha tiene una fila en SecuenciaPedido. Un número se
+reserva con un único ``UPDATE ... SET ultimo_numero = ultimo_numero + n``
+y la lectura del valor que dejó: no hay que contar los pedidos del día y
+dos creaciones simultáneas nunca reciben el mismo número. Para cargas
+masivas se puede reservar un bloque completo.
+
+La fila del día se crea antes, sin lecturas con bloqueo: en MySQL (REPEATABLE
+READ) un ``SELECT ... FOR UPDATE`` o un ``UPDATE`` sobre una clave que aún
+no existe toma un gap lock, y dos transacciones que luego insertan esa clave
+se bloquean mutuamente (error 1213, deadlock) justo en el cambio de día.
+
+El bloqueo de la fila dura hasta el fin de la transacción que llama, así que
+conviene reservar fuera de transacciones largas.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Pedido, SecuenciaPedido
+
+FORMATO_PREFIJO = "PED-%Y%m%d-"
+
+
+def prefijo_para(fecha):
+    return fecha.strftime(FORMATO_PREFIJO)
+
+
+def formatear(prefijo, numero):
+    return f"{prefijo}{numero:04d}"
+
+
+def _ultimo_existente(prefijo):
+    """
+    Mayor correlativo ya usado con este prefijo (pedidos anteriores a la
+    secuencia). Usa el índice único de numero_pedido.
+    """
+    ultimo = (
+        Pedido.objects
+        .filter(numero_pedido__startswith=prefijo)
+        .order_by(Length('numero_pedido').desc(), '-numero_pedido')
+        .values_list('numero_pedido', flat=True)
+        .first()
+    )
+    if not ultimo:
+        return 0
+    try:
+        return int(ultimo[len(prefijo):])
+    except ValueError:
+        return 0
+
+
+def _asegurar_fila(prefijo):
+    # get_or_create lee sin bloqueo e inserta en su propio savepoint; si otra
+    # transacción insertó la fila primero, IntegrityError y se vuelve a leer
+    SecuenciaPedido.objects.get_or_create(
+        prefijo=prefijo,
+        defaults={'ultimo_numero': lambda: _ultimo_existente(prefijo)},
+    )
+
+
+def reservar_numeros_pedido(cantidad=1, fecha=None):
+    """
+    Reserva ``cantidad`` números consecutivos para la fecha (hoy por defecto)
+    y los devuelve como lista de strings.
+    """
+    if cantidad < 1:
+        return []
+    prefijo = prefijo_para(fecha or timezone.localdate())
+    _asegurar_fila(prefijo)
+
+    with transaction.atomic():
+        secuencias = SecuenciaPedido.objects.filter(prefijo=prefijo)
+        secuencias.update(ultimo_numero=F('ultimo_numero') + cantidad)
+        # La transacción ve su propio UPDATE y la fila queda bloqueada hasta el final
+        fin = secuencias.values_list('ultimo_numero', flat=True).get()
+
+    inicio = fin - cantidad + 1
+    return [formatear(prefijo, n) for n in range(inicio, fin + 1)]
+
+
+def siguiente_numero_pedido(fecha=None):
+    return reservar_numeros_pedido(1, fecha)[0]
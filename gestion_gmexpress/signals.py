@@ -0,0 +1,289 @@
+# gestion_gmexpress/signals.py
+
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    post_init, post_save, pre_delete, post_delete, m2m_changed,
+)
+from django.dispatch import receiver
+
+from . import bandeja, cajas, condicional, contadores, eventos
+from .catalogos import CATALOGOS
+from .models import (
+    Rol, PerfilUsuario, UsuarioRol,
+    Vehiculo, Conductor, Cliente, Viaje, Pedido, Parada, Notificacion,
+    EstadoPedido, EstadoEntrega, EstadoViaje, EstadoVehiculo, TipoRuta, TipoServicio,
+)
+from .roles import invalidar_roles
+
+# ------------------------
+# Valores originales
+# ------------------------
+# Guardamos al cargar cada instancia los campos que nos interesa comparar
+# después del save, así no hace falta volver a leer la fila.
+
+CAMPOS_SEGUIDOS = {
+    Pedido: ('viaje_id', 'estado_id', 'cliente_id', 'cantidad_cajas'),
+    Viaje: ('fecha_programada', 'estado_id'),
+    Parada: ('viaje_id', 'pedido_id', 'estado_entrega_id'),
+    Notificacion: ('usuario_id', 'leida'),
+}
+
+DIFERIDO = object()
+
+
+def _guardar_originales(instance):
+    instance._originales = {
+        campo: instance.__dict__.get(campo, DIFERIDO)
+        for campo in CAMPOS_SEGUIDOS[type(instance)]
+    }
+
+
+def original(instance, campo):
+    return getattr(instance, '_originales', {}).get(campo, DIFERIDO)
+
+
+def cambio(instance, campo):
+    anterior = original(instance, campo)
+    if anterior is DIFERIDO:
+        return False
+    return anterior != instance.__dict__.get(campo, anterior)
+
+
+@receiver(post_init, sender=Pedido)
+@receiver(post_init, sender=Viaje)
+@receiver(post_init, sender=Parada)
+@receiver(post_init, sender=Notificacion)
+def registrar_originales(sender, instance, **kwargs):
+    _guardar_originales(instance)
+
+
+# ------------------------
+# Roles
+# ------------------------
+
+@receiver([post_save, post_delete], sender=UsuarioRol)
+def invalidar_roles_usuario(sender, instance, **kwargs):
+    invalidar_roles(instance.usuario_id)
+
+
+@receiver(m2m_changed, sender=PerfilUsuario.roles.through)
+def invalidar_roles_m2m(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    # reverse=True: se modificó desde el Rol, afecta a varios perfiles
+    invalidar_roles(None if reverse else instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Rol)
+def invalidar_roles_globales(sender, instance, **kwargs):
+    invalidar_roles()
+
+
+# ------------------------
+# Contadores del dashboard
+# ------------------------
+
+@receiver(post_save, sender=Vehiculo)
+def contar_vehiculo(sender, instance, created, **kwargs):
+    if created:
+        contadores.incrementar(contadores.TOTAL_VEHICULOS)
+
+
+@receiver(post_delete, sender=Vehiculo)
+def descontar_vehiculo(sender, instance, **kwargs):
+    contadores.incrementar(contadores.TOTAL_VEHICULOS, -1)
+
+
+@receiver(post_save, sender=Conductor)
+def contar_conductor(sender, instance, created, **kwargs):
+    if created:
+        contadores.incrementar(contadores.TOTAL_CONDUCTORES)
+
+
+@receiver(post_delete, sender=Conductor)
+def descontar_conductor(sender, instance, **kwargs):
+    contadores.incrementar(contadores.TOTAL_CONDUCTORES, -1)
+
+
+@receiver(post_save, sender=Viaje)
+def contar_viaje(sender, instance, created, **kwargs):
+    if created:
+        contadores.incrementar(contadores.TOTAL_VIAJES)
+        contadores.incrementar(contadores.clave_viajes_fecha(instance.fecha_programada))
+    elif cambio(instance, 'fecha_programada'):
+        anterior = original(instance, 'fecha_programada')
+        contadores.incrementar(contadores.clave_viajes_fecha(anterior), -1)
+        contadores.incrementar(contadores.clave_viajes_fecha(instance.fecha_programada))
+
+
+@receiver(pre_delete, sender=Viaje)
+def preparar_borrado_viaje(sender, instance, **kwargs):
+    # Los pedidos del viaje quedan con viaje=NULL (SET_NULL) sin pasar por save()
+    instance._pedidos_liberados = instance.pedidos.count()
+
+
+@receiver(post_delete, sender=Viaje)
+def descontar_viaje(sender, instance, **kwargs):
+    contadores.incrementar(contadores.TOTAL_VIAJES, -1)
+    contadores.incrementar(contadores.clave_viajes_fecha(instance.fecha_programada), -1)
+    contadores.incrementar(
+        contadores.PEDIDOS_PENDIENTES,
+        getattr(instance, '_pedidos_liberados', 0),
+    )
+
+
+@receiver(post_save, sender=Pedido)
+def contar_pedido(sender, instance, created, **kwargs):
+    if created:
+        contadores.incrementar(contadores.TOTAL_PEDIDOS)
+        if instance.viaje_id is None:
+            contadores.incrementar(contadores.PEDIDOS_PENDIENTES)
+    elif cambio(instance, 'viaje_id'):
+        if instance.viaje_id is None:
+            contadores.incrementar(contadores.PEDIDOS_PENDIENTES)
+        elif original(instance, 'viaje_id') is None:
+            contadores.incrementar(contadores.PEDIDOS_PENDIENTES, -1)
+
+
+@receiver(post_delete, sender=Pedido)
+def descontar_pedido(sender, instance, **kwargs):
+    contadores.incrementar(contadores.TOTAL_PEDIDOS, -1)
+    if instance.viaje_id is None:
+        contadores.incrementar(contadores.PEDIDOS_PENDIENTES, -1)
+
+
+# ------------------------
+# Catálogos de estados
+# ------------------------
+
+@receiver([post_save, post_delete], sender=EstadoPedido)
+@receiver([post_save, post_delete], sender=EstadoEntrega)
+@receiver([post_save, post_delete], sender=EstadoViaje)
+@receiver([post_save, post_delete], sender=EstadoVehiculo)
+@receiver([post_save, post_delete], sender=TipoServicio)
+def invalidar_catalogo(sender, instance, **kwargs):
+    CATALOGOS[sender].invalidar()
+
+
+# ------------------------
+# Total de cajas por viaje
+# ------------------------
+
+def _cajas_parada(parada):
+    # Si el pedido ya está cargado (p. ej. desde el formulario) no consultamos
+    if Parada.pedido.is_cached(parada):
+        return parada.pedido.cantidad_cajas
+    return cajas.cajas_de_pedido(parada.pedido_id)
+
+
+@receiver(post_save, sender=Parada)
+def sumar_cajas_parada(sender, instance, created, **kwargs):
+    if created:
+        cajas.ajustar_cajas(instance.viaje_id, _cajas_parada(instance))
+        return
+
+    if cambio(instance, 'viaje_id') or cambio(instance, 'pedido_id'):
+        pedido_anterior = original(instance, 'pedido_id')
+        cajas.ajustar_cajas(
+            original(instance, 'viaje_id'),
+            -cajas.cajas_de_pedido(pedido_anterior),
+        )
+        cajas.ajustar_cajas(instance.viaje_id, _cajas_parada(instance))
+
+
+@receiver(post_delete, sender=Parada)
+def restar_cajas_parada(sender, instance, **kwargs):
+    cajas.ajustar_cajas(instance.viaje_id, -cajas.cajas_de_pedido(instance.pedido_id))
+
+
+@receiver(post_save, sender=Pedido)
+def ajustar_cajas_pedido(sender, instance, created, **kwargs):
+    if not created and cambio(instance, 'cantidad_cajas'):
+        cajas.ajustar_cajas_por_pedido(
+            instance.pk,
+            instance.cantidad_cajas - original(instance, 'cantidad_cajas'),
+        )
+
+
+# ------------------------
+# Cambios de estado en vivo (SSE, ver eventos.py)
+# ------------------------
+
+@receiver(post_save, sender=Viaje)
+def publicar_estado_viaje(sender, instance, created, **kwargs):
+    if not created and cambio(instance, 'estado_id'):
+        eventos.publicar(eventos.evento_viaje(instance))
+
+
+@receiver(post_save, sender=Parada)
+def publicar_estado_parada(sender, instance, created, **kwargs):
+    if not created and cambio(instance, 'estado_entrega_id'):
+        eventos.publicar(eventos.evento_parada(instance))
+
+
+@receiver(post_save, sender=Pedido)
+def publicar_estado_pedido(sender, instance, created, **kwargs):
+    if created or cambio(instance, 'estado_id'):
+        eventos.publicar(eventos.evento_pedido(instance))
+
+
+# ------------------------
+# Notificaciones no leídas (ver bandeja.py)
+# ------------------------
+
+@receiver(post_save, sender=Notificacion)
+def contar_no_leida(sender, instance, created, **kwargs):
+    if created:
+        if not instance.leida:
+            bandeja.sumar_no_leidas({instance.usuario_id: 1})
+        return
+    if not (cambio(instance, 'leida') or cambio(instance, 'usuario_id')):
+        return
+    deltas = Counter()
+    if not original(instance, 'leida'):
+        deltas[original(instance, 'usuario_id')] -= 1
+    if not instance.leida:
+        deltas[instance.usuario_id] += 1
+    bandeja.sumar_no_leidas(deltas)
+
+
+@receiver(post_delete, sender=Notificacion)
+def descontar_no_leida(sender, instance, **kwargs):
+    if not instance.leida:
+        bandeja.sumar_no_leidas({instance.usuario_id: -1})
+
+
+# ------------------------
+# Marcas de versión para el GET condicional (ver condicional.py)
+# ------------------------
+
+@receiver([post_save, post_delete], sender=Vehiculo)
+@receiver([post_save, post_delete], sender=Conductor)
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Viaje)
+@receiver([post_save, post_delete], sender=Pedido)
+@receiver([post_save, post_delete], sender=Parada)
+@receiver([post_save, post_delete], sender=PerfilUsuario)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=EstadoPedido)
+@receiver([post_save, post_delete], sender=EstadoEntrega)
+@receiver([post_save, post_delete], sender=EstadoViaje)
+@receiver([post_save, post_delete], sender=EstadoVehiculo)
+@receiver([post_save, post_delete], sender=TipoRuta)
+@receiver([post_save, post_delete], sender=TipoServicio)
+def cambiar_version(sender, update_fields=None, **kwargs):
+    # El login solo guarda last_login: no cambia ninguna página
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    condicional.cambiar(sender)
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_save, sender=Viaje)
+@receiver(post_save, sender=Parada)
+@receiver(post_save, sender=Notificacion)
+def actualizar_originales(sender, instance, **kwargs):
+    # Conectado al final: los receptores anteriores ya compararon
+    _guardar_originales(instance)
@@ -0,0 +1,29 @@
+// Estados en vivo: escucha el flujo SSE de /eventos/ (ver eventos.py) y
+// actualiza los elementos marcados con data-estado="<tipo>:<id>".
+// Los canales salen del atributo data-sse-canales (separados por espacio).
+(function () {
+    const raiz = document.querySelector('[data-sse-canales]');
+    if (!raiz || !window.EventSource) {
+        return;
+    }
+
+    const canales = raiz.dataset.sseCanales.split(' ').filter(Boolean);
+    if (!canales.length) {
+        return;
+    }
+    const consulta = canales.map(c => 'canal=' + encodeURIComponent(c)).join('&');
+    const fuente = new EventSource(raiz.dataset.sseUrl + '?' + consulta);
+
+    function actualizar(clave, estado) {
+        document.querySelectorAll('[data-estado="' + clave + '"]').forEach(function (el) {
+            el.textContent = estado;
+        });
+    }
+
+    ['viaje', 'parada', 'pedido'].forEach(function (tipo) {
+        fuente.addEventListener(tipo, function (e) {
+            const datos = JSON.parse(e.data);
+            actualizar(tipo + ':' + datos[tipo], datos.estado);
+        });
+    });
+})();
@@ -1,3 +1,1896 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import multiprocessing
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.views.generic import ListView
+
+from . import contadores
+from .asignacion import asignar_pedidos_a_viaje
+from .bandeja import marcar_todas_leidas
+from .cajas import reparar_cajas
+from .catalogos import estados_entrega, estados_pedido, estados_viaje
+from .condicional import _marcar, versiones
+from .despacho import ejecutar_plan, planificar
+from .entregas import Actualizacion, aplicar_actualizaciones
+from .consultas_lentas import huella, leer as leer_consultas_lentas
+from .hojas_ruta import _en_curso, _obtener_pool, obtener_hoja
+from .importacion import ArchivoInvalido, importar_pedidos
+from .eventos import BrokerBaseDatos, BrokerMemoria, canales_permitidos
+from .metricas import Registro, cuantil, exposicion, registro
+from .secuencias import reservar_numeros_pedido, siguiente_numero_pedido
+from .notificaciones import aviso_estado_pedido, despachar_lote, encolar
+from .paginacion import CursorPaginationMixin
+from .pestanas import pestanas_estado
+from .procesos import llamar
+from .reportes import CAMPOS_REPORTE, generar_rango, generar_reportes
+from .rutas import optimizar_ruta
+from .urls import urlpatterns
+from .models import (
+    Rol, PerfilUsuario, UsuarioRol, Cliente, Conductor, Vehiculo, Viaje, Pedido, Parada,
+    HistorialEstadoPedido, Notificacion, SecuenciaPedido, SincronizacionEntrega, EnvioNotificacion,
+    ContadorDashboard, ReporteViaje,
+    EstadoPedido, EstadoViaje, EstadoEntrega, EstadoVehiculo, TipoRuta, TipoServicio,
+)
+
+
+def _evento(viaje_id, estado):
+    return [f'viaje:{viaje_id}'], {'tipo': 'viaje', 'viaje': viaje_id, 'estado': estado}
+
+
+def _perfil(username, rol=None):
+    perfil = PerfilUsuario.objects.create(
+        user=User.objects.create_user(username, password='x'),
+    )
+    if rol:
+        UsuarioRol.objects.create(usuario=perfil, rol=Rol.objects.get_or_create(nombre=rol)[0])
+    return perfil
+
+
+class DatosViajeMixin:
+    """
+    Un viaje PROGRAMADO con su conductor y un pedido de un cliente.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        for i, nombre in enumerate(['PROGRAMADO', 'EN_CURSO', 'COMPLETADO']):
+            EstadoViaje.objects.create(nombre=nombre, orden=i)
+        cls.pendiente = EstadoPedido.objects.create(nombre='PENDIENTE_ASIGNACION', orden=0)
+
+        cls.admin = _perfil('admin', 'ADMIN')
+        cls.perfil_conductor = _perfil('conductor', 'CONDUCTOR')
+        cls.perfil_cliente = _perfil('cliente', 'CLIENTE')
+
+        cls.conductor = Conductor.objects.create(
+            usuario=cls.perfil_conductor, numero_licencia='L1', tipo_licencia='A2',
+            vencimiento_licencia=timezone.localdate(),
+        )
+        vehiculo = Vehiculo.objects.create(
+            placa='AA11', marca='T', modelo='H', anio=2020, capacidad_cajas=100,
+            estado=EstadoVehiculo.objects.create(nombre='DISPONIBLE'),
+        )
+        cls.viaje = Viaje.objects.create(
+            nombre_ruta='R1', tipo_ruta=TipoRuta.objects.create(nombre='URBANA'),
+            origen='A', destino='B', fecha_programada=timezone.localdate(), hora_salida='08:00',
+            vehiculo=vehiculo, conductor=cls.conductor,
+            estado=EstadoViaje.objects.get(nombre='PROGRAMADO'), creado_por=cls.admin,
+        )
+        cls.cliente = Cliente.objects.create(
+            perfil=cls.perfil_cliente, nombre='ACME', email='a@a.cl', telefono='1',
+        )
+        cls.pedido = Pedido.objects.create(
+            numero_pedido='P1', cliente=cls.cliente, direccion_entrega='x', ciudad='S', comuna='C',
+            tipo_servicio=TipoServicio.objects.create(nombre='Almuerzo', precio_por_racion=1),
+            cantidad_cajas=1, estado=cls.pendiente,
+        )
+
+
+# ------------------------
+# Roles
+# ------------------------
+
+@override_settings(GMEXPRESS_ROLES_CACHE_TIMEOUT=300)
+class RolesTests(DatosViajeMixin, TestCase):
+    """
+    Con la caché entre requests activa, un cambio de roles se ve en el
+    request siguiente.
+    """
+    def setUp(self):
+        cache.clear()
+        self.perfil = _perfil('logistica', 'LOGISTICA')
+        self.client.force_login(self.perfil.user)
+        self.gestion = reverse('vehiculo-list')
+        self.admin_url = reverse('pedido-estado', args=[self.pedido.pk])
+
+    def test_agregar_y_quitar_un_rol(self):
+        self.assertEqual(self.client.get(self.gestion).status_code, 200)
+        self.assertEqual(self.client.get(self.admin_url).status_code, 403)
+
+        rol_admin = Rol.objects.get(nombre='ADMIN')
+        UsuarioRol.objects.create(usuario=self.perfil, rol=rol_admin)
+        self.assertEqual(self.client.get(self.admin_url).status_code, 200)
+
+        UsuarioRol.objects.filter(usuario=self.perfil).delete()
+        self.assertEqual(self.client.get(self.gestion).status_code, 403)
+        self.assertEqual(self.client.get(self.admin_url).status_code, 403)
+
+    def test_desactivar_un_rol_afecta_a_todos(self):
+        self.assertEqual(self.client.get(self.gestion).status_code, 200)
+        rol = Rol.objects.get(nombre='LOGISTICA')
+        rol.activo = False
+        rol.save()
+        self.assertEqual(self.client.get(self.gestion).status_code, 403)
+
+
+# ------------------------
+# Contadores del dashboard
+# ------------------------
+
+class ContadoresTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        EstadoEntrega.objects.create(nombre='PENDIENTE')
+
+    def _contadores(self):
+        # Las claves por fecha en 0 equivalen a que no exista la fila
+        return {
+            clave: valor
+            for clave, valor in ContadorDashboard.objects.values_list('clave', 'valor')
+            if valor
+        }
+
+    def test_los_caminos_masivos_cuadran_con_recalcular(self):
+        contadores.recalcular_todos()
+
+        manana = (timezone.localdate() + timedelta(days=1)).isoformat()
+        archivo = io.BytesIO((
+            'Tipo de servicio;Raciones;Dirección;Ciudad;Comuna;Fecha\n'
+            f'Almuerzo;10;Av. Uno 1;Santiago;Ñuñoa;{manana}\n'
+            f'Almuerzo;5;Av. Dos 2;Santiago;Maipú;{manana}\n'
+        ).encode())
+        importados = importar_pedidos(archivo, 'pedidos.csv', self.cliente)
+        self.assertEqual(importados.creados, 2)
+
+        nuevos = list(Pedido.objects.exclude(pk=self.pedido.pk).values_list('pk', flat=True))
+        asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk, nuevos[0]], self.admin)
+        Viaje.objects.create(
+            nombre_ruta='R2', tipo_ruta=self.viaje.tipo_ruta, origen='A', destino='B',
+            fecha_programada=timezone.localdate() + timedelta(days=1), hora_salida='09:00',
+            vehiculo=self.viaje.vehiculo, conductor=self.conductor, estado=self.viaje.estado,
+            creado_por=self.admin,
+        )
+        Pedido.objects.get(pk=nuevos[1]).delete()
+
+        incrementales = self._contadores()
+        self.assertEqual(incrementales.get(contadores.PEDIDOS_PENDIENTES, 0), 0)
+        self.assertEqual(incrementales[contadores.TOTAL_PEDIDOS], 2)
+        contadores.recalcular_todos()
+        self.assertEqual(incrementales, self._contadores())
+
+
+# ------------------------
+# Paginación por cursor
+# ------------------------
+
+class _ListadoPedidos(CursorPaginationMixin, ListView):
+    model = Pedido
+
+
+class CursorPaginacionTests(DatosViajeMixin, TestCase):
+    POR_PAGINA = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(2, 9):
+            Pedido.objects.create(
+                numero_pedido=f'P{i}', cliente=cls.cliente, direccion_entrega='x', ciudad='S',
+                comuna='C', tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1,
+                estado=cls.pendiente,
+            )
+        # Empates en fecha_creacion: el id decide el orden
+        ahora = timezone.now()
+        Pedido.objects.filter(pk__gt=cls.pedido.pk + 2).update(fecha_creacion=ahora)
+        Pedido.objects.filter(pk__lte=cls.pedido.pk + 2).update(fecha_creacion=ahora - timedelta(hours=1))
+        cls.orden = list(Pedido.objects.order_by('-fecha_creacion', '-id').values_list('pk', flat=True))
+
+    def _pagina(self, cursor=None):
+        vista = _ListadoPedidos()
+        vista.setup(RequestFactory().get('/', {'cursor': cursor} if cursor else {}))
+        return vista.paginate_queryset(Pedido.objects.all(), self.POR_PAGINA)[1]
+
+    def test_ida_y_vuelta(self):
+        paginas, pagina = [], self._pagina()
+        self.assertFalse(pagina.has_previous())
+        while True:
+            paginas.append([p.pk for p in pagina])
+            if not pagina.has_next():
+                break
+            pagina = self._pagina(pagina.cursor_siguiente)
+        self.assertEqual(sum(paginas, []), self.orden)
+        self.assertEqual([len(p) for p in paginas], [3, 3, 2])
+
+        # De vuelta desde la última página se recorren las mismas
+        for esperada in reversed(paginas[:-1]):
+            pagina = self._pagina(pagina.cursor_anterior)
+            self.assertEqual([p.pk for p in pagina], esperada)
+            self.assertTrue(pagina.has_next())
+        self.assertFalse(pagina.has_previous())
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        def codificar(datos):
+            return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip('=')
+
+        primera = [p.pk for p in self._pagina()]
+        for cursor in [
+            'no-es-un-cursor',
+            codificar(['x', ['2030-01-01T00:00:00+00:00', 1]]),
+            codificar(['s', [1]]),
+            codificar(['s', [None, 1]]),
+            codificar(['s', ['ayer', 1]]),
+            codificar(['s', ['2030-01-01T00:00:00+00:00', 'uno']]),
+            codificar(5),
+        ]:
+            with self.subTest(cursor=cursor):
+                pagina = self._pagina(cursor)
+                self.assertEqual([p.pk for p in pagina], primera)
+                self.assertFalse(pagina.has_previous())
+
+
+# ------------------------
+# Pestañas por estado
+# ------------------------
+
+class PestanasTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.asignado = EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        otro = Cliente.objects.create(nombre='OTRO', email='o@o.cl', telefono='2')
+        for i, (cliente, estado) in enumerate([
+            (cls.cliente, cls.asignado), (otro, cls.pendiente), (otro, cls.asignado), (otro, cls.asignado),
+        ], start=2):
+            Pedido.objects.create(
+                numero_pedido=f'P{i}', cliente=cliente, direccion_entrega='x', ciudad='S', comuna='C',
+                tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1, estado=estado,
+            )
+
+    def setUp(self):
+        # Las versiones vuelven a empezar en cada test; la caché no
+        cache.clear()
+        estados_pedido.invalidar()
+        self.addCleanup(estados_pedido.invalidar)
+
+    def _pestanas(self, cliente_id=None):
+        base = Pedido.objects.all()
+        if cliente_id is not None:
+            base = base.filter(cliente_id=cliente_id)
+        pestanas, total = pestanas_estado(base, cliente_id)
+        return [(p['nombre'], p['count']) for p in pestanas], total
+
+    def test_conteos_por_alcance(self):
+        self.assertEqual(self._pestanas(), ([('PENDIENTE_ASIGNACION', 2), ('ASIGNADO', 3)], 5))
+        self.assertEqual(
+            self._pestanas(self.cliente.pk), ([('PENDIENTE_ASIGNACION', 1), ('ASIGNADO', 1)], 2),
+        )
+        # Con la versión ya leída (como en el listado) no hay consultas
+        version = versiones(Pedido)[Pedido][0]
+        with self.assertNumQueries(0):
+            pestanas_estado(Pedido.objects.all(), None, version)
+
+    def test_cambio_con_senales(self):
+        self._pestanas(self.cliente.pk)
+        self.pedido.estado = self.asignado
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.save()
+        self.assertEqual(self._pestanas(self.cliente.pk), ([('ASIGNADO', 2)], 2))
+
+    def test_el_cambio_hecho_en_otro_worker_invalida(self):
+        self._pestanas()
+        # Otro worker cambia los pedidos: aquí no corre ninguna señal y su
+        # caché local no se toca; solo sube la versión compartida
+        Pedido.objects.update(estado=self.asignado)
+        self.assertEqual(self._pestanas()[0], [('PENDIENTE_ASIGNACION', 2), ('ASIGNADO', 3)])
+        _marcar([Pedido._meta.label_lower])
+        self.assertEqual(self._pestanas(), ([('ASIGNADO', 5)], 5))
+
+
+# ------------------------
+# Números de pedido
+# ------------------------
+
+class SecuenciaPedidoTests(DatosViajeMixin, TestCase):
+    def test_continua_despues_de_los_pedidos_existentes(self):
+        dia = date(2031, 5, 4)
+        Pedido.objects.filter(pk=self.pedido.pk).update(numero_pedido='PED-20310504-0007')
+        self.assertEqual(siguiente_numero_pedido(dia), 'PED-20310504-0008')
+        self.assertEqual(
+            reservar_numeros_pedido(3, dia),
+            ['PED-20310504-0009', 'PED-20310504-0010', 'PED-20310504-0011'],
+        )
+        self.assertEqual(SecuenciaPedido.objects.get(prefijo='PED-20310504-').ultimo_numero, 11)
+
+    def test_cada_dia_empieza_en_uno(self):
+        self.assertEqual(siguiente_numero_pedido(date(2031, 5, 4)), 'PED-20310504-0001')
+        self.assertEqual(siguiente_numero_pedido(date(2031, 5, 5)), 'PED-20310505-0001')
+        self.assertEqual(siguiente_numero_pedido(date(2031, 5, 4)), 'PED-20310504-0002')
+        self.assertEqual(reservar_numeros_pedido(0), [])
+
+
+class SecuenciaPedidoConcurrenciaTests(TransactionTestCase):
+    HILOS = 8
+    RESERVAS = 5
+
+    def test_reservas_simultaneas_en_el_cambio_de_dia(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("SQLite en memoria no admite escritores concurrentes.")
+        # Nadie reservó aún este día: todos compiten por crear la fila
+        dia = date(2031, 1, 1)
+        barrera = threading.Barrier(self.HILOS)
+        numeros, errores = [], []
+
+        def reservar():
+            try:
+                barrera.wait()
+                for _ in range(self.RESERVAS):
+                    numeros.extend(reservar_numeros_pedido(3, dia))
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=reservar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        total = self.HILOS * self.RESERVAS * 3
+        self.assertEqual(sorted(numeros), [f'PED-20310101-{n:04d}' for n in range(1, total + 1)])
+
+
+# ------------------------
+# Total de cajas por viaje
+# ------------------------
+
+class ReparacionCajasTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.entrega = EstadoEntrega.objects.create(nombre='PENDIENTE')
+        Parada.objects.create(viaje=cls.viaje, pedido=cls.pedido, secuencia=1, estado_entrega=cls.entrega)
+        cls.otro = Viaje.objects.create(
+            nombre_ruta='R2', tipo_ruta=cls.viaje.tipo_ruta, origen='A', destino='B',
+            fecha_programada=cls.viaje.fecha_programada, hora_salida='09:00', vehiculo=cls.viaje.vehiculo,
+            conductor=cls.conductor, estado=cls.viaje.estado, creado_por=cls.admin,
+        )
+
+    def _totales(self):
+        return dict(Viaje.objects.values_list('pk', 'cantidad_cajas_total'))
+
+    def test_corrige_solo_los_descuadrados(self):
+        Viaje.objects.filter(pk=self.viaje.pk).update(cantidad_cajas_total=7)
+        Viaje.objects.filter(pk=self.otro.pk).update(cantidad_cajas_total=3)
+        self.assertEqual(reparar_cajas(tamano_lote=1)[1], 2)
+        self.assertEqual(self._totales(), {self.viaje.pk: 1, self.otro.pk: 0})
+        self.assertEqual(reparar_cajas()[1], 0)
+
+    def test_no_pisa_un_delta_concurrente(self):
+        Viaje.objects.filter(pk=self.viaje.pk).update(cantidad_cajas_total=7)
+        pedido = Pedido.objects.create(
+            numero_pedido='P2', cliente=self.cliente, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=self.pedido.tipo_servicio, cantidad_cajas=5, estado=self.pendiente,
+        )
+        inyectado = []
+
+        def otra_asignacion(execute, sql, params, many, contexto):
+            # Justo antes de escribir la reparación llega una parada nueva
+            # con su delta F() (como si viniera de otra conexión)
+            if not inyectado and sql.lstrip().upper().startswith('UPDATE'):
+                inyectado.append(sql)
+                Parada.objects.create(viaje=self.viaje, pedido=pedido, secuencia=2, estado_entrega=self.entrega)
+            return execute(sql, params, many, contexto)
+
+        with connection.execute_wrapper(otra_asignacion):
+            reparar_cajas()
+        self.assertTrue(inyectado)
+        self.assertEqual(self._totales()[self.viaje.pk], 6)
+
+
+# ------------------------
+# Catálogos en memoria
+# ------------------------
+
+class CatalogosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i, nombre in enumerate(['PENDIENTE_ASIGNACION', 'ASIGNADO', 'ENTREGADO']):
+            EstadoPedido.objects.create(nombre=nombre, orden=i)
+
+    def setUp(self):
+        # Son de todo el proceso: que no arrastren lo de otra prueba revertida
+        estados_pedido.invalidar()
+
+    def test_responde_de_memoria(self):
+        estados_pedido.todos()
+        with self.assertNumQueries(0):
+            asignado = estados_pedido.por_nombre('ASIGNADO')
+            self.assertEqual(estados_pedido.por_id(asignado.pk), asignado)
+            self.assertEqual(
+                [e.nombre for e in estados_pedido.todos()], ['PENDIENTE_ASIGNACION', 'ASIGNADO', 'ENTREGADO'],
+            )
+            with self.assertRaises(EstadoPedido.DoesNotExist):
+                estados_pedido.por_nombre('CANCELADO')
+            with self.assertRaises(EstadoPedido.DoesNotExist):
+                estados_pedido.por_id('x')
+
+    def test_un_cambio_local_se_ve_de_inmediato(self):
+        estado = estados_pedido.por_nombre('ASIGNADO')
+        EstadoPedido.objects.filter(pk=estado.pk).get().delete()
+        with self.assertRaises(EstadoPedido.DoesNotExist):
+            estados_pedido.por_nombre('ASIGNADO')
+
+    def test_el_cambio_de_otro_worker_llega_en_la_verificacion(self):
+        with override_settings(GMEXPRESS_CATALOGOS_VERIFICACION=3600):
+            estados_pedido.todos()
+            # Otro proceso agrega un estado: comparte la base, no esta caché
+            EstadoPedido.objects.bulk_create([EstadoPedido(nombre='CANCELADO', orden=9)])
+            _marcar([EstadoPedido._meta.label_lower])
+            with self.assertRaises(EstadoPedido.DoesNotExist):
+                estados_pedido.por_nombre('CANCELADO')
+        with override_settings(GMEXPRESS_CATALOGOS_VERIFICACION=0):
+            self.assertEqual(estados_pedido.por_nombre('CANCELADO').orden, 9)
+
+
+# ------------------------
+# Asignación masiva
+# ------------------------
+
+class AsignacionMasivaTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.asignado = EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        EstadoEntrega.objects.create(nombre='PENDIENTE')
+        cls.pedido2 = Pedido.objects.create(
+            numero_pedido='P2', cliente=cls.cliente, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=3, estado=cls.pendiente,
+        )
+
+    def test_aplica_los_efectos_de_las_senales(self):
+        self.assertEqual(contadores.leer([contadores.PEDIDOS_PENDIENTES])[contadores.PEDIDOS_PENDIENTES], 2)
+        pestanas_estado(Pedido.objects.all())
+        pestanas_estado(Pedido.objects.filter(cliente=self.cliente), self.cliente.pk)
+        marcas = versiones(Pedido, Parada)
+
+        self.client.force_login(self.admin.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(
+                reverse('viaje-asignacion-masiva', args=[self.viaje.pk]),
+                {'pedidos': [self.pedido2.pk, self.pedido.pk]},
+            )
+        self.assertRedirects(respuesta, reverse('viaje-detail', args=[self.viaje.pk]))
+
+        # Paradas al final de la ruta, en el orden marcado
+        self.assertEqual(
+            list(self.viaje.paradas.order_by('secuencia').values_list('pedido__numero_pedido', 'secuencia')),
+            [('P2', 1), ('P1', 2)],
+        )
+        self.assertEqual(
+            set(Pedido.objects.values_list('viaje_id', 'estado_id')),
+            {(self.viaje.pk, self.asignado.pk)},
+        )
+        historial = HistorialEstadoPedido.objects.filter(estado=self.asignado)
+        self.assertEqual(historial.count(), 2)
+        self.assertTrue(all(h.cambiado_por_id == self.admin.pk for h in historial))
+
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.cantidad_cajas_total, 4)
+        self.assertEqual(contadores.leer([contadores.PEDIDOS_PENDIENTES])[contadores.PEDIDOS_PENDIENTES], 0)
+        # Las pestañas (global y del cliente) se recalculan con el nuevo estado
+        for cliente_id in (None, self.cliente.pk):
+            pestanas, total = pestanas_estado(Pedido.objects.all(), cliente_id)
+            self.assertEqual([(p['nombre'], p['count']) for p in pestanas], [('ASIGNADO', 2)])
+        nuevas = versiones(Pedido, Parada)
+        self.assertTrue(all(nuevas[m] != marcas[m] for m in marcas))
+
+    def test_los_ya_asignados_se_omiten(self):
+        self.assertEqual(asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk]), [self.pedido])
+        self.assertEqual(asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk, self.pedido2.pk]), [self.pedido2])
+        self.assertEqual(asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk, self.pedido2.pk]), [])
+
+        self.assertEqual(list(self.viaje.paradas.order_by('secuencia').values_list('secuencia', flat=True)), [1, 2])
+        self.assertEqual(HistorialEstadoPedido.objects.filter(estado=self.asignado).count(), 2)
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.cantidad_cajas_total, 4)
+
+
+# ------------------------
+# Importación de pedidos
+# ------------------------
+
+def _xlsx(filas, compartidos=()):
+    """
+    XLSX mínimo con una hoja; ``filas`` es una lista de listas de XML de celdas.
+    """
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w') as zf:
+        zf.writestr('xl/workbook.xml', f'<workbook {ns} {rel}><sheets><sheet name="H" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        zf.writestr(
+            'xl/_rels/workbook.xml.rels',
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>',
+        )
+        zf.writestr('xl/sharedStrings.xml', f'<sst {ns}>' + ''.join(f'<si><t>{t}</t></si>' for t in compartidos) + '</sst>')
+        zf.writestr('xl/worksheets/sheet1.xml', f'<worksheet {ns}><sheetData>' + ''.join(
+            '<row>' + ''.join(celdas) + '</row>' for celdas in filas
+        ) + '</sheetData></worksheet>')
+    salida.seek(0)
+    return salida
+
+
+class ImportacionPedidosTests(DatosViajeMixin, TestCase):
+    ENCABEZADO = 'Tipo de servicio;Raciones;Dirección;Ciudad;Comuna;Fecha\n'
+
+    def _csv(self, *filas, codificacion='utf-8'):
+        return io.BytesIO((self.ENCABEZADO + ''.join(f + '\n' for f in filas)).encode(codificacion))
+
+    def test_importa_todo_con_numeros_y_montos(self):
+        manana = (timezone.localdate() + timedelta(days=1)).isoformat()
+        resultado = importar_pedidos(self._csv(
+            f'Almuerzo;10;Av. Uno 1;Santiago;Ñuñoa;{manana}',
+            f'almuerzo;5;Av. Dos 2;Santiago;Providencia;{manana}',
+        ), 'pedidos.csv', self.cliente)
+        self.assertEqual((resultado.filas, resultado.creados, resultado.errores), (2, 2, []))
+        nuevos = Pedido.objects.filter(cliente=self.cliente).exclude(pk=self.pedido.pk).order_by('numero_pedido')
+        self.assertEqual([p.monto_total for p in nuevos], [10, 5])
+        self.assertEqual(len({p.numero_pedido for p in nuevos}), 2)
+        self.assertEqual(nuevos[0].comuna, 'Ñuñoa')
+
+    def test_una_fila_mala_no_guarda_nada(self):
+        resultado = importar_pedidos(self._csv(
+            'Almuerzo;10;Av. Uno 1;Santiago;Ñuñoa;',
+            'Once;0;;Santiago;Ñuñoa;31-02-2030',
+        ), 'pedidos.csv', self.cliente)
+        self.assertEqual(resultado.creados, 0)
+        self.assertEqual(
+            {(e.fila, e.columna) for e in resultado.errores},
+            {(3, 'direccion_entrega'), (3, 'tipo_servicio'), (3, 'cantidad_cajas'), (3, 'fecha_entrega_solicitada')},
+        )
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_raciones_no_enteras(self):
+        resultado = importar_pedidos(self._csv(
+            'Almuerzo;2,0;Av. Uno 1;Santiago;Ñuñoa;',
+            'Almuerzo;2.5;Av. Dos 2;Santiago;Ñuñoa;',
+            'Almuerzo;Infinity;Av. Tres 3;Santiago;Ñuñoa;',
+        ), 'pedidos.csv', self.cliente)
+        self.assertEqual(
+            [(e.fila, e.columna, e.mensaje) for e in resultado.errores],
+            [(3, 'cantidad_cajas', "Debe ser un entero mayor que 0."),
+             (4, 'cantidad_cajas', "Debe ser un entero mayor que 0.")],
+        )
+        self.assertEqual(resultado.creados, 0)
+
+    def test_csv_de_excel_en_windows(self):
+        # cp1252: "Ñuñoa" no es UTF-8 válido
+        archivo = self._csv('Almuerzo;3;Av. Uno 1;Santiago;Ñuñoa;', codificacion='cp1252')
+        self.assertEqual(importar_pedidos(archivo, 'pedidos.csv', self.cliente).creados, 1)
+        self.assertTrue(Pedido.objects.filter(comuna='Ñuñoa').exists())
+
+        self.client.force_login(self.perfil_cliente.user)
+        subida = SimpleUploadedFile('pedidos.csv', self._csv(
+            'Almuerzo;4;Av. Dos 2;Santiago;Ñuñoa;', codificacion='cp1252',
+        ).getvalue())
+        self.assertRedirects(
+            self.client.post(reverse('pedido-import'), {'archivo': subida}),
+            reverse('mis-pedidos'), fetch_redirect_response=False,
+        )
+
+    def test_xlsx(self):
+        compartidos = ['Tipo de servicio', 'Raciones', 'Dirección', 'Ciudad', 'Comuna', 'Almuerzo', 'Ñuñoa']
+        encabezado = [f'<c r="{c}1" t="s"><v>{i}</v></c>' for i, c in enumerate('ABCDE')]
+        fila = [
+            '<c r="A2" t="s"><v>5</v></c>', '<c r="B2"><v>7</v></c>',
+            '<c r="C2" t="inlineStr"><is><t>Av. Tres 3</t></is></c>',
+            '<c r="D2" t="inlineStr"><is><t>Santiago</t></is></c>', '<c r="E2" t="s"><v>6</v></c>',
+        ]
+        resultado = importar_pedidos(_xlsx([encabezado, fila], compartidos), 'p.xlsx', self.cliente)
+        self.assertEqual(resultado.creados, 1)
+        self.assertTrue(Pedido.objects.filter(comuna='Ñuñoa', cantidad_cajas=7).exists())
+
+    def test_archivos_danados(self):
+        with self.assertRaises(ArchivoInvalido):
+            importar_pedidos(io.BytesIO(b'no es un zip'), 'p.xlsx', self.cliente)
+        # Índice de texto compartido que no existe
+        with self.assertRaises(ArchivoInvalido):
+            importar_pedidos(_xlsx([['<c r="A1" t="s"><v>9</v></c>']]), 'p.xlsx', self.cliente)
+        with self.assertRaisesMessage(ArchivoInvalido, 'Faltan columnas obligatorias'):
+            importar_pedidos(io.BytesIO(b'a,b\n1,2\n'), 'p.csv', self.cliente)
+
+
+# ------------------------
+# Optimización de rutas
+# ------------------------
+
+@override_settings(GMEXPRESS_RUTAS_DEPOSITO=None)
+class OptimizacionRutaTests(DatosViajeMixin, TestCase):
+    """
+    Puntos sobre el ecuador: la longitud ordena las paradas y la mejor ruta
+    desde la última atendida (longitud 0) es de menor a mayor.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pendiente_entrega = EstadoEntrega.objects.create(nombre='PENDIENTE')
+        cls.entregado = EstadoEntrega.objects.create(nombre='ENTREGADO')
+
+    def setUp(self):
+        estados_entrega.invalidar()
+        self.addCleanup(estados_entrega.invalidar)
+
+    def _parada(self, secuencia, longitud, estado=None):
+        pedido = Pedido.objects.create(
+            numero_pedido=f'R{secuencia}', cliente=self.cliente, direccion_entrega='x',
+            ciudad='S', comuna='C', tipo_servicio=self.pedido.tipo_servicio, cantidad_cajas=1,
+            estado=self.pendiente, latitud=None if longitud is None else 0,
+            longitud=longitud,
+        )
+        return Parada.objects.create(
+            viaje=self.viaje, pedido=pedido, secuencia=secuencia,
+            estado_entrega=estado or self.pendiente_entrega,
+        )
+
+    def _orden(self):
+        return list(self.viaje.paradas.order_by('secuencia').values_list('pedido__numero_pedido', flat=True))
+
+    def test_reordena_solo_los_lugares_de_las_pendientes(self):
+        self._parada(1, 5, self.entregado)
+        self._parada(2, 3)
+        self._parada(3, None)
+        self._parada(4, 1)
+        self._parada(5, 0, self.entregado)
+        self._parada(6, 2)
+
+        resultado = optimizar_ruta(self.viaje, tiempo_max=1)
+
+        self.assertEqual(resultado.reordenadas, 3)
+        self.assertEqual(resultado.sin_coordenadas, 1)
+        self.assertLess(resultado.km_despues, resultado.km_antes)
+        # Atendidas y sin coordenadas conservan su secuencia
+        self.assertEqual(self._orden(), ['R1', 'R4', 'R3', 'R6', 'R5', 'R2'])
+        self.assertEqual(
+            list(self.viaje.paradas.order_by('secuencia').values_list('secuencia', flat=True)),
+            [1, 2, 3, 4, 5, 6],
+        )
+
+    def test_intercambio_de_secuencias_respeta_el_unique(self):
+        # Dos pendientes invertidas: cada una toma la secuencia de la otra
+        self._parada(1, 2)
+        self._parada(2, 1)
+        self._parada(3, 3)
+        with self.settings(GMEXPRESS_RUTAS_DEPOSITO=(0, 0)):
+            resultado = optimizar_ruta(self.viaje, tiempo_max=1)
+        self.assertEqual(resultado.reordenadas, 3)
+        self.assertEqual(self._orden(), ['R2', 'R1', 'R3'])
+
+    def test_sin_mejora_no_toca_el_viaje(self):
+        paradas = [self._parada(1, 0, self.entregado), self._parada(2, 1), self._parada(3, 2)]
+        actualizado = Viaje.objects.get(pk=self.viaje.pk).fecha_actualizacion
+
+        resultado = optimizar_ruta(self.viaje, tiempo_max=1)
+
+        self.assertEqual(resultado.reordenadas, 0)
+        self.assertEqual(resultado.km_antes, resultado.km_despues)
+        self.assertEqual(self._orden(), ['R1', 'R2', 'R3'])
+        self.assertEqual(Viaje.objects.get(pk=self.viaje.pk).fecha_actualizacion, actualizado)
+        for parada in paradas:
+            fecha = Parada.objects.get(pk=parada.pk).fecha_actualizacion
+            self.assertEqual(fecha, parada.fecha_actualizacion)
+
+
+# ------------------------
+# Despacho automático
+# ------------------------
+
+class DespachoTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        cls.cancelado = EstadoPedido.objects.create(nombre='CANCELADO', orden=9)
+        EstadoEntrega.objects.create(nombre='PENDIENTE')
+        cls.fecha = timezone.localdate() + timedelta(days=3)
+
+    def _vehiculo(self, placa, capacidad):
+        conductor = Conductor.objects.create(
+            usuario=_perfil(f'chofer_{placa}', 'CONDUCTOR'), numero_licencia=placa, tipo_licencia='A2',
+            vencimiento_licencia=self.fecha,
+        )
+        return Vehiculo.objects.create(
+            placa=placa, marca='T', modelo='H', anio=2020, capacidad_cajas=capacidad,
+            estado=self.viaje.vehiculo.estado, conductor_asignado=conductor,
+        )
+
+    def _pedido(self, numero, comuna, cajas, estado=None):
+        return Pedido.objects.create(
+            numero_pedido=numero, cliente=self.cliente, direccion_entrega='x', ciudad='S', comuna=comuna,
+            tipo_servicio=self.pedido.tipo_servicio, cantidad_cajas=cajas,
+            estado=estado or self.pendiente, fecha_entrega_solicitada=self.fecha,
+        )
+
+    def _cargas(self, plan):
+        return sorted(
+            (c.vehiculo.placa, c.comuna, sorted(cajas for _, cajas in c.pedidos))
+            for c in plan.cargas_usadas
+        )
+
+    def test_agrupa_por_comuna_en_el_vehiculo_mas_chico_que_alcanza(self):
+        self._vehiculo('CHICO', 10)
+        self._vehiculo('GRANDE', 30)
+        self._vehiculo('MEDIANO', 20)
+        self._pedido('N1', 'Ñuñoa', 8)
+        self._pedido('N2', ' ñuñoa ', 7)
+        self._pedido('M1', 'Maipú', 5)
+        self._pedido('N3', 'Ñuñoa', 4, estado=self.cancelado)
+
+        plan = planificar(self.fecha)
+        self.assertEqual(self._cargas(plan), [('CHICO', 'maipú', [5]), ('MEDIANO', 'ñuñoa', [7, 8])])
+        self.assertEqual(plan.sin_asignar, [])
+
+        self.assertEqual(ejecutar_plan(plan, self.admin), 3)
+        viajes = Viaje.objects.filter(fecha_programada=self.fecha)
+        self.assertEqual(
+            sorted((v.vehiculo.placa, v.conductor_id, v.paradas.count()) for v in viajes),
+            [('CHICO', Vehiculo.objects.get(placa='CHICO').conductor_asignado_id, 1),
+             ('MEDIANO', Vehiculo.objects.get(placa='MEDIANO').conductor_asignado_id, 2)],
+        )
+        self.assertEqual(Pedido.objects.get(numero_pedido='N3').viaje, None)
+
+    def test_lo_que_no_cabe_queda_sin_asignar_sin_gastar_el_vehiculo(self):
+        self._vehiculo('CHICO', 10)
+        grande = self._pedido('N1', 'Ñuñoa', 12)
+        self._pedido('M1', 'Maipú', 5)
+
+        plan = planificar(self.fecha)
+        # El vehículo no se gasta en Ñuñoa, donde no entra nada
+        self.assertEqual(self._cargas(plan), [('CHICO', 'maipú', [5])])
+        self.assertEqual(plan.sin_asignar, [(grande.pk, 'ñuñoa', 12)])
+
+    def test_usa_el_espacio_de_los_viajes_programados(self):
+        Viaje.objects.filter(pk=self.viaje.pk).update(fecha_programada=self.fecha, cantidad_cajas_total=95)
+        self._pedido('N1', 'Ñuñoa', 4)
+        self._pedido('N2', 'Ñuñoa', 3)
+        self._vehiculo('CHICO', 10)
+
+        # Al viaje con 5 cajas libres le cabe el primero; el segundo abre otro
+        plan = planificar(self.fecha)
+        self.assertEqual(self._cargas(plan), [('AA11', 'ñuñoa', [4]), ('CHICO', 'ñuñoa', [3])])
+        self.assertEqual(plan.viajes_nuevos, 1)
+
+    def test_al_ejecutar_revisa_lo_que_cambio(self):
+        Viaje.objects.filter(pk=self.viaje.pk).update(fecha_programada=self.fecha)
+        self._pedido('N1', 'Ñuñoa', 60)
+        self._pedido('M1', 'Maipú', 5)
+        chico = self._vehiculo('CHICO', 10)
+        plan = planificar(self.fecha)
+        self.assertEqual(self._cargas(plan), [('AA11', 'ñuñoa', [60]), ('CHICO', 'maipú', [5])])
+
+        # Entre el plan y su ejecución: el viaje se llenó y el conductor
+        # del vehículo libre recibió otro viaje
+        Viaje.objects.filter(pk=self.viaje.pk).update(cantidad_cajas_total=50)
+        Viaje.objects.create(
+            nombre_ruta='R2', tipo_ruta=self.viaje.tipo_ruta, origen='A', destino='B',
+            fecha_programada=self.fecha, hora_salida='09:00', vehiculo=self.viaje.vehiculo,
+            conductor=chico.conductor_asignado, estado=self.viaje.estado, creado_por=self.admin,
+        )
+        self.assertEqual(ejecutar_plan(plan, self.admin), 0)
+        self.assertEqual(Pedido.objects.filter(viaje__isnull=True).count(), 3)
+        self.assertEqual(Viaje.objects.filter(fecha_programada=self.fecha).count(), 2)
+
+    def test_sin_estado_pendiente_no_despacha(self):
+        self.addCleanup(estados_pedido.invalidar)
+        self._vehiculo('CHICO', 10)
+        self._pedido('N1', 'Ñuñoa', 4, estado=self.cancelado)
+        self.pendiente.nombre = 'PENDIENTE'
+        self.pendiente.save()
+        with self.assertRaises(ValueError):
+            planificar(self.fecha)
+
+        self.client.force_login(self.admin.user)
+        respuesta = self.client.get(reverse('despacho-automatico'), {'fecha': self.fecha.isoformat()})
+        self.assertContains(respuesta, 'PENDIENTE_ASIGNACION')
+
+
+# ------------------------
+# Reportes diarios
+# ------------------------
+
+class ReportesTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.entregado = EstadoEntrega.objects.create(nombre='ENTREGADO')
+        cls.fallido = EstadoEntrega.objects.create(nombre='FALLIDO')
+        cls.hoy = cls.viaje.fecha_programada
+        Viaje.objects.filter(pk=cls.viaje.pk).update(estado=EstadoViaje.objects.get(nombre='COMPLETADO'))
+        Parada.objects.create(viaje=cls.viaje, pedido=cls.pedido, secuencia=1, estado_entrega=cls.entregado)
+        pedido2 = Pedido.objects.create(
+            numero_pedido='P2', cliente=cls.cliente, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1, estado=cls.pendiente,
+        )
+        Parada.objects.create(viaje=cls.viaje, pedido=pedido2, secuencia=2, estado_entrega=cls.fallido)
+
+    def setUp(self):
+        for catalogo in (estados_entrega, estados_viaje):
+            catalogo.invalidar()
+            self.addCleanup(catalogo.invalidar)
+
+    def _reporte(self, fecha):
+        return ReporteViaje.objects.values(*CAMPOS_REPORTE).get(fecha=fecha)
+
+    def test_cuenta_viajes_y_entregas_del_dia(self):
+        ayer = self.hoy - timedelta(days=1)
+        self.assertEqual(generar_reportes(ayer, self.hoy), 2)
+        self.assertEqual(self._reporte(self.hoy), {
+            'total_viajes': 1, 'viajes_completados': 1, 'viajes_en_curso': 0,
+            'total_entregas': 2, 'entregas_exitosas': 1, 'entregas_fallidas': 1,
+        })
+        # Los días sin viajes también tienen su fila
+        self.assertEqual(set(self._reporte(ayer).values()), {0})
+
+    def test_volver_a_generar_reemplaza_la_fila(self):
+        generar_reportes(self.hoy)
+        Parada.objects.filter(estado_entrega=self.fallido).update(estado_entrega=self.entregado)
+        generar_reportes(self.hoy)
+
+        self.assertEqual(ReporteViaje.objects.filter(fecha=self.hoy).count(), 1)
+        reporte = self._reporte(self.hoy)
+        self.assertEqual((reporte['entregas_exitosas'], reporte['entregas_fallidas']), (2, 0))
+
+    def test_rango_en_lotes(self):
+        desde = self.hoy - timedelta(days=6)
+        self.assertEqual(generar_rango(desde, self.hoy, procesos=1, dias_por_lote=3), 7)
+        self.assertEqual(ReporteViaje.objects.filter(fecha__range=(desde, self.hoy)).count(), 7)
+        self.assertEqual(self._reporte(self.hoy)['total_entregas'], 2)
+
+
+class ProcesosTests(SimpleTestCase):
+    def test_llamar_importa_modelos_en_un_proceso_spawn(self):
+        # rutas.py importa modelos al cargarse: sin django.setup() el hijo fallaría
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+            km = pool.submit(llamar, 'gestion_gmexpress.rutas._haversine', (0, 0), (0, 1)).result(timeout=60)
+        self.assertAlmostEqual(km, 111.195, places=3)
+
+
+class MigracionReportesTests(TransactionTestCase):
+    antes = [('gestion_gmexpress', '0005_coordenadas_pedido')]
+    despues = [('gestion_gmexpress', '0006_reporteviaje_fecha_unica')]
+
+    def _migrar(self, destino):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(destino)
+        return executor.loader.project_state(destino).apps
+
+    def test_deja_el_reporte_mas_reciente_de_cada_fecha(self):
+        self.addCleanup(self._migrar, MigrationExecutor(connection).loader.graph.leaf_nodes())
+        apps = self._migrar(self.antes)
+        Reporte = apps.get_model('gestion_gmexpress', 'ReporteViaje')
+        valores = dict.fromkeys(CAMPOS_REPORTE, 0)
+        dia, otro = date(2030, 1, 1), date(2030, 1, 2)
+        Reporte.objects.create(fecha=dia, **valores)
+        ultimo = Reporte.objects.create(fecha=dia, **{**valores, 'total_viajes': 3})
+        solo = Reporte.objects.create(fecha=otro, **valores)
+
+        apps = self._migrar(self.despues)
+        Reporte = apps.get_model('gestion_gmexpress', 'ReporteViaje')
+        self.assertEqual(
+            sorted(Reporte.objects.values_list('pk', 'fecha', 'total_viajes')),
+            sorted([(ultimo.pk, dia, 3), (solo.pk, otro, 0)]),
+        )
+
+
+# ------------------------
+# GET condicional de los listados
+# ------------------------
+
+class GetCondicionalTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        EstadoEntrega.objects.create(nombre='PENDIENTE')
+
+    def setUp(self):
+        self.client.force_login(self.admin.user)
+
+    def _etag(self, url):
+        # La primera visita deja la cookie CSRF, que forma parte del ETag
+        self.client.get(url)
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta['ETag']
+
+    def _estado(self, url, etag):
+        return self.client.get(url, headers={'if-none-match': etag}).status_code
+
+    def test_304_mientras_no_cambia_nada(self):
+        url = reverse('pedido-list')
+        etag = self._etag(url)
+        respuesta = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertIn('private', respuesta['Cache-Control'])
+        # Otra URL (otra pestaña) u otro usuario es otra versión
+        self.assertEqual(self._estado(url + '?estado=todos', etag), 200)
+        self.client.force_login(self.perfil_cliente.user)
+        self.assertEqual(self._estado(url, etag), 200)
+
+    def test_el_cambio_hecho_en_otro_worker_invalida(self):
+        url = reverse('pedido-list')
+        etag = self._etag(url)
+        # Otro proceso guarda un pedido: solo comparte la base, no la caché
+        Pedido.objects.filter(pk=self.pedido.pk).update(comuna='Otra')
+        _marcar([Pedido._meta.label_lower])
+        cache.clear()
+        self.assertEqual(self._estado(url, etag), 200)
+        self.assertEqual(self._estado(url, self._etag(url)), 304)
+
+    def test_la_asignacion_masiva_invalida_pedidos_y_viajes(self):
+        urls = [reverse('pedido-list'), reverse('viaje-list')]
+        etags = [self._etag(url) for url in urls]
+        self.assertEqual([self._estado(u, e) for u, e in zip(urls, etags)], [304, 304])
+
+        # Bulk: no pasa por las señales de Pedido ni de Viaje
+        with self.captureOnCommitCallbacks(execute=True):
+            asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk])
+        self.assertEqual([self._estado(u, e) for u, e in zip(urls, etags)], [200, 200])
+
+    def test_la_sincronizacion_invalida_los_pedidos(self):
+        asignar_pedidos_a_viaje(self.viaje, [self.pedido.pk])
+        parada = self.viaje.paradas.get()
+        url = reverse('pedido-list')
+        etag = self._etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_actualizaciones(self.conductor, self.perfil_conductor, [
+                Actualizacion(parada_id=parada.pk, observaciones='Portón verde'),
+            ])
+        self.assertEqual(self._estado(url, etag), 200)
+
+
+# ------------------------
+# Exportaciones
+# ------------------------
+
+class ExportacionPedidosTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        otro = Cliente.objects.create(nombre='Otro', email='o@o.cl', telefono='2')
+        Pedido.objects.create(
+            numero_pedido='P2', cliente=otro, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1, estado=cls.pendiente,
+        )
+
+    def _exportar(self, perfil):
+        self.client.force_login(perfil.user)
+        respuesta = self.client.get(reverse('pedido-export'))
+        if respuesta.status_code != 200:
+            return respuesta.status_code, None
+        return 200, b''.join(respuesta.streaming_content).decode('utf-8-sig')
+
+    def test_alcance_por_rol(self):
+        estado, contenido = self._exportar(self.admin)
+        self.assertEqual(estado, 200)
+        self.assertIn('P1', contenido)
+        self.assertIn('P2', contenido)
+
+        estado, contenido = self._exportar(self.perfil_cliente)
+        self.assertEqual(estado, 200)
+        self.assertIn('P1', contenido)
+        self.assertNotIn('P2', contenido)
+
+        self.assertEqual(self._exportar(self.perfil_conductor), (403, None))
+
+
+# ------------------------
+# Hojas de ruta DOCX
+# ------------------------
+
+class HojasRutaDocxTests(DatosViajeMixin, TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = override_settings(GMEXPRESS_HOJAS_RUTA_DIR=carpeta.name, GMEXPRESS_HOJAS_RUTA_ESPERA=60)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _obtener(self):
+        archivo = obtener_hoja(self.viaje)
+        self.addCleanup(archivo.close)
+        return archivo
+
+    def test_la_version_abierta_sobrevive_a_la_nueva(self):
+        vieja = self._obtener()
+        Viaje.objects.filter(pk=self.viaje.pk).update(fecha_actualizacion=timezone.now() + timedelta(hours=1))
+        nueva = self._obtener()
+        self.assertNotEqual(vieja.name, nueva.name)
+        self.assertFalse(Path(vieja.name).exists())
+        # Se sigue pudiendo leer lo que ya estaba abierto
+        self.assertTrue(zipfile.ZipFile(io.BytesIO(vieja.read())).namelist())
+
+    def test_se_repone_si_muere_un_proceso_del_pool(self):
+        fallido = _obtener_pool().submit(os._exit, 1)
+        with self.assertRaises(Exception):
+            fallido.result()
+        self.assertTrue(zipfile.ZipFile(self._obtener()).namelist())
+
+    @override_settings(GMEXPRESS_HOJAS_RUTA_ESPERA=0)
+    def test_sin_tiempo_responde_503_y_termina_en_segundo_plano(self):
+        self.client.force_login(self.admin.user)
+        url = reverse('hoja-ruta-docx', kwargs={'pk': self.viaje.pk})
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta['Retry-After'], '5')
+        for futuro in list(_en_curso.values()):
+            futuro.result(timeout=60)
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        respuesta.close()
+
+
+# ------------------------
+# Hoja de ruta JSON
+# ------------------------
+
+class HojaRutaJsonTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        pendiente = EstadoEntrega.objects.create(nombre='PENDIENTE')
+        pedido2 = Pedido.objects.create(
+            numero_pedido='P2', cliente=cls.cliente, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1, estado=cls.pendiente,
+        )
+        cls.paradas = [
+            Parada.objects.create(viaje=cls.viaje, pedido=pedido, secuencia=i, estado_entrega=pendiente)
+            for i, pedido in enumerate([cls.pedido, pedido2], start=1)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.perfil_conductor.user)
+        self.url = reverse('hoja-ruta-json', args=[self.viaje.pk])
+
+    def test_etag_responde_304_hasta_que_cambia_una_parada(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 304)
+
+        self.paradas[1].observaciones = 'Portón verde'
+        self.paradas[1].save()
+        respuesta = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_since_trae_solo_lo_que_cambio(self):
+        datos = self.client.get(self.url).json()
+        self.assertTrue(datos['completo'])
+        self.assertEqual([p['id'] for p in datos['paradas']], datos['ids'])
+
+        # Cambia el pedido de la segunda parada, no la parada
+        pedido = self.paradas[1].pedido
+        pedido.instrucciones_especiales = 'Tocar el timbre'
+        pedido.save()
+        delta = self.client.get(self.url, {'since': datos['generado_en']}).json()
+        self.assertFalse(delta['completo'])
+        self.assertEqual([p['id'] for p in delta['paradas']], [self.paradas[1].pk])
+        self.assertEqual(delta['paradas'][0]['pedido']['instrucciones'], 'Tocar el timbre')
+        self.assertEqual(delta['ids'], datos['ids'])
+
+        sin_cambios = self.client.get(self.url, {'since': delta['generado_en']}).json()
+        self.assertEqual(sin_cambios['paradas'], [])
+
+        self.assertEqual(self.client.get(self.url, {'since': 'ayer'}).status_code, 400)
+
+    def test_solo_los_viajes_del_conductor(self):
+        otro = Conductor.objects.create(
+            usuario=_perfil('otro', 'CONDUCTOR'), numero_licencia='L2', tipo_licencia='A2',
+            vencimiento_licencia=timezone.localdate(),
+        )
+        self.client.force_login(otro.usuario.user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+# ------------------------
+# Sincronización de entregas
+# ------------------------
+
+class SincronizacionEntregasTests(DatosViajeMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.entregado = EstadoPedido.objects.create(nombre='ENTREGADO', orden=3)
+        pendiente = EstadoEntrega.objects.create(nombre='PENDIENTE')
+        for nombre in ('ENTREGADO', 'FALLIDO'):
+            EstadoEntrega.objects.create(nombre=nombre)
+        cls.parada = Parada.objects.create(
+            viaje=cls.viaje, pedido=cls.pedido, secuencia=1, estado_entrega=pendiente,
+        )
+
+        # Una parada del viaje de otro conductor
+        cls.otro = Conductor.objects.create(
+            usuario=_perfil('otro', 'CONDUCTOR'), numero_licencia='L2', tipo_licencia='A2',
+            vencimiento_licencia=timezone.localdate(),
+        )
+        viaje = Viaje.objects.create(
+            nombre_ruta='R2', tipo_ruta=cls.viaje.tipo_ruta, origen='A', destino='B',
+            fecha_programada=timezone.localdate(), hora_salida='09:00', vehiculo=cls.viaje.vehiculo,
+            conductor=cls.otro, estado=cls.viaje.estado, creado_por=cls.admin,
+        )
+        pedido = Pedido.objects.create(
+            numero_pedido='P2', cliente=cls.cliente, direccion_entrega='y', ciudad='S', comuna='C',
+            tipo_servicio=cls.pedido.tipo_servicio, cantidad_cajas=1, estado=cls.pendiente,
+        )
+        cls.ajena = Parada.objects.create(viaje=viaje, pedido=pedido, secuencia=1, estado_entrega=pendiente)
+
+    def setUp(self):
+        self.client.force_login(self.perfil_conductor.user)
+
+    def _sincronizar(self, *items):
+        respuesta = self.client.post(
+            reverse('entregas-sincronizar'), {'actualizaciones': list(items)}, content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return [(r['clave'], r['resultado']) for r in respuesta.json()['resultados']]
+
+    def _item(self, clave, estado, horas_atras=0, parada=None):
+        return {
+            'clave': clave, 'parada': parada or self.parada.pk, 'estado': estado,
+            'registrado_en': (timezone.now() - timedelta(hours=horas_atras)).isoformat(),
+        }
+
+    def test_reenviar_el_lote_no_aplica_dos_veces(self):
+        lote = [self._item('k1', 'ENTREGADO'), self._item('k1', 'FALLIDO')]
+        self.assertEqual(self._sincronizar(*lote), [('k1', 'aplicado'), ('k1', 'repetido')])
+        self.assertEqual(self._sincronizar(*lote), [('k1', 'repetido'), ('k1', 'repetido')])
+
+        self.parada.refresh_from_db()
+        self.assertEqual(self.parada.estado_entrega.nombre, 'ENTREGADO')
+        self.assertEqual(Pedido.objects.get(pk=self.pedido.pk).estado, self.entregado)
+        self.assertEqual(HistorialEstadoPedido.objects.filter(estado=self.entregado).count(), 1)
+        self.assertEqual(SincronizacionEntrega.objects.get().resultado, 'aplicado')
+
+    def test_se_aplica_en_orden_del_telefono_y_lo_atrasado_es_obsoleto(self):
+        # Llegan desordenados: el ENTREGADO es posterior al FALLIDO
+        self.assertEqual(
+            self._sincronizar(self._item('k2', 'ENTREGADO', 1), self._item('k1', 'FALLIDO', 2)),
+            [('k2', 'aplicado'), ('k1', 'aplicado')],
+        )
+        self.assertEqual(self._sincronizar(self._item('k3', 'FALLIDO', 3)), [('k3', 'obsoleto')])
+
+        self.parada.refresh_from_db()
+        self.assertEqual(self.parada.estado_entrega.nombre, 'ENTREGADO')
+        self.assertEqual(SincronizacionEntrega.objects.count(), 3)
+
+    def test_una_nota_tardia_no_pisa_el_estado_ni_la_llegada(self):
+        nota = self._item('k1', None, 1)
+        nota['observaciones'] = 'Portón verde'
+        self.assertEqual(self._sincronizar(nota), [('k1', 'aplicado')])
+        self.parada.refresh_from_db()
+        self.assertIsNone(self.parada.hora_llegada_real)
+
+        # El cambio de estado es anterior a la nota, pero no a otro estado
+        fallido = self._item('k2', 'FALLIDO', 2)
+        fallido['motivo_fallo'] = 'CLIENTE_AUSENTE'
+        self.assertEqual(self._sincronizar(fallido), [('k2', 'aplicado')])
+        vieja = self._item('k3', None, 3)
+        vieja['observaciones'] = 'Sin número'
+        self.assertEqual(self._sincronizar(vieja), [('k3', 'obsoleto')])
+
+        self.parada.refresh_from_db()
+        self.assertEqual(
+            (self.parada.estado_entrega.nombre, self.parada.motivo_fallo, self.parada.observaciones),
+            ('FALLIDO', 'CLIENTE_AUSENTE', 'Portón verde'),
+        )
+        self.assertEqual(self.parada.hora_llegada_real.isoformat(), fallido['registrado_en'])
+
+    def test_la_misma_clave_en_dos_conductores(self):
+        self.assertEqual(self._sincronizar(self._item('k1', 'ENTREGADO')), [('k1', 'aplicado')])
+        self.client.force_login(self.otro.usuario.user)
+        item = self._item('k1', 'ENTREGADO', parada=self.ajena.pk)
+        self.assertEqual(self._sincronizar(item), [('k1', 'aplicado')])
+        self.assertEqual(SincronizacionEntrega.objects.filter(clave='k1').count(), 2)
+
+    def test_parada_de_otro_conductor(self):
+        item = self._item('k1', 'ENTREGADO', parada=self.ajena.pk)
+        self.assertEqual(self._sincronizar(item), [('k1', 'error')])
+        self.ajena.refresh_from_db()
+        self.assertEqual(self.ajena.estado_entrega.nombre, 'PENDIENTE')
+        # El error no consume la clave: corregida, se puede reenviar
+        self.assertFalse(SincronizacionEntrega.objects.exists())
+        item['parada'] = self.parada.pk
+        self.assertEqual(self._sincronizar(item), [('k1', 'aplicado')])
+
+        self.client.force_login(self.admin.user)
+        respuesta = self.client.post(
+            reverse('entregas-sincronizar'), {'actualizaciones': []}, content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 403)
+
+
+# ------------------------
+# Estados en vivo (SSE)
+# ------------------------
+
+class BrokerMemoriaTests(SimpleTestCase):
+    async def test_reparte_solo_a_los_canales_suscritos(self):
+        broker = BrokerMemoria()
+        async with broker.suscribir(['viaje:1']) as uno, broker.suscribir(['viaje:2']) as dos:
+            # Las señales publican desde el hilo de la request
+            hilo = threading.Thread(target=broker.publicar, args=([_evento(1, 'EN_CURSO')],))
+            hilo.start()
+            hilo.join()
+
+            evento = await asyncio.wait_for(uno.siguiente(), timeout=1)
+            self.assertEqual(evento['estado'], 'EN_CURSO')
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(dos.siguiente(), timeout=0.05)
+
+        self.assertFalse(broker.hay_suscriptores())
+
+    async def test_cliente_lento_se_desconecta(self):
+        broker = BrokerMemoria()
+        async with broker.suscribir(['viaje:1']) as suscripcion:
+            broker.publicar([_evento(1, str(i)) for i in range(200)])
+            await asyncio.sleep(0)
+            recibidos = []
+            while (evento := await suscripcion.siguiente()) is not None:
+                recibidos.append(evento)
+        self.assertTrue(suscripcion.cerrada)
+        self.assertLess(len(recibidos), 200)
+
+
+class BrokerBaseDatosTests(TestCase):
+    @override_settings(GMEXPRESS_EVENTOS_INTERVALO=0.01)
+    async def test_reparte_eventos_publicados_por_otro_proceso(self):
+        # Dos instancias: una publica (otro worker) y la otra lee la tabla
+        publicador, broker = BrokerBaseDatos(), BrokerBaseDatos()
+        await sync_to_async(publicador.publicar)([_evento(1, 'ANTERIOR')])
+
+        async with broker.suscribir(['viaje:1']) as suscripcion:
+            await asyncio.sleep(0.05)
+            await sync_to_async(publicador.publicar)([_evento(1, 'EN_CURSO'), _evento(2, 'OTRO')])
+            evento = await asyncio.wait_for(suscripcion.siguiente(), timeout=2)
+        self.assertEqual(evento['estado'], 'EN_CURSO')
+
+    async def test_last_event_id_recupera_lo_perdido(self):
+        broker = BrokerBaseDatos()
+        await sync_to_async(broker.publicar)([_evento(1, 'A'), _evento(2, 'B'), _evento(1, 'C')])
+        primero = await sync_to_async(broker._leer_desde)(['viaje:1'], 0)
+
+        async with broker.suscribir(['viaje:1'], desde=primero[0]['id']) as suscripcion:
+            evento = await asyncio.wait_for(suscripcion.siguiente(), timeout=1)
+        self.assertEqual(evento['estado'], 'C')
+
+
+@override_settings(GMEXPRESS_EVENTOS_BROKER='gestion_gmexpress.eventos.BrokerMemoria')
+class EventosEstadoViewTests(DatosViajeMixin, TestCase):
+    def test_canales_permitidos_por_rol(self):
+        pedidos = [f'viaje:{self.viaje.pk}', f'pedido:{self.pedido.pk}', f'cliente:{self.cliente.pk}']
+        self.assertEqual(canales_permitidos(self.admin.user, pedidos + ['otro:1']), pedidos)
+        self.assertEqual(
+            canales_permitidos(self.perfil_cliente.user, pedidos),
+            [f'pedido:{self.pedido.pk}', f'cliente:{self.cliente.pk}'],
+        )
+        self.assertEqual(
+            canales_permitidos(self.perfil_conductor.user, pedidos),
+            [f'viaje:{self.viaje.pk}'],
+        )
+
+    def test_sin_asgi_responde_204(self):
+        self.client.force_login(self.admin.user)
+        respuesta = self.client.get('/eventos/', {'canal': f'viaje:{self.viaje.pk}'})
+        self.assertEqual(respuesta.status_code, 204)
+
+    async def test_canal_ajeno_prohibido(self):
+        await self.async_client.aforce_login(self.perfil_cliente.user)
+        respuesta = await self.async_client.get('/eventos/', {'canal': f'viaje:{self.viaje.pk}'})
+        self.assertEqual(respuesta.status_code, 403)
+
+    @override_settings(GMEXPRESS_EVENTOS_LATIDO=0.05, GMEXPRESS_EVENTOS_DURACION_MAX=1)
+    async def test_cambio_de_estado_llega_al_navegador(self):
+        await self.async_client.aforce_login(self.admin.user)
+        respuesta = await self.async_client.get('/eventos/', {'canal': f'viaje:{self.viaje.pk}'})
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+
+        flujo = respuesta.streaming_content
+        self.assertTrue((await anext(flujo)).startswith(b'retry:'))
+        # El primer latido confirma que ya está suscrito
+        self.assertEqual(await anext(flujo), b': latido\n\n')
+
+        def cambiar_estado():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.viaje.estado = EstadoViaje.objects.get(nombre='EN_CURSO')
+                self.viaje.save()
+        await sync_to_async(cambiar_estado)()
+
+        mensaje = b': latido\n\n'
+        while mensaje == b': latido\n\n':
+            mensaje = await asyncio.wait_for(anext(flujo), timeout=1)
+        mensaje = mensaje.decode()
+        self.assertIn('event: viaje', mensaje)
+        self.assertIn('"estado": "EN_CURSO"', mensaje)
+
+        # Tras DURACION_MAX el servidor cierra (solo con latidos mientras tanto)
+        resto = [parte async for parte in flujo]
+        self.assertTrue(resto)
+        self.assertTrue(all(parte == b': latido\n\n' for parte in resto))
+
+
+# ------------------------
+# Notificaciones (bandeja de salida)
+# ------------------------
+
+@override_settings(GMEXPRESS_NOTIFICACIONES_CANALES=['SISTEMA', 'EMAIL'])
+class NotificacionesTests(DatosViajeMixin, TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.archivo = Path(carpeta.name) / 'envios.jsonl'
+
+    def test_cambio_de_estado_encola_y_el_worker_envia(self):
+        self.client.force_login(self.admin.user)
+        asignado = EstadoPedido.objects.create(nombre='ASIGNADO', orden=1)
+        self.client.post(f'/pedidos/{self.pedido.pk}/estado/', {'nuevo_estado': asignado.pk})
+
+        envio = EnvioNotificacion.objects.get()
+        self.assertEqual((envio.canal, envio.destino), ('EMAIL', 'a@a.cl'))
+        self.assertEqual(Notificacion.objects.get().tipo, Notificacion.Tipo.SISTEMA)
+
+        with override_settings(
+            GMEXPRESS_NOTIFICACIONES_BACKENDS={'EMAIL': 'gestion_gmexpress.notificaciones.BackendArchivo'},
+            GMEXPRESS_NOTIFICACIONES_ARCHIVO=self.archivo,
+        ):
+            self.assertEqual(despachar_lote(), 1)
+            self.assertEqual(despachar_lote(), 0)
+
+        enviado = json.loads(self.archivo.read_text(encoding='utf-8'))
+        self.assertEqual(enviado['titulo'], 'Pedido P1: ASIGNADO')
+        envio.refresh_from_db()
+        self.assertEqual(envio.estado, EnvioNotificacion.Estado.ENVIADO)
+        # El correo enviado no se repite en la bandeja ni suma otra no leída
+        self.assertEqual(Notificacion.objects.get().tipo, Notificacion.Tipo.SISTEMA)
+        self.perfil_cliente.refresh_from_db()
+        self.assertEqual(self.perfil_cliente.notificaciones_no_leidas, 1)
+
+    @override_settings(
+        GMEXPRESS_NOTIFICACIONES_BACKENDS={},
+        GMEXPRESS_NOTIFICACIONES_REINTENTOS=2,
+        GMEXPRESS_NOTIFICACIONES_ESPERA_BASE=60,
+    )
+    def test_reintenta_con_espera_y_luego_falla(self):
+        encolar([aviso_estado_pedido(self.pedido)])
+        despachar_lote()
+        envio = EnvioNotificacion.objects.get()
+        self.assertEqual((envio.estado, envio.intentos), (EnvioNotificacion.Estado.PENDIENTE, 1))
+        self.assertGreater(envio.proximo_intento, timezone.now())
+        self.assertEqual(despachar_lote(), 0)   # aún no vence
+
+        EnvioNotificacion.objects.update(proximo_intento=timezone.now())
+        despachar_lote()
+        envio.refresh_from_db()
+        self.assertEqual(envio.estado, EnvioNotificacion.Estado.FALLIDO)
+        self.assertIn('backend', envio.ultimo_error)
+
+    def test_la_transaccion_revertida_no_deja_avisos(self):
+        try:
+            with transaction.atomic():
+                encolar([aviso_estado_pedido(self.pedido)])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(EnvioNotificacion.objects.exists())
+
+
+# ------------------------
+# Bandeja de entrada
+# ------------------------
+
+class BandejaTests(DatosViajeMixin, TestCase):
+    def _no_leidas(self):
+        return PerfilUsuario.objects.get(pk=self.perfil_cliente.pk).notificaciones_no_leidas
+
+    def test_contador_sigue_altas_lecturas_y_bajas(self):
+        encolar([aviso_estado_pedido(self.pedido)] * 3)
+        Notificacion.objects.create(usuario=self.perfil_cliente, tipo='SISTEMA', titulo='t', mensaje='m')
+        self.assertEqual(self._no_leidas(), 4)
+
+        Notificacion.objects.filter(usuario=self.perfil_cliente).first().delete()
+        self.assertEqual(self._no_leidas(), 3)
+
+        # Savepoint + UPDATE de notificaciones + UPDATE del contador
+        with self.assertNumQueries(4):
+            self.assertEqual(marcar_todas_leidas(self.perfil_cliente), 3)
+        self.assertEqual(self._no_leidas(), 0)
+        self.assertEqual(marcar_todas_leidas(self.perfil_cliente), 0)
+        self.assertEqual(self._no_leidas(), 0)
+
+    def test_icono_sin_consultas_extra(self):
+        self.client.force_login(self.perfil_cliente.user)
+        self.client.get('/mis-pedidos/')
+        with CaptureQueriesContext(connection) as sin_avisos:
+            self.client.get('/mis-pedidos/')
+
+        encolar([aviso_estado_pedido(self.pedido)])
+        with CaptureQueriesContext(connection) as con_avisos:
+            respuesta = self.client.get('/mis-pedidos/')
+        self.assertContains(respuesta, 'bg-danger">1<')
+        self.assertEqual(len(con_avisos), len(sin_avisos))
+
+
+# ------------------------
+# Presupuestos de rendimiento por vista
+# ------------------------
+
+# Máximo de consultas y de milisegundos por vista (GET con ``parametros``, o
+# POST con ``datos``), medidos con la caché ya caliente y para el rol que más
+# gasta; las respuestas en streaming se consumen completas. Si una vista
+# nueva no está aquí, test_todas_las_rutas_tienen_presupuesto falla.
+Presupuesto = namedtuple(
+    'Presupuesto', ['consultas', 'ms', 'kwargs', 'datos', 'parametros'], defaults=[250, None, None, None],
+)
+
+_VIAJE = lambda d: {'pk': d.viajes[0].pk}
+_PEDIDO = lambda d: {'pk': d.pedidos[0].pk}
+_RANGO = lambda d: {
+    'desde': d.viajes[0].fecha_programada, 'hasta': d.viajes[-1].fecha_programada, 'formato': 'csv',
+}
+
+PRESUPUESTOS = {
+    'home': Presupuesto(6),
+
+    'vehiculo-list': Presupuesto(8),
+    'vehiculo-create': Presupuesto(6),
+    'vehiculo-update': Presupuesto(7, kwargs=lambda d: {'pk': d.vehiculos[0].pk}),
+    'conductor-list': Presupuesto(8),
+    'conductor-create': Presupuesto(6),
+    'conductor-update': Presupuesto(7, kwargs=lambda d: {'pk': d.conductores[0].pk}),
+
+    'viaje-list': Presupuesto(8),
+    'viaje-create': Presupuesto(8),
+    'viaje-detail': Presupuesto(9, kwargs=_VIAJE),
+    'viaje-update': Presupuesto(9, kwargs=_VIAJE),
+    'viaje-estado': Presupuesto(5, kwargs=_VIAJE, datos=lambda d: {'nuevo_estado': d.en_curso.pk}),
+    'parada-create': Presupuesto(5, kwargs=lambda d: {'viaje_id': d.viajes[0].pk}),
+    'viaje-asignacion-masiva': Presupuesto(7, kwargs=_VIAJE),
+    'viaje-optimizar-ruta': Presupuesto(5, kwargs=_VIAJE),
+    'despacho-automatico': Presupuesto(5),
+    'viaje-export': Presupuesto(5, parametros=_RANGO),
+    'hojas-ruta-zip': Presupuesto(6),
+    'hoja-ruta-docx': Presupuesto(7, kwargs=_VIAJE),
+    'parada-export': Presupuesto(5, parametros=_RANGO),
+
+    'tiposervicio-list': Presupuesto(6),
+
+    'pedido-list': Presupuesto(8),
+    'pedido-export': Presupuesto(6),
+    'pedido-create': Presupuesto(6),
+    'pedido-import': Presupuesto(5),
+    'pedido-detail': Presupuesto(12, kwargs=_PEDIDO),
+    'pedido-estado': Presupuesto(9, kwargs=_PEDIDO),
+    'pedido-asignacion': Presupuesto(10, kwargs=_PEDIDO),
+    'pedido-delete': Presupuesto(8, kwargs=_PEDIDO),
+    'mis-pedidos': Presupuesto(8),
+
+    'mis-viajes': Presupuesto(6),
+    'hoja-ruta': Presupuesto(9, kwargs=_VIAJE),
+    'hoja-ruta-json': Presupuesto(7, kwargs=_VIAJE),
+    'entrega-update': Presupuesto(
+        16, kwargs=lambda d: {'pk': d.paradas[0].pk},
+        datos=lambda d: {'estado_entrega': d.entregado.pk},
+    ),
+    'entregas-sincronizar': Presupuesto(16, datos=lambda d: json.dumps({'actualizaciones': [
+        {'clave': f'k{p.pk}', 'parada': p.pk, 'estado': 'ENTREGADO'} for p in d.paradas[:5]
+    ]})),
+
+    'notificacion-list': Presupuesto(6),
+    'notificacion-leer': Presupuesto(7, kwargs=lambda d: {'pk': d.notificaciones[0].pk}, datos=lambda d: {}),
+    'notificacion-leer-todas': Presupuesto(7, datos=lambda d: {}),
+
+    'eventos-estado': Presupuesto(0),
+
+    'metricas': Presupuesto(2),
+    'metricas-panel': Presupuesto(2),
+}
+
+# Para máquinas lentas (CI compartido): multiplica todos los tiempos
+FACTOR_TIEMPO = float(os.environ.get('GMEXPRESS_FACTOR_TIEMPO', 1))
+ROLES = ['admin', 'logistica', 'cliente', 'conductor']
+
+
+def _detalle_consultas(consultas, limite=10):
+    repetidas = Counter(huella(q['sql']) for q in consultas)
+    lineas = [f"  {n}x {sql}" for sql, n in repetidas.most_common(limite)]
+    lentas = sorted(consultas, key=lambda q: float(q['time']), reverse=True)[:3]
+    lineas.append("Más lentas:")
+    lineas += [f"  {float(q['time']) * 1000:.1f} ms {q['sql'][:300]}" for q in lentas]
+    return "\n".join(lineas)
+
+
+class DatosRendimientoMixin:
+    """
+    Un día de operación en pequeño: un usuario por rol, varios clientes,
+    viajes con paradas, pedidos en distintos estados y notificaciones. Lo
+    justo para que un N+1 se note en el conteo de consultas.
+    """
+    VIAJES = 4
+    PARADAS_POR_VIAJE = 8
+    PEDIDOS_SIN_VIAJE = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        hoy = timezone.localdate()
+        estados_pedido = {
+            nombre: EstadoPedido.objects.create(nombre=nombre, orden=i)
+            for i, nombre in enumerate(['PENDIENTE_ASIGNACION', 'ASIGNADO', 'EN_CAMINO', 'ENTREGADO', 'FALLIDO'])
+        }
+        for i, nombre in enumerate(['PROGRAMADO', 'EN_CURSO', 'COMPLETADO']):
+            EstadoViaje.objects.create(nombre=nombre, orden=i)
+        cls.en_curso = EstadoViaje.objects.get(nombre='EN_CURSO')
+        pendiente_entrega = EstadoEntrega.objects.create(nombre='PENDIENTE')
+        cls.entregado = EstadoEntrega.objects.create(nombre='ENTREGADO')
+        EstadoEntrega.objects.create(nombre='FALLIDO')
+        disponible = EstadoVehiculo.objects.create(nombre='DISPONIBLE')
+        urbana = TipoRuta.objects.create(nombre='URBANA')
+        servicio = TipoServicio.objects.create(nombre='Almuerzo', precio_por_racion=5000)
+
+        cls.perfiles = {
+            'admin': _perfil('admin', 'ADMIN'),
+            'logistica': _perfil('logistica', 'LOGISTICA'),
+            'cliente': _perfil('cliente', 'CLIENTE'),
+            'conductor': _perfil('conductor', 'CONDUCTOR'),
+        }
+        cls.conductores = [
+            Conductor.objects.create(
+                usuario=perfil, numero_licencia=f'L{i}', tipo_licencia='A2',
+                vencimiento_licencia=hoy + timedelta(days=30 * i),
+            )
+            for i, perfil in enumerate([cls.perfiles['conductor']] + [_perfil(f'conductor{i}', 'CONDUCTOR') for i in range(3)])
+        ]
+        cls.vehiculos = [
+            Vehiculo.objects.create(
+                placa=f'AA{i:02}', marca='T', modelo='H', anio=2020, capacidad_cajas=500,
+                estado=disponible, conductor_asignado=conductor,
+            )
+            for i, conductor in enumerate(cls.conductores)
+        ]
+        clientes = [
+            Cliente.objects.create(perfil=cls.perfiles['cliente'], nombre='ACME', email='a@a.cl', telefono='1')
+        ] + [
+            Cliente.objects.create(nombre=f'Cliente {i}', email=f'c{i}@a.cl', telefono=str(i)) for i in range(3)
+        ]
+
+        cls.viajes = [
+            Viaje.objects.create(
+                nombre_ruta=f'R{i}', tipo_ruta=urbana, origen='A', destino='B',
+                fecha_programada=hoy + timedelta(days=i), hora_salida='08:00',
+                vehiculo=cls.vehiculos[i % len(cls.vehiculos)],
+                # Todos del mismo conductor: su hoja de ruta tiene datos
+                conductor=cls.conductores[0],
+                estado=EstadoViaje.objects.get(nombre='PROGRAMADO'), creado_por=cls.perfiles['admin'],
+            )
+            for i in range(cls.VIAJES)
+        ]
+
+        total = cls.VIAJES * cls.PARADAS_POR_VIAJE + cls.PEDIDOS_SIN_VIAJE
+        nombres = list(estados_pedido)
+        cls.pedidos = [
+            Pedido.objects.create(
+                numero_pedido=f'P{i:04}', cliente=clientes[i % len(clientes)],
+                direccion_entrega=f'Calle {i}', ciudad='Santiago', comuna=f'Comuna {i % 5}',
+                tipo_servicio=servicio, cantidad_cajas=i % 7 + 1,
+                estado=estados_pedido[nombres[i % len(nombres)]], fecha_entrega_solicitada=hoy,
+            )
+            for i in range(total)
+        ]
+        cls.paradas = []
+        for i, pedido in enumerate(cls.pedidos[:cls.VIAJES * cls.PARADAS_POR_VIAJE]):
+            viaje = cls.viajes[i // cls.PARADAS_POR_VIAJE]
+            pedido.viaje = viaje
+            pedido.save()
+            cls.paradas.append(Parada.objects.create(
+                viaje=viaje, pedido=pedido, secuencia=i % cls.PARADAS_POR_VIAJE + 1,
+                estado_entrega=pendiente_entrega,
+            ))
+
+        cls.notificaciones = [
+            Notificacion.objects.create(
+                usuario=cls.perfiles['cliente'], pedido=pedido, tipo=Notificacion.Tipo.SISTEMA,
+                titulo=f'Pedido {pedido.numero_pedido}', mensaje='Cambió de estado.',
+            )
+            for pedido in cls.pedidos[:12]
+        ]
+
+
+# La verificación periódica de los catálogos es una consulta más que puede
+# caer en cualquier vista: se fija para que el conteo no dependa del reloj
+@override_settings(GMEXPRESS_CATALOGOS_VERIFICACION=3600)
+class PresupuestoVistasTests(DatosRendimientoMixin, TestCase):
+    """
+    Recorre todas las rutas de urls.py con cada rol y compara consultas y
+    tiempo con PRESUPUESTOS. Al pasarse, el mensaje lista el SQL agrupado
+    por forma (un N+1 aparece como "40x SELECT ...").
+    """
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        nombres = {p.name for p in urlpatterns if p.name}
+        self.assertFalse(nombres - PRESUPUESTOS.keys(), "Rutas sin presupuesto en PRESUPUESTOS")
+        self.assertFalse(PRESUPUESTOS.keys() - nombres, "Presupuestos de rutas que ya no existen")
+
+    def _pedir(self, nombre, presupuesto):
+        url = reverse(nombre, kwargs=presupuesto.kwargs(self) if presupuesto.kwargs else None)
+        if presupuesto.datos is None:
+            return self.client.get(url, presupuesto.parametros(self) if presupuesto.parametros else None)
+        datos = presupuesto.datos(self)
+        if isinstance(datos, str):
+            return self.client.post(url, datos, content_type='application/json')
+        return self.client.post(url, datos)
+
+    def _medir(self, nombre, presupuesto):
+        # Cada pedido se revierte: los POST no cambian los datos del siguiente
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                respuesta = self._pedir(nombre, presupuesto)
+                # Las exportaciones consultan por lotes mientras se envían; el
+                # SSE no termina nunca y se mide solo hasta la respuesta
+                if respuesta.streaming and respuesta.get('Content-Type') != 'text/event-stream':
+                    b''.join(respuesta.streaming_content)
+                ms = (time.perf_counter() - inicio) * 1000
+            transaction.set_rollback(True)
+        return respuesta, consultas.captured_queries, ms
+
+    def _revisar_rol(self, rol):
+        self.client.force_login(self.perfiles[rol].user)
+        for nombre, presupuesto in PRESUPUESTOS.items():
+            with self.subTest(vista=nombre, rol=rol):
+                self._medir(nombre, presupuesto)   # calienta cachés (catálogos, roles)
+                respuesta, consultas, ms = self._medir(nombre, presupuesto)
+                self.assertLess(respuesta.status_code, 500)
+                self.assertLessEqual(
+                    len(consultas), presupuesto.consultas,
+                    f"{nombre} como {rol}: {len(consultas)} consultas "
+                    f"(máximo {presupuesto.consultas})\n{_detalle_consultas(consultas)}",
+                )
+                limite = presupuesto.ms * FACTOR_TIEMPO
+                self.assertLessEqual(
+                    ms, limite,
+                    f"{nombre} como {rol}: {ms:.0f} ms (máximo {limite:.0f})\n{_detalle_consultas(consultas)}",
+                )
+
+    def test_admin(self):
+        self._revisar_rol('admin')
+
+    def test_logistica(self):
+        self._revisar_rol('logistica')
+
+    def test_cliente(self):
+        self._revisar_rol('cliente')
+
+    def test_conductor(self):
+        self._revisar_rol('conductor')
+
+
+@override_settings(GMEXPRESS_CATALOGOS_VERIFICACION=3600)
+class ProyeccionListadosTests(DatosRendimientoMixin, TestCase):
+    """
+    Los listados cargan solo algunas columnas (``.only()``). Si la plantilla
+    usa un campo diferido, cada fila hace su propia consulta: con más filas
+    sube el conteo. Aquí el conteo debe ser el mismo con el doble de filas.
+    """
+    LISTADOS = {
+        'vehiculo-list': 'vehiculos',
+        'conductor-list': 'conductores',
+        'viaje-list': 'viajes',
+    }
+
+    def _mas_filas(self):
+        hoy = timezone.localdate()
+        for i in range(4):
+            conductor = Conductor.objects.create(
+                usuario=_perfil(f'extra{i}', 'CONDUCTOR'), numero_licencia=f'X{i}', tipo_licencia='A4',
+                vencimiento_licencia=hoy + timedelta(days=i), experiencia_meses=12,
+            )
+            vehiculo = Vehiculo.objects.create(
+                placa=f'XX{i:02}', marca='M', modelo='N', anio=2021, capacidad_cajas=100,
+                estado=self.vehiculos[0].estado, conductor_asignado=conductor,
+                fecha_ultimo_mantenimiento=hoy,
+            )
+            Viaje.objects.create(
+                nombre_ruta=f'X{i}', tipo_ruta=self.viajes[0].tipo_ruta, origen='A', destino='B',
+                fecha_programada=hoy, hora_salida='10:00', hora_llegada_estimada='12:00',
+                vehiculo=vehiculo, conductor=conductor, estado=self.en_curso,
+                creado_por=self.perfiles['admin'], observaciones='Carga frágil',
+            )
+
+    def _contar(self, nombre, contexto):
+        # La primera vez calienta cachés (roles, catálogos)
+        self.client.get(reverse(nombre))
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse(nombre))
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), len(respuesta.context[contexto]), consultas.captured_queries
+
+    def test_consultas_no_dependen_de_las_filas(self):
+        self.client.force_login(self.perfiles['admin'].user)
+        antes = {nombre: self._contar(nombre, contexto) for nombre, contexto in self.LISTADOS.items()}
+        self._mas_filas()
+        for nombre, contexto in self.LISTADOS.items():
+            with self.subTest(vista=nombre):
+                consultas, filas, capturadas = self._contar(nombre, contexto)
+                self.assertGreater(filas, antes[nombre][1])
+                self.assertEqual(
+                    consultas, antes[nombre][0],
+                    f"{nombre}: {antes[nombre][0]} consultas con {antes[nombre][1]} filas y "
+                    f"{consultas} con {filas}\n{_detalle_consultas(capturadas)}",
+                )
+
+
+# ------------------------
+# Datos sintéticos
+# ------------------------
+
+class DatosSinteticosTests(TestCase):
+    def test_genera_historia_consistente(self):
+        call_command(
+            'generar_datos_prueba', clientes=5, conductores=2, vehiculos=2, dias=4,
+            pedidos_por_dia=40, paradas_por_viaje=6, procesos=1, stdout=io.StringIO(),
+        )
+        hoy = timezone.localdate()
+        pedidos = Pedido.objects.count()
+        self.assertGreater(pedidos, 0)
+        self.assertEqual(ContadorDashboard.objects.get(clave='total_pedidos').valor, pedidos)
+        # Un cambio de estado al crearse y al menos otro al asignarse
+        self.assertGreaterEqual(HistorialEstadoPedido.objects.count(), pedidos + Parada.objects.count())
+        # cantidad_cajas_total quedó igual a la suma de las paradas
+        self.assertEqual(reparar_cajas()[1], 0)
+
+        pasados = Pedido.objects.filter(fecha_entrega_solicitada__lt=hoy)
+        self.assertFalse(pasados.exclude(estado__nombre__in=['ENTREGADO', 'FALLIDO']).exists())
+        self.assertFalse(pasados.filter(fecha_creacion__date__gte=hoy).exists())
+        self.assertEqual(ReporteViaje.objects.count(), 3)
+        self.assertTrue(self.client.login(username='sint_conductor_00001', password='password123'))
+
+
+# ------------------------
+# Métricas
+# ------------------------
+
+class MetricasTests(DatosViajeMixin, TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = override_settings(
+            GMEXPRESS_METRICAS_DIRECTORIO=carpeta.name,
+            GMEXPRESS_METRICAS_MUESTREO=1.0, GMEXPRESS_METRICAS_MUESTREO_SQL=1.0,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.carpeta = Path(carpeta.name)
+        # Sin lo que otras pruebas dejaron en el registro de este proceso
+        series, registro.series = registro.series, {}
+        self.addCleanup(setattr, registro, 'series', series)
+
+    def test_exposicion_por_vista(self):
+        self.client.force_login(self.admin.user)
+        self.client.get(reverse('viaje-detail', kwargs={'pk': self.viaje.pk}))
+        self.client.logout()
+        with override_settings(GMEXPRESS_METRICAS_TOKEN='s3creto'):
+            texto = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer s3creto').content.decode()
+        self.assertRegex(
+            texto, r'gmexpress_solicitudes_total\{vista="viaje-detail",metodo="GET",codigo="2xx"\} \d+',
+        )
+        self.assertRegex(
+            texto, r'gmexpress_solicitud_consultas_sql_count\{vista="viaje-detail",metodo="GET"\} \d+',
+        )
+        self.assertIn('le="+Inf"', texto)
+
+    def test_suma_los_archivos_de_otros_workers(self):
+        otro = Registro()
+        otro.pid = -1   # simula otro proceso sin forkear
+        otro.observar('gmexpress_solicitud_duracion_segundos', ('pedido-list', 'GET'), 0.02)
+        otro.observar('gmexpress_solicitud_duracion_segundos', ('pedido-list', 'GET'), 0.03)
+        (self.carpeta / '-1.json').write_text(json.dumps(otro.series))
+        texto = exposicion()
+        self.assertIn(
+            'gmexpress_solicitud_duracion_segundos_count{vista="pedido-list",metodo="GET"} 2', texto,
+        )
+        self.assertIn(
+            'gmexpress_solicitud_duracion_segundos_bucket{vista="pedido-list",metodo="GET",le="0.025"} 1', texto,
+        )
+        serie = otro.series['gmexpress_solicitud_duracion_segundos|pedido-list|GET']
+        self.assertAlmostEqual(cuantil('gmexpress_solicitud_duracion_segundos', serie, 0.5), 0.025)
+
+    def test_acceso(self):
+        self.client.force_login(self.perfil_cliente.user)
+        # Detrás de nginx todo llega desde 127.0.0.1: eso solo no da acceso
+        self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with override_settings(GMEXPRESS_METRICAS_TOKEN='s3creto'):
+            self.assertEqual(
+                self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer otro').status_code, 403,
+            )
+        with override_settings(GMEXPRESS_METRICAS_IPS=['10.0.0.9']):
+            self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.9').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metricas-panel')).status_code, 302)
+
+        self.admin.user.is_staff = True
+        self.admin.user.save()
+        self.client.force_login(self.admin.user)
+        self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR='10.0.0.9').status_code, 200)
+        respuesta = self.client.get(reverse('metricas-panel'))
+        self.assertContains(respuesta, 'metricas')
+
+
+# ------------------------
+# Consultas lentas
+# ------------------------
+
+class ConsultasLentasTests(DatosViajeMixin, TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.archivo = Path(carpeta.name) / 'lentas.jsonl'
+        # Umbral 0: todas las consultas cuentan como lentas
+        ajustes = override_settings(
+            GMEXPRESS_CONSULTAS_LENTAS_MS=0, GMEXPRESS_CONSULTAS_LENTAS_ARCHIVO=self.archivo,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_huella_agrupa_valores_e_in(self):
+        self.assertEqual(
+            huella('SELECT "a"."id", "a"."b" FROM "a" WHERE "a"."id" IN (%s, %s, %s) AND "a"."c" = %s'),
+            'SELECT ... FROM "a" WHERE "a"."id" IN (...) AND "a"."c" = ?',
+        )
+        self.assertEqual(huella("SELECT x FROM t WHERE n = 'ab''c' LIMIT 21"), 'SELECT ... FROM t WHERE n = ? LIMIT ?')
+
+    def test_registra_origen_ubicacion_y_plan(self):
+        self.client.force_login(self.admin.user)
+        self.client.get(reverse('viaje-detail', kwargs={'pk': self.viaje.pk}))
+        entradas = [e for e in leer_consultas_lentas(self.archivo) if e['origen'] == 'viaje-detail']
+        self.assertTrue(entradas)
+        self.assertTrue(any(e['plan'] and 'detail' in e['plan'][0] for e in entradas))
+        self.assertTrue(any(u.startswith('gestion_gmexpress/') for e in entradas for u in e['ubicacion']))
+        self.assertTrue(all(e['huella'] == huella(e['sql']) for e in entradas))
+
+        salida = io.StringIO()
+        call_command('reporte_consultas_lentas', archivo=str(self.archivo), origen='viaje-detail', stdout=salida)
+        self.assertIn('Origen: viaje-detail', salida.getvalue())
+        self.assertIn('Plan (sqlite', salida.getvalue())
@@ -22,6 +22,13 @@ urlpatterns = [
     path('viajes/<int:pk>/editar/', views.ViajeUpdateView.as_view(), name='viaje-update'),
     path('viajes/<int:pk>/estado/', views.cambiar_estado_viaje, name='viaje-estado'),
     path('viajes/<int:viaje_id>/paradas/nueva/', views.crear_parada, name='parada-create'),
+    path('viajes/<int:pk>/asignar-pedidos/', views.asignar_pedidos_viaje, name='viaje-asignacion-masiva'),
+    path('viajes/<int:pk>/optimizar-ruta/', views.optimizar_ruta_viaje, name='viaje-optimizar-ruta'),
+    path('viajes/despacho/', views.despacho_automatico, name='despacho-automatico'),
+    path('viajes/exportar/', views.exportar_viajes, name='viaje-export'),
+    path('viajes/hojas-ruta/', views.imprimir_hojas_ruta, name='hojas-ruta-zip'),
+    path('viajes/<int:pk>/hoja-ruta.docx', views.hoja_ruta_docx, name='hoja-ruta-docx'),
+    path('viajes/paradas/exportar/', views.exportar_paradas, name='parada-export'),
 
     # Tipos de servicio
     path('servicios/', views.TipoServicioListView.as_view(), name='tiposervicio-list'),
@@ -29,7 +36,9 @@ urlpatterns = [
 
     # Pedidos (vista general – admin/logística)
     path('pedidos/', views.PedidoListView.as_view(), name='pedido-list'),
+    path('pedidos/exportar/', views.PedidoExportView.as_view(), name='pedido-export'),
     path('pedidos/nuevo/', views.PedidoCreateView.as_view(), name='pedido-create'),
+    path('pedidos/importar/', views.PedidoImportView.as_view(), name='pedido-import'),
     path('pedidos/<int:pk>/', views.PedidoDetailView.as_view(), name='pedido-detail'),
     path('pedidos/<int:pk>/estado/', views.cambiar_estado_pedido, name='pedido-estado'),
     path('pedidos/<int:pk>/asignacion/', views.asignar_logistica_pedido, name='pedido-asignacion'),
@@ -42,5 +51,25 @@ urlpatterns = [
     # ------------------------
     path('mis-viajes/', views.MisViajesListView.as_view(), name='mis-viajes'),
     path('mi-ruta/<int:pk>/', views.HojaRutaView.as_view(), name='hoja-ruta'),
+    path('mi-ruta/<int:pk>/json/', views.hoja_ruta_json, name='hoja-ruta-json'),
     path('entrega/<int:pk>/actualizar/', views.actualizar_estado_entrega, name='entrega-update'),
+    path('entregas/sincronizar/', views.sincronizar_entregas, name='entregas-sincronizar'),
+
+    # ------------------------
+    # Notificaciones
+    # ------------------------
+    path('notificaciones/', views.NotificacionListView.as_view(), name='notificacion-list'),
+    path('notificaciones/<int:pk>/leer/', views.marcar_notificacion_leida, name='notificacion-leer'),
+    path('notificaciones/leer-todas/', views.marcar_notificaciones_leidas, name='notificacion-leer-todas'),
+
+    # ------------------------
+    # Estados en vivo (SSE)
+    # ------------------------
+    path('eventos/', views.eventos_estado, name='eventos-estado'),
+
+    # ------------------------
+    # Métricas
+    # ------------------------
+    path('metricas/', views.metricas_prometheus, name='metricas'),
+    path('metricas/panel/', views.metricas_panel, name='metricas-panel'),
 ]
\ No newline at end of file
@@ -1,27 +1,68 @@
 # gestion_gmexpress/views.py
 
-from datetime import date
+import hmac
+import json
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+
 from django.utils import timezone
 
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.db.models import Max, Count
+from django.views.generic import View, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
 
 from .models import (
-    Vehiculo, Conductor, Cliente,
+    PerfilUsuario, Vehiculo, Conductor, Cliente,
     Viaje, Pedido, Parada,
-    HistorialEstadoPedido, EstadoPedido, EstadoEntrega, TipoServicio,
+    HistorialEstadoPedido, EstadoPedido, EstadoEntrega, EstadoViaje, EstadoVehiculo,
+    TipoServicio, Notificacion,
 )
+from .catalogos import estados_pedido, estados_entrega
 from .forms import (
     VehiculoForm, ConductorForm, ClienteForm,
     ViajeForm, PedidoForm, ParadaForm,
     CambiarEstadoViajeForm, CambiarEstadoPedidoForm, AsignarLogisticaPedidoForm,
+    AsignacionMasivaForm, DespachoForm, ExportacionRangoForm, FiltroFechasForm,
+    ImportacionPedidosForm,
+)
+from .asignacion import asignar_pedidos_a_viaje
+from .bandeja import marcar_leida, marcar_todas_leidas
+from .despacho import planificar, ejecutar_plan
+from .eventos import canales_permitidos, flujo_sse
+from .entregas import Actualizacion, aplicar_actualizaciones, leer_actualizacion
+from .importacion import ArchivoInvalido, importar_pedidos
+from .metricas import exposicion, resumen as resumen_metricas
+from .notificaciones import aviso_estado_pedido, encolar as encolar_avisos
+from .hojas_ruta import (
+    HojaEnPreparacion, datos_ruta_json, huellas, obtener_hoja, nombre_archivo, zip_hojas,
+)
+from .exportaciones import (
+    FORMATOS, COLUMNAS_PEDIDOS, COLUMNAS_VIAJES, COLUMNAS_PARADAS,
+    respuesta_exportacion,
 )
+from .roles import es_admin, es_cliente, es_gestion
+from .contadores import resumen_dashboard
+from .condicional import GetCondicionalMixin
+from .paginacion import CursorPaginationMixin
+from .pestanas import pestanas_estado
+from .rutas import optimizar_ruta
+from .secuencias import siguiente_numero_pedido
 
 # ------------------------
 # Home / Dashboard
@@ -32,7 +73,7 @@ def home(request):
     perfil = getattr(request.user, 'perfil', None)
 
     # Si es cliente -> mostramos la home de cliente
-    if perfil and getattr(perfil, 'es_cliente', False):
+    if es_cliente(request.user):
         return render(request, 'gestion_gmexpress/cliente_home.html')
 
     # Si es conductor -> lo mando directo a "mis viajes"
@@ -40,22 +81,8 @@ def home(request):
         return redirect('mis-viajes')
 
     # Si es admin / logística -> ve el dashboard con métricas
-    total_vehiculos = Vehiculo.objects.count()
-    total_conductores = Conductor.objects.count()
-    total_pedidos = Pedido.objects.count()
-    total_viajes = Viaje.objects.count()
-
-    viajes_hoy = Viaje.objects.filter(fecha_programada=date.today()).count()
-    pedidos_pendientes = Pedido.objects.filter(viaje__isnull=True).count()
-
-    context = {
-        'total_vehiculos': total_vehiculos,
-        'total_conductores': total_conductores,
-        'total_pedidos': total_pedidos,
-        'total_viajes': total_viajes,
-        'viajes_hoy': viajes_hoy,
-        'pedidos_pendientes': pedidos_pendientes,
-    }
+    # (precalculadas en ContadorDashboard, ver contadores.py)
+    context = resumen_dashboard()
     return render(request, 'gestion_gmexpress/home.html', context)
 
 
@@ -68,8 +95,7 @@ class ClienteRequiredMixin(LoginRequiredMixin):
     Solo permite acceso a usuarios con rol CLIENTE.
     """
     def dispatch(self, request, *args, **kwargs):
-        perfil = getattr(request.user, 'perfil', None)
-        if not perfil or not perfil.roles.filter(nombre='CLIENTE', activo=True).exists():
+        if not es_cliente(request.user):
             raise PermissionDenied("No tienes permisos para acceder a esta sección.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -80,36 +106,62 @@ class AdminRequiredMixin(LoginRequiredMixin):
     (o superuser / staff de Django).
     """
     def dispatch(self, request, *args, **kwargs):
-        user = request.user
-        perfil = getattr(user, 'perfil', None)
-
-        es_admin = (
-            user.is_staff
-            or user.is_superuser
-            or (
-                perfil and (
-                    getattr(perfil, 'es_admin', False)
-                    or perfil.roles.filter(
-                        nombre__in=['ADMIN', 'LOGISTICA'],
-                        activo=True
-                    ).exists()
-                )
-            )
-        )
-
-        if not es_admin:
+        if not es_gestion(request.user):
             raise PermissionDenied("No tienes permisos para acceder a esta sección.")
         return super().dispatch(request, *args, **kwargs)
 
 
+# ------------------------
+# Mixins de listados
+# ------------------------
+
+class FiltroFechasMixin:
+    """
+    Filtra el listado por ``campo_fecha_filtro`` con ?desde=&hasta= (ambos
+    opcionales, inclusive). El formulario queda en el contexto como
+    ``filtro_fechas``; si no es válido no se filtra.
+    """
+    campo_fecha_filtro = None
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        self.filtro_fechas = FiltroFechasForm(self.request.GET)
+        if self.filtro_fechas.is_valid():
+            desde = self.filtro_fechas.cleaned_data['desde']
+            hasta = self.filtro_fechas.cleaned_data['hasta']
+            if desde:
+                qs = qs.filter(**{f'{self.campo_fecha_filtro}__gte': desde})
+            if hasta:
+                qs = qs.filter(**{f'{self.campo_fecha_filtro}__lte': hasta})
+        return qs
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['filtro_fechas'] = self.filtro_fechas
+        return ctx
+
+
 # ------------------------
 # Vehículos
 # ------------------------
 
-class VehiculoListView(AdminRequiredMixin, ListView):
+class VehiculoListView(AdminRequiredMixin, GetCondicionalMixin, FiltroFechasMixin, ListView):
     model = Vehiculo
+    # Solo las columnas del listado, con estado y conductor en el mismo SELECT
+    queryset = Vehiculo.objects.select_related('estado', 'conductor_asignado__usuario__user').only(
+        'placa', 'marca', 'modelo', 'anio', 'capacidad_cajas', 'fecha_ultimo_mantenimiento',
+        'estado__nombre',
+        'conductor_asignado__tipo_licencia',
+        'conductor_asignado__usuario__user__username',
+        'conductor_asignado__usuario__user__first_name',
+        'conductor_asignado__usuario__user__last_name',
+    )
+    tablas_condicionales = (Vehiculo, Conductor, PerfilUsuario, User, EstadoVehiculo)
     template_name = 'gestion_gmexpress/vehiculo_list.html'
     context_object_name = 'vehiculos'
+    paginate_by = 50
+    ordering = ['placa']
+    campo_fecha_filtro = 'fecha_ultimo_mantenimiento'
 
 
 class VehiculoCreateView(AdminRequiredMixin, CreateView):
@@ -130,17 +182,34 @@ class VehiculoUpdateView(AdminRequiredMixin, UpdateView):
 # Viajes
 # ------------------------
 
-class ViajeListView(AdminRequiredMixin, ListView):
+class ViajeListView(AdminRequiredMixin, GetCondicionalMixin, FiltroFechasMixin, CursorPaginationMixin, ListView):
     model = Viaje
+    # Solo las columnas del listado (sin observaciones), con vehículo,
+    # conductor y estado en el mismo SELECT
+    queryset = Viaje.objects.select_related('vehiculo', 'conductor__usuario__user', 'estado').only(
+        'nombre_ruta', 'origen', 'destino', 'fecha_programada', 'hora_salida', 'hora_llegada_estimada',
+        'vehiculo__placa', 'vehiculo__marca', 'vehiculo__modelo',
+        'conductor__tipo_licencia',
+        'conductor__usuario__user__username',
+        'conductor__usuario__user__first_name',
+        'conductor__usuario__user__last_name',
+        'estado__nombre',
+    )
+    tablas_condicionales = (Viaje, Vehiculo, Conductor, PerfilUsuario, User, EstadoViaje)
     template_name = 'gestion_gmexpress/viaje_list.html'
     context_object_name = 'viajes'
-    ordering = ['-fecha_programada']
+    paginate_by = 50
+    # Paginación por cursor sobre (fecha_programada, id); el total es un COUNT(*) del filtro
+    cursor_campos = ('fecha_programada', 'id')
+    cursor_contar_total = True
+    campo_fecha_filtro = 'fecha_programada'
 
 
 class ViajeDetailView(AdminRequiredMixin, DetailView):
     model = Viaje
     template_name = 'gestion_gmexpress/viaje_detail.html'
     context_object_name = 'viaje'
+    queryset = Viaje.objects.select_related('vehiculo', 'conductor__usuario__user', 'estado')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -149,14 +218,7 @@ class ViajeDetailView(AdminRequiredMixin, DetailView):
         context['form_estado_viaje'] = CambiarEstadoViajeForm(instance=viaje)
         context['parada_form'] = ParadaForm()
 
-        user = self.request.user
-        perfil = getattr(user, 'perfil', None)
-        es_admin = (
-            user.is_staff
-            or user.is_superuser
-            or (perfil and getattr(perfil, 'es_admin', False))
-        )
-        context['es_admin'] = es_admin
+        context['es_admin'] = es_admin(self.request.user)
         return context
 
 
@@ -185,31 +247,123 @@ class ViajeUpdateView(AdminRequiredMixin, UpdateView):
     template_name = 'gestion_gmexpress/viaje_form.html'
     success_url = reverse_lazy('viaje-list')
 
+    def form_valid(self, form):
+        # Solo los campos del formulario: cantidad_cajas_total se mantiene con F()
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=form._meta.fields + ['fecha_actualizacion'])
+        return redirect(self.get_success_url())
+
+
+def _exportar_por_fecha(request, queryset, campo_fecha, columnas, nombre):
+    if not es_gestion(request.user):
+        raise PermissionDenied("No tienes permisos para acceder a esta sección.")
+
+    form = ExportacionRangoForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, "Indica un rango de fechas válido para exportar.")
+        return redirect('viaje-list')
+
+    queryset = queryset.filter(**{
+        f'{campo_fecha}__range': (form.cleaned_data['desde'], form.cleaned_data['hasta']),
+    })
+    return respuesta_exportacion(queryset, columnas, nombre, form.cleaned_data['formato'])
+
+
+@login_required
+def exportar_viajes(request):
+    """
+    Descarga de los viajes programados en un rango: ?desde=&hasta=&formato=
+    """
+    return _exportar_por_fecha(
+        request, Viaje.objects.all(), 'fecha_programada', COLUMNAS_VIAJES, 'viajes',
+    )
+
+
+@login_required
+def exportar_paradas(request):
+    """
+    Descarga de las paradas de los viajes programados en un rango.
+    """
+    return _exportar_por_fecha(
+        request, Parada.objects.all(), 'viaje__fecha_programada', COLUMNAS_PARADAS, 'paradas',
+    )
+
+
+def _hoja_en_preparacion():
+    # El pool termina el documento igual: el reintento lo encuentra en caché
+    respuesta = HttpResponse(
+        "La hoja de ruta se está generando. Vuelve a intentarlo en unos segundos.",
+        status=503, content_type='text/plain; charset=utf-8',
+    )
+    respuesta['Retry-After'] = '5'
+    return respuesta
+
+
+@login_required
+def hoja_ruta_docx(request, pk):
+    """
+    Descarga de la hoja de ruta en DOCX: para admin/logística o el
+    conductor del viaje.
+    """
+    viaje = get_object_or_404(Viaje, pk=pk)
+
+    perfil = getattr(request.user, 'perfil', None)
+    conductor = getattr(perfil, 'conductor', None) if perfil else None
+    es_su_viaje = conductor is not None and viaje.conductor_id == conductor.pk
+    if not (es_gestion(request.user) or es_su_viaje):
+        raise PermissionDenied("No tienes permisos para ver la hoja de ruta de este viaje.")
+
+    try:
+        archivo = obtener_hoja(viaje)
+    except HojaEnPreparacion:
+        return _hoja_en_preparacion()
+    return FileResponse(archivo, as_attachment=True, filename=nombre_archivo(viaje))
+
+
+@login_required
+def imprimir_hojas_ruta(request):
+    """
+    Admin/logística: un ZIP con las hojas de ruta de todos los viajes de
+    una fecha (?fecha=AAAA-MM-DD, por defecto mañana).
+    """
+    if not es_gestion(request.user):
+        raise PermissionDenied("No tienes permisos para acceder a esta sección.")
+
+    try:
+        fecha = date.fromisoformat(request.GET['fecha'])
+    except (KeyError, ValueError):
+        fecha = timezone.localdate() + timedelta(days=1)
+
+    viajes = list(Viaje.objects.filter(fecha_programada=fecha).order_by('id'))
+    if not viajes:
+        messages.info(request, f"No hay viajes programados para el {fecha:%d-%m-%Y}.")
+        return redirect('viaje-list')
+
+    try:
+        archivo = zip_hojas(viajes)
+    except HojaEnPreparacion:
+        return _hoja_en_preparacion()
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=f"hojas_ruta_{fecha:%Y%m%d}.zip",
+    )
+
 
 @login_required
 def cambiar_estado_viaje(request, pk):
     viaje = get_object_or_404(Viaje, pk=pk)
 
     # Reforzamos que solo admin/logística puedan cambiar estado
-    user = request.user
-    perfil = getattr(user, 'perfil', None)
-    es_admin = (
-        user.is_staff
-        or user.is_superuser
-        or (
-            perfil and (
-                getattr(perfil, 'es_admin', False)
-                or perfil.roles.filter(nombre__in=['ADMIN', 'LOGISTICA'], activo=True).exists()
-            )
-        )
-    )
-    if not es_admin:
+    if not es_gestion(request.user):
         raise PermissionDenied("No tienes permisos para cambiar el estado de los viajes.")
 
     if request.method == 'POST':
         form = CambiarEstadoViajeForm(request.POST, instance=viaje)
         if form.is_valid():
-            form.save()
+            # Solo los campos del formulario: cantidad_cajas_total se mantiene con F()
+            viaje = form.save(commit=False)
+            viaje.save(update_fields=form._meta.fields + ['fecha_actualizacion'])
             return redirect('viaje-detail', pk=viaje.pk)
 
     return redirect('viaje-detail', pk=viaje.pk)
@@ -220,19 +374,7 @@ def crear_parada(request, viaje_id):
     viaje = get_object_or_404(Viaje, pk=viaje_id)
 
     # Solo admin/logística pueden crear paradas
-    user = request.user
-    perfil = getattr(user, 'perfil', None)
-    es_admin = (
-        user.is_staff
-        or user.is_superuser
-        or (
-            perfil and (
-                getattr(perfil, 'es_admin', False)
-                or perfil.roles.filter(nombre__in=['ADMIN', 'LOGISTICA'], activo=True).exists()
-            )
-        )
-    )
-    if not es_admin:
+    if not es_gestion(request.user):
         raise PermissionDenied("No tienes permisos para gestionar las paradas de los viajes.")
 
     if request.method == 'POST':
@@ -251,34 +393,63 @@ def crear_parada(request, viaje_id):
 
             # cambiar estado a ASIGNADO si estaba pendiente
             try:
-                estado_asignado = EstadoPedido.objects.get(nombre='ASIGNADO')
-                if pedido.estado.nombre == 'PENDIENTE_ASIGNACION':
+                estado_asignado = estados_pedido.por_nombre('ASIGNADO')
+                if pedido.estado_id == estados_pedido.id_de('PENDIENTE_ASIGNACION'):
                     pedido.estado = estado_asignado
             except EstadoPedido.DoesNotExist:
                 pass
 
             pedido.save()
 
-            # recalcular cajas totales del viaje
-            viaje.cantidad_cajas_total = sum(
-                p.pedido.cantidad_cajas for p in viaje.paradas.all()
-            )
-            viaje.save()
+            # El total de cajas del viaje se actualiza con la señal de Parada
 
             return redirect('viaje-detail', pk=viaje.pk)
 
     return redirect('viaje-detail', pk=viaje.pk)
 
 
+@login_required
+def optimizar_ruta_viaje(request, pk):
+    """
+    Admin/logística: reordenar las paradas pendientes del viaje
+    según la distancia entre direcciones.
+    """
+    viaje = get_object_or_404(Viaje, pk=pk)
+
+    if not es_gestion(request.user):
+        raise PermissionDenied("No tienes permisos para gestionar las paradas de los viajes.")
+
+    if request.method == 'POST':
+        resultado = optimizar_ruta(viaje)
+        if resultado.reordenadas:
+            messages.success(
+                request,
+                f"Ruta optimizada: {resultado.km_antes:.1f} km → {resultado.km_despues:.1f} km "
+                f"({resultado.reordenadas} paradas reordenadas)."
+            )
+        else:
+            messages.info(request, "El orden actual de las paradas ya es el más corto encontrado.")
+        if resultado.sin_coordenadas:
+            messages.warning(
+                request,
+                f"{resultado.sin_coordenadas} paradas sin coordenadas conservaron su lugar en la ruta."
+            )
+
+    return redirect('viaje-detail', pk=viaje.pk)
+
+
 # ------------------------
 # Pedidos - Listas
 # ------------------------
 
-class PedidoListView(LoginRequiredMixin, ListView):
+class PedidoListView(LoginRequiredMixin, GetCondicionalMixin, CursorPaginationMixin, ListView):
     model = Pedido
+    tablas_condicionales = (Pedido, Cliente, Viaje, EstadoPedido)
     template_name = 'gestion_gmexpress/pedido_list.html'
     context_object_name = 'pedidos'
     paginate_by = 20
+    # Paginación por cursor sobre (fecha_creacion, id); el total ya sale de las pestañas
+    cursor_campos = ('fecha_creacion', 'id')
 
     def get_queryset(self):
         """
@@ -292,10 +463,13 @@ class PedidoListView(LoginRequiredMixin, ListView):
         # Base según rol
         qs = Pedido.objects.select_related('cliente', 'estado', 'viaje')
 
-        if perfil and getattr(perfil, 'es_cliente', False):
+        # Alcance de la caché de pestañas: None = global
+        self.cliente_tabs = None
+        if es_cliente(user):
             cliente = getattr(perfil, 'cliente', None)
             if cliente:
                 qs = qs.filter(cliente=cliente)
+                self.cliente_tabs = cliente.pk
             else:
                 qs = qs.none()
 
@@ -313,63 +487,49 @@ class PedidoListView(LoginRequiredMixin, ListView):
                 # Si viene algo raro en el parámetro, ignoramos el filtro
                 pass
 
-        return qs.order_by('-fecha_creacion')
+        return qs.order_by('-fecha_creacion', '-id')
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
         base = getattr(self, 'qs_base_for_tabs', Pedido.objects.none())
 
-        # Estados que realmente aparecen en la lista (según rol)
-        estados = (
-            EstadoPedido.objects
-            .filter(pedidos__in=base)
-            .distinct()
-            .order_by('orden', 'nombre')
-        )
-
-        # Conteo de pedidos por estado (sobre la base sin filtro de estado)
-        conteos = base.values('estado_id').annotate(cantidad=Count('id'))
-        map_counts = {c['estado_id']: c['cantidad'] for c in conteos}
-
-        ctx['estados_tab'] = [
-            {
-                'id': e.id,
-                'nombre': e.nombre,
-                'count': map_counts.get(e.id, 0),
-            }
-            for e in estados
-        ]
+        # Un solo GROUP BY por estado, cacheado por alcance y por versión
+        # de Pedido (ver pestanas.py)
+        if base.query.is_empty():
+            estados_tab, total = [], 0
+        else:
+            version = self.versiones_tablas[Pedido][0] if self.versiones_tablas else None
+            estados_tab, total = pestanas_estado(base, self.cliente_tabs, version)
 
+        ctx['estados_tab'] = estados_tab
         ctx['estado_selected'] = self.estado_filtro or 'todos'
-        ctx['total_pedidos'] = base.count()
+        ctx['total_pedidos'] = total
 
         return ctx
 
 
-class MisPedidosListView(ClienteRequiredMixin, ListView):
+class PedidoExportView(PedidoListView):
     """
-    Versión explícita de "mis pedidos" solo para clientes.
-    Usa la misma plantilla que PedidoListView.
+    Descarga (CSV o XLSX) de los pedidos con los mismos filtros y alcance
+    que el listado: ?estado=<id>&formato=csv|xlsx. Solo admin/logística
+    (todos los pedidos) y clientes (los suyos, ver get_queryset).
     """
-    model = Pedido
-    template_name = 'gestion_gmexpress/pedido_list.html'
-    context_object_name = 'pedidos'
-    paginate_by = 20
-    ordering = ['-fecha_creacion']
+    def get(self, request, *args, **kwargs):
+        if not (es_gestion(request.user) or es_cliente(request.user)):
+            raise PermissionDenied("No tienes permisos para exportar pedidos.")
+        formato = request.GET.get('formato', 'csv')
+        if formato not in FORMATOS:
+            formato = 'csv'
+        return respuesta_exportacion(self.get_queryset(), COLUMNAS_PEDIDOS, 'pedidos', formato)
 
-    def get_queryset(self):
-        perfil = getattr(self.request.user, 'perfil', None)
-        cliente = getattr(perfil, 'cliente', None) if perfil else None
-
-        if cliente:
-            return (
-                Pedido.objects
-                .filter(cliente=cliente)
-                .select_related('cliente', 'estado', 'viaje')
-                .order_by('-fecha_creacion')
-            )
-        return Pedido.objects.none()
+
+class MisPedidosListView(ClienteRequiredMixin, PedidoListView):
+    """
+    Versión explícita de "mis pedidos" solo para clientes.
+    Usa la misma plantilla, pestañas y paginación que PedidoListView
+    (que ya filtra por el cliente del usuario).
+    """
 
 
 # ------------------------
@@ -408,7 +568,7 @@ class PedidoDetailView(LoginRequiredMixin, DetailView):
         perfil = getattr(user, 'perfil', None)
 
         # Si es cliente: solo sus pedidos
-        if perfil and getattr(perfil, 'es_cliente', False):
+        if es_cliente(user):
             cliente = getattr(perfil, 'cliente', None)
             if cliente:
                 return qs.filter(cliente=cliente)
@@ -424,14 +584,7 @@ class PedidoDetailView(LoginRequiredMixin, DetailView):
         ctx['historial'] = pedido.historial_estados.all()
         ctx['paradas'] = pedido.paradas.all()
 
-        user = self.request.user
-        perfil = getattr(user, 'perfil', None)
-        es_admin = (
-            user.is_staff
-            or user.is_superuser
-            or (perfil and getattr(perfil, 'es_admin', False))
-        )
-        ctx['es_admin'] = es_admin
+        ctx['es_admin'] = es_admin(self.request.user)
         return ctx
 
 
@@ -442,12 +595,8 @@ class PedidoCreateView(ClienteRequiredMixin, CreateView):
     success_url = reverse_lazy('mis-pedidos')
 
     def generar_numero_pedido(self):
-        hoy = timezone.localdate()
-        base = hoy.strftime("PED-%Y%m%d-")
-        cantidad_hoy = Pedido.objects.filter(
-            fecha_creacion__date=hoy
-        ).count() + 1
-        return f"{base}{cantidad_hoy:04d}"
+        # Correlativo diario atómico (ver secuencias.py)
+        return siguiente_numero_pedido()
 
     def form_valid(self, form):
         pedido = form.save(commit=False)
@@ -464,7 +613,7 @@ class PedidoCreateView(ClienteRequiredMixin, CreateView):
         pedido.cliente = perfil.cliente
 
         # 3) Estado inicial
-        estado_inicial = EstadoPedido.objects.get(nombre='PENDIENTE_ASIGNACION')
+        estado_inicial = estados_pedido.por_nombre('PENDIENTE_ASIGNACION')
         pedido.estado = estado_inicial
         pedido.viaje = None
 
@@ -479,6 +628,40 @@ class PedidoCreateView(ClienteRequiredMixin, CreateView):
         return redirect(self.get_success_url())
 
 
+class PedidoImportView(ClienteRequiredMixin, View):
+    """
+    Carga masiva de pedidos del cliente desde CSV o XLSX (ver importacion.py).
+    Si alguna fila tiene errores no se crea nada y se muestra el detalle.
+    """
+    template_name = 'gestion_gmexpress/pedido_importar.html'
+
+    def get(self, request):
+        return render(request, self.template_name, {'form': ImportacionPedidosForm()})
+
+    def post(self, request):
+        form = ImportacionPedidosForm(request.POST, request.FILES)
+        ctx = {'form': form}
+        if form.is_valid():
+            perfil = getattr(request.user, 'perfil', None)
+            if not perfil or not hasattr(perfil, 'cliente'):
+                raise PermissionDenied(
+                    "Tu usuario no está configurado como cliente con ficha asociada."
+                )
+            archivo = form.cleaned_data['archivo']
+            try:
+                resultado = importar_pedidos(archivo, archivo.name, perfil.cliente)
+            except ArchivoInvalido as e:
+                form.add_error('archivo', str(e))
+            else:
+                if resultado.creados:
+                    messages.success(request, f"Se importaron {resultado.creados} pedidos.")
+                    return redirect('mis-pedidos')
+                if not resultado.errores:
+                    messages.warning(request, "El archivo no tiene pedidos.")
+                ctx['resultado'] = resultado
+        return render(request, self.template_name, ctx)
+
+
 class PedidoDeleteView(AdminRequiredMixin, DeleteView):
     model = Pedido
     template_name = 'gestion_gmexpress/pedido_confirm_delete.html'
@@ -504,6 +687,9 @@ class TipoServicioListView(LoginRequiredMixin, ListView):
 # Pedidos - Cambio de estado / Asignación logística
 # ------------------------
 
+# Pedidos pendientes que se muestran en la asignación masiva
+LIMITE_PENDIENTES_ASIGNACION = 500
+
 @login_required
 def cambiar_estado_pedido(request, pk):
     pedido = get_object_or_404(Pedido, pk=pk)
@@ -511,12 +697,7 @@ def cambiar_estado_pedido(request, pk):
     perfil = getattr(user, 'perfil', None)
 
     # --- SOLO ADMIN / LOGÍSTICA ---
-    es_admin = (
-        user.is_staff or
-        user.is_superuser or
-        (perfil and hasattr(perfil, 'es_admin') and perfil.es_admin)
-    )
-    if not es_admin:
+    if not es_admin(user):
         raise PermissionDenied("No tienes permisos para cambiar el estado de los pedidos.")
 
     if request.method == 'POST':
@@ -524,18 +705,24 @@ def cambiar_estado_pedido(request, pk):
         if form.is_valid():
             nuevo_estado = form.cleaned_data['nuevo_estado']
             comentario = form.cleaned_data['comentario']
+            cambia = pedido.estado_id != nuevo_estado.pk
+
+            with transaction.atomic():
+                # Registrar historial
+                HistorialEstadoPedido.objects.create(
+                    pedido=pedido,
+                    estado=nuevo_estado,
+                    comentario=comentario,
+                    cambiado_por=perfil,
+                )
 
-            # Registrar historial
-            HistorialEstadoPedido.objects.create(
-                pedido=pedido,
-                estado=nuevo_estado,
-                comentario=comentario,
-                cambiado_por=perfil,
-            )
+                # Actualizar estado actual
+                pedido.estado = nuevo_estado
+                pedido.save()
 
-            # Actualizar estado actual
-            pedido.estado = nuevo_estado
-            pedido.save()
+                # Aviso al cliente en la misma transacción (ver notificaciones.py)
+                if cambia:
+                    encolar_avisos([aviso_estado_pedido(pedido, comentario)])
 
             return redirect('pedido-list')
     else:
@@ -556,13 +743,7 @@ def asignar_logistica_pedido(request, pk):
     """
     pedido = get_object_or_404(Pedido, pk=pk)
 
-    perfil = getattr(request.user, 'perfil', None)
-    es_admin = (
-        request.user.is_staff
-        or request.user.is_superuser
-        or (perfil and perfil.roles.filter(nombre__in=['ADMIN', 'LOGISTICA'], activo=True).exists())
-    )
-    if not es_admin:
+    if not es_gestion(request.user):
         raise PermissionDenied("No tienes permisos para asignar logística a pedidos.")
 
     if request.method == 'POST':
@@ -570,33 +751,22 @@ def asignar_logistica_pedido(request, pk):
         if form.is_valid():
             viaje = form.cleaned_data['viaje']
 
-            # Asignar viaje al pedido
-            pedido.viaje = viaje
-            try:
-                estado_asignado = EstadoPedido.objects.get(nombre='ASIGNADO')
-                pedido.estado = estado_asignado
-            except EstadoPedido.DoesNotExist:
-                # Si aún no creas el estado ASIGNADO, dejamos el actual
-                pass
-            pedido.save()
-
-            # Crear parada para este pedido dentro del viaje (si no existe)
-            ultima = viaje.paradas.aggregate(Max('secuencia'))['secuencia__max'] or 0
-            estado_entrega = EstadoEntrega.objects.get(nombre='PENDIENTE')
-
-            Parada.objects.create(
-                viaje=viaje,
-                pedido=pedido,
-                secuencia=ultima + 1,
-                estado_entrega=estado_entrega,
-                atendido_por=viaje.conductor,
+            # Mismo servicio que la asignación masiva (ver asignacion.py)
+            asignados = asignar_pedidos_a_viaje(
+                viaje, [pedido.pk], perfil=getattr(request.user, 'perfil', None),
             )
 
-            messages.success(
-                request,
-                f"Pedido {pedido.numero_pedido} asignado al viaje #{viaje.id} "
-                f"({viaje.vehiculo} / {viaje.conductor})."
-            )
+            if asignados:
+                messages.success(
+                    request,
+                    f"Pedido {pedido.numero_pedido} asignado al viaje #{viaje.id} "
+                    f"({viaje.vehiculo} / {viaje.conductor})."
+                )
+            else:
+                messages.warning(
+                    request,
+                    f"El pedido {pedido.numero_pedido} ya tiene una parada en el viaje #{viaje.id}."
+                )
             return redirect('pedido-detail', pk=pedido.pk)
     else:
         form = AsignarLogisticaPedidoForm()
@@ -608,15 +778,124 @@ def asignar_logistica_pedido(request, pk):
     return render(request, 'gestion_gmexpress/pedido_asignacion_form.html', context)
 
 
+@login_required
+def asignar_pedidos_viaje(request, pk):
+    """
+    Admin/logística: asignar varios pedidos pendientes a un viaje
+    en una sola operación.
+    """
+    viaje = get_object_or_404(
+        Viaje.objects.select_related('vehiculo', 'conductor__usuario__user'), pk=pk
+    )
+
+    if not es_gestion(request.user):
+        raise PermissionDenied("No tienes permisos para asignar logística a pedidos.")
+
+    pendientes = Pedido.objects.filter(viaje__isnull=True)
+    try:
+        pendientes = pendientes.filter(estado=estados_pedido.por_nombre('PENDIENTE_ASIGNACION'))
+    except EstadoPedido.DoesNotExist:
+        pass
+
+    comuna = request.GET.get('comuna', '').strip()
+    if comuna:
+        pendientes = pendientes.filter(comuna__iexact=comuna)
+
+    if request.method == 'POST':
+        form = AsignacionMasivaForm(request.POST, pendientes=pendientes)
+        if form.is_valid():
+            # Se respeta el orden en que vienen marcados en el formulario
+            ids = request.POST.getlist('pedidos')
+            asignados = asignar_pedidos_a_viaje(
+                viaje, ids, perfil=getattr(request.user, 'perfil', None),
+            )
+            messages.success(
+                request,
+                f"{len(asignados)} pedidos asignados al viaje #{viaje.id}."
+            )
+            return redirect('viaje-detail', pk=viaje.pk)
+    else:
+        form = AsignacionMasivaForm(pendientes=pendientes)
+
+    context = {
+        'viaje': viaje,
+        'form': form,
+        'comuna': comuna,
+        'pendientes': (
+            pendientes
+            .select_related('cliente', 'tipo_servicio')
+            .order_by('fecha_entrega_solicitada', 'comuna', 'id')[:LIMITE_PENDIENTES_ASIGNACION]
+        ),
+        'limite': LIMITE_PENDIENTES_ASIGNACION,
+    }
+    return render(request, 'gestion_gmexpress/viaje_asignacion_masiva.html', context)
+
+
+@login_required
+def despacho_automatico(request):
+    """
+    Admin/logística: ver y aplicar el plan de despacho de una fecha
+    (pedidos pendientes repartidos en viajes según capacidad).
+    """
+    if not es_gestion(request.user):
+        raise PermissionDenied("No tienes permisos para asignar logística a pedidos.")
+
+    if request.method == 'POST':
+        form = DespachoForm(request.POST)
+        if form.is_valid():
+            fecha = form.cleaned_data['fecha']
+            perfil = getattr(request.user, 'perfil', None)
+            if perfil is None:
+                raise PermissionDenied("Tu usuario no tiene perfil asociado.")
+            try:
+                plan = planificar(fecha)
+                asignados = ejecutar_plan(
+                    plan, perfil, optimizar=form.cleaned_data['optimizar'],
+                )
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(
+                    request,
+                    f"{asignados} pedidos asignados en {len(plan.cargas_usadas)} viajes "
+                    f"({plan.viajes_nuevos} nuevos)."
+                )
+            return redirect(f"{reverse('despacho-automatico')}?fecha={fecha.isoformat()}")
+    else:
+        form = DespachoForm(request.GET or None)
+
+    plan = None
+    if form.is_valid():
+        try:
+            plan = planificar(form.cleaned_data['fecha'])
+        except ValueError as e:
+            messages.error(request, str(e))
+
+    context = {
+        'form': form,
+        'plan': plan,
+        'filas': plan.utilizacion() if plan else [],
+    }
+    return render(request, 'gestion_gmexpress/despacho_automatico.html', context)
+
+
 # ------------------------
 # Conductores (Choferes)
 # ------------------------
 
-class ConductorListView(AdminRequiredMixin, ListView):
+class ConductorListView(AdminRequiredMixin, GetCondicionalMixin, FiltroFechasMixin, ListView):
     model = Conductor
+    queryset = Conductor.objects.select_related('usuario__user').only(
+        'numero_licencia', 'tipo_licencia', 'vencimiento_licencia', 'experiencia_meses',
+        'usuario__user__username', 'usuario__user__first_name', 'usuario__user__last_name',
+    )
+    tablas_condicionales = (Conductor, PerfilUsuario, User)
     template_name = 'gestion_gmexpress/conductor_list.html'
     context_object_name = 'conductores'
-    ordering = ['usuario__user__first_name', 'usuario__user__last_name']
+    paginate_by = 50
+    ordering = ['usuario__user__first_name', 'usuario__user__last_name', 'id']
+    # Para revisar licencias por vencer
+    campo_fecha_filtro = 'vencimiento_licencia'
 
 
 class ConductorCreateView(AdminRequiredMixin, CreateView):
@@ -655,14 +934,12 @@ class MisViajesListView(ConductorRequiredMixin, ListView):
     ordering = ['-fecha_programada']
 
     def get_queryset(self):
-        from django.db.models import Sum
-        from django.db.models.functions import Coalesce
-        
         # El conductor solo ve sus viajes
         perfil = self.request.user.perfil
         conductor = perfil.conductor
-        return Viaje.objects.filter(conductor=conductor).annotate(
-            total_cajas_real=Coalesce(Sum('paradas__pedido__cantidad_cajas'), 0)
+        # cantidad_cajas_total se mantiene al día con las paradas (ver cajas.py)
+        return Viaje.objects.filter(conductor=conductor).select_related('estado', 'vehiculo').annotate(
+            total_cajas_real=F('cantidad_cajas_total')
         ).order_by('-fecha_programada')
 
 
@@ -683,69 +960,250 @@ class HojaRutaView(ConductorRequiredMixin, DetailView):
         # Paradas ordenadas por secuencia
         context['paradas'] = viaje.paradas.select_related('pedido', 'pedido__cliente', 'estado_entrega').order_by('secuencia')
         # Estados de entrega para el modal/formulario
-        context['estados_entrega'] = EstadoEntrega.objects.all()
+        context['estados_entrega'] = estados_entrega.todos()
         return context
 
 
+@login_required
+def hoja_ruta_json(request, pk):
+    """
+    Hoja de ruta en JSON para el teléfono del conductor, con ETag (ver
+    hojas_ruta.py). ``?since=<ISO 8601>`` devuelve solo las paradas que
+    cambiaron; el teléfono usa ``generado_en`` como próximo ``since``.
+    """
+    perfil = getattr(request.user, 'perfil', None)
+    conductor = getattr(perfil, 'conductor', None) if perfil else None
+    if conductor is None:
+        raise PermissionDenied("No tienes permisos de conductor para acceder a esta sección.")
+
+    desde = None
+    if request.GET.get('since'):
+        try:
+            desde = parse_datetime(request.GET['since'])
+        except ValueError:
+            desde = None
+        if desde is None:
+            return JsonResponse({'error': "since debe ser una fecha y hora ISO 8601."}, status=400)
+        if timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+
+    # Antes de leer: lo que cambie durante la consulta vuelve en el próximo since
+    generado_en = timezone.now()
+    huella = huellas([pk], Viaje.objects.filter(conductor=conductor)).get(pk)
+    if huella is None:
+        raise Http404("Viaje no encontrado.")
+
+    # La respuesta con since es otra representación: su ETag también
+    etag = quote_etag(f"{huella}-{desde.timestamp():.6f}" if desde else huella)
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        datos = datos_ruta_json(pk, desde)
+        datos['generado_en'] = generado_en
+        respuesta = JsonResponse(datos)
+    respuesta['ETag'] = etag
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
 @login_required
 def actualizar_estado_entrega(request, pk):
     """
     Actualiza el estado de una Parada (y opcionalmente del Pedido).
     Solo para el conductor asignado al viaje de esa parada.
     """
-    parada = get_object_or_404(Parada, pk=pk)
+    parada = get_object_or_404(Parada.objects.select_related('pedido'), pk=pk)
     viaje = parada.viaje
-    
+
     # Verificar que el usuario sea el conductor del viaje
     perfil = getattr(request.user, 'perfil', None)
-    if not perfil or not hasattr(perfil, 'conductor') or viaje.conductor != perfil.conductor:
+    if not perfil or not hasattr(perfil, 'conductor') or viaje.conductor_id != perfil.conductor.pk:
         raise PermissionDenied("No tienes permiso para actualizar esta entrega.")
 
     if request.method == 'POST':
+        nuevo_estado = None
         nuevo_estado_id = request.POST.get('estado_entrega')
-        motivo_fallo = request.POST.get('motivo_fallo')
-        observaciones = request.POST.get('observaciones')
-
         if nuevo_estado_id:
-            nuevo_estado = get_object_or_404(EstadoEntrega, pk=nuevo_estado_id)
-            parada.estado_entrega = nuevo_estado
-            
-            # Lógica de sincronización con Pedido
-            # Si la parada es ENTREGADO -> Pedido ENTREGADO
-            # Si la parada es FALLIDO -> Pedido NO_ENTREGADO (o similar)
-            pedido = parada.pedido
-            
-            if nuevo_estado.nombre == 'ENTREGADO':
-                try:
-                    estado_entregado = EstadoPedido.objects.get(nombre='ENTREGADO')
-                    pedido.estado = estado_entregado
-                    pedido.save()
-                    
-                    # Registrar historial
-                    HistorialEstadoPedido.objects.create(
-                        pedido=pedido,
-                        estado=estado_entregado,
-                        comentario=f"Entregado por conductor {viaje.conductor}",
-                        cambiado_por=perfil
-                    )
-                except EstadoPedido.DoesNotExist:
-                    pass
-            
-            elif nuevo_estado.nombre == 'FALLIDO':
-                 # Podríamos tener un estado 'NO_ENTREGADO' o 'REPROGRAMAR'
-                 pass
-
-        if motivo_fallo:
-            parada.motivo_fallo = motivo_fallo
-        
-        if observaciones:
-            parada.observaciones = observaciones
-            
-        parada.atendido_por = perfil.conductor
-        parada.fecha_entrega_real = timezone.localdate()
-        parada.hora_llegada_real = timezone.now()
-        parada.save()
-        
+            try:
+                nuevo_estado = estados_entrega.por_id(nuevo_estado_id)
+            except EstadoEntrega.DoesNotExist:
+                raise Http404("Estado de entrega no encontrado.")
+
+        # Misma lógica que la sincronización en lote (ver entregas.py):
+        # si la parada queda ENTREGADO, el pedido también.
+        aplicar_actualizaciones(perfil.conductor, perfil, [Actualizacion(
+            parada_id=parada.pk,
+            estado=nuevo_estado,
+            motivo_fallo=request.POST.get('motivo_fallo') or None,
+            observaciones=request.POST.get('observaciones') or None,
+        )])
+
         messages.success(request, f"Entrega de pedido {parada.pedido.numero_pedido} actualizada.")
 
     return redirect('hoja-ruta', pk=viaje.pk)
+
+
+@require_POST
+def sincronizar_entregas(request):
+    """
+    Sincronización en lote desde el teléfono del conductor (JSON):
+
+        {"actualizaciones": [{"clave": "...", "parada": 12, "estado": "ENTREGADO",
+          "motivo_fallo": null, "observaciones": "...", "registrado_en": "ISO 8601"}]}
+
+    Responde {"resultados": [...]} con un resultado por elemento, en el
+    mismo orden (ver entregas.py). Reenviar el lote completo es seguro.
+    """
+    # Respuesta JSON en vez de redirigir al login: el teléfono reintenta después
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Sesión expirada."}, status=401)
+    perfil = getattr(request.user, 'perfil', None)
+    conductor = getattr(perfil, 'conductor', None) if perfil else None
+    if conductor is None:
+        return JsonResponse({'error': "Solo los conductores pueden sincronizar entregas."}, status=403)
+
+    try:
+        items = json.loads(request.body)['actualizaciones']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "Se esperaba {\"actualizaciones\": [...]}."}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({'error': "actualizaciones debe ser una lista."}, status=400)
+    maximo = getattr(settings, 'GMEXPRESS_SINCRONIZACION_MAX_ITEMS', 500)
+    if len(items) > maximo:
+        return JsonResponse({'error': f"Máximo {maximo} actualizaciones por lote."}, status=400)
+
+    resultados = [None] * len(items)
+    validas, posiciones = [], []
+    for i, item in enumerate(items):
+        try:
+            validas.append(leer_actualizacion(item))
+            posiciones.append(i)
+        except ValueError as e:
+            clave = item.get('clave') if isinstance(item, dict) else None
+            parada = item.get('parada') if isinstance(item, dict) else None
+            resultados[i] = {'clave': clave, 'parada': parada, 'resultado': 'error', 'error': str(e)}
+
+    try:
+        aplicados = aplicar_actualizaciones(conductor, perfil, validas)
+    except IntegrityError:
+        # Otro envío con las mismas claves se aplicó al mismo tiempo
+        return JsonResponse({'error': "Lote en proceso, reintenta."}, status=409)
+    for i, resultado in zip(posiciones, aplicados):
+        resultados[i] = resultado
+
+    return JsonResponse({'resultados': resultados})
+
+
+# ------------------------
+# Notificaciones (bandeja de entrada)
+# ------------------------
+
+class NotificacionListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    """
+    Bandeja del usuario, paginada por cursor sobre el índice
+    (usuario, leida, fecha_envio). ?estado=no_leidas muestra solo esas.
+    """
+    model = Notificacion
+    template_name = 'gestion_gmexpress/notificacion_list.html'
+    context_object_name = 'notificaciones'
+    paginate_by = 20
+    cursor_campos = ('fecha_envio', 'id')
+
+    def get_queryset(self):
+        perfil = getattr(self.request.user, 'perfil', None)
+        if perfil is None:
+            return Notificacion.objects.none()
+        qs = Notificacion.objects.filter(usuario=perfil)
+        if self.request.GET.get('estado') == 'no_leidas':
+            qs = qs.filter(leida=False)
+        return qs
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['solo_no_leidas'] = self.request.GET.get('estado') == 'no_leidas'
+        return ctx
+
+
+@login_required
+@require_POST
+def marcar_notificacion_leida(request, pk):
+    perfil = getattr(request.user, 'perfil', None)
+    if perfil is None:
+        raise PermissionDenied("No tienes notificaciones.")
+    marcar_leida(perfil, pk)
+    return redirect('notificacion-list')
+
+
+@login_required
+@require_POST
+def marcar_notificaciones_leidas(request):
+    perfil = getattr(request.user, 'perfil', None)
+    if perfil is None:
+        raise PermissionDenied("No tienes notificaciones.")
+    marcadas = marcar_todas_leidas(perfil)
+    if marcadas:
+        messages.success(request, f"{marcadas} notificaciones marcadas como leídas.")
+    return redirect('notificacion-list')
+
+
+# ------------------------
+# Métricas (ver metricas.py)
+# ------------------------
+
+def _scraper_autorizado(request):
+    token = getattr(settings, 'GMEXPRESS_METRICAS_TOKEN', '')
+    if token:
+        autorizacion = request.headers.get('Authorization', '')
+        if hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode()):
+            return True
+    # Detrás de un proxy REMOTE_ADDR es el del proxy: por eso la lista viene vacía
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'GMEXPRESS_METRICAS_IPS', [])
+
+
+def metricas_prometheus(request):
+    """
+    Formato de exposición de Prometheus. Para staff o para el scraper, que
+    se identifica con ``Authorization: Bearer <GMEXPRESS_METRICAS_TOKEN>``
+    (o por IP, ver ``GMEXPRESS_METRICAS_IPS``).
+    """
+    if not (request.user.is_staff or _scraper_autorizado(request)):
+        raise PermissionDenied("Métricas solo para el scraper o staff.")
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def metricas_panel(request):
+    return render(request, 'gestion_gmexpress/metricas_panel.html', {
+        'filas': resumen_metricas(),
+        'muestreo': getattr(settings, 'GMEXPRESS_METRICAS_MUESTREO', 1.0),
+        'muestreo_sql': getattr(settings, 'GMEXPRESS_METRICAS_MUESTREO_SQL', 0.1),
+    })
+
+
+# ------------------------
+# Estados en vivo (SSE)
+# ------------------------
+
+async def eventos_estado(request):
+    """
+    Flujo text/event-stream con los cambios de estado de los canales
+    pedidos: ?canal=viaje:3&canal=pedido:12 (ver eventos.py).
+    """
+    # Bajo WSGI la conexión ocuparía un hilo para siempre: 204 hace que
+    # el navegador no reintente y la página sigue funcionando sin vivo.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise PermissionDenied("Debes iniciar sesión.")
+    canales = await sync_to_async(canales_permitidos)(user, request.GET.getlist('canal'))
+    if not canales:
+        raise PermissionDenied("No tienes acceso a esos canales.")
+
+    desde = request.headers.get('Last-Event-ID')
+    desde = int(desde) if desde and desde.isdigit() else None
+
+    respuesta = StreamingHttpResponse(flujo_sse(canales, desde), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta